@@ -1,10 +1,18 @@
-import openai
-from openai import AsyncOpenAI
-from config.config import DEEPSEEK_API_KEY, MESSAGES
+from config.config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, MESSAGES
 from logs.log import logs
 from logs.errors import OpenAIServiceError
+from services.metrics import track_llm, record_llm_usage
+from services.lazy_modules import lazy_module
 
-client = AsyncOpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com/v1")
+openai = lazy_module("openai")
+client = None
+
+def get_client():
+    """The DeepSeek client, created on the first request so importing this module doesn't load openai"""
+    global client
+    if client is None:
+        client = openai.AsyncOpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+    return client
 
 async def deepseek_api_text_request(lang, user_model, set_answer, web_enabled, conversation) -> str:
     """
@@ -15,12 +23,14 @@ async def deepseek_api_text_request(lang, user_model, set_answer, web_enabled, c
     try:
         # Here you would typically call your AI model or service to get a response
         # For demonstration, we'll just echo the user text
-        response = await client.chat.completions.create(
-            model=user_model,
-            messages=conversation,
-            temperature=float(set_answer[0]) if set_answer else 0.7,
-            max_tokens=1000,
-        )
+        async with track_llm("deepseek", user_model, "chat"):
+            response = await get_client().chat.completions.create(
+                model=user_model,
+                messages=conversation,
+                temperature=float(set_answer[0]) if set_answer else 0.7,
+                max_tokens=1000,
+            )
+        record_llm_usage("deepseek", user_model, response.usage)
         return response.choices[0].message.content, response.usage.total_tokens
     except openai.APIError as e:
         await logs(f"Error in openai_api_photo_request: {e}", type_e="error")
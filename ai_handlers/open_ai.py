@@ -1,21 +1,30 @@
 import base64
-import openai
-import img2pdf
 import os
 import json
-from openai import AsyncOpenAI
-from config.config import OPENAI_API_KEY, DEFAULT_MODEL_FOR_VISION
+from config.config import OPENAI_API_KEY, OPENAI_BASE_URL, DEFAULT_MODEL_FOR_VISION
 from logs.log import logs
 from logs.errors import OpenAIServiceError
+from services.metrics import track_llm, record_llm_usage
+from services.lazy_modules import lazy_module
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url="https://api.openai.com/v1")
+openai = lazy_module("openai")
+img2pdf = lazy_module("img2pdf")
+client = None
+
+def get_client():
+    """The OpenAI client, created on the first request so importing this module doesn't load openai"""
+    global client
+    if client is None:
+        client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    return client
 
 async def openai_api_text_moderations(text):
     try:
-        response = await client.moderations.create(
-            input=text,
-            model="omni-moderation-latest"
-        )
+        async with track_llm("openai", "omni-moderation-latest", "moderation"):
+            response = await get_client().moderations.create(
+                input=text,
+                model="omni-moderation-latest"
+            )
         return response.results[0].flagged, response.results[0].categories
     except openai.APIError as e:
         await logs(f"Error in openai_api_text_moderations: {e}", type_e="error")
@@ -30,18 +39,19 @@ async def openai_api_photo_moderations(image_path, user_text):
     try:
         with open(image_path, "rb") as image_file:
                 base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-        response = await client.moderations.create(
-            model="omni-moderation-latest",
-            input=[
-                {"type": "text", "text": f"{user_text}"},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                    }
-                },
-            ],
-        )
+        async with track_llm("openai", "omni-moderation-latest", "moderation"):
+            response = await get_client().moderations.create(
+                model="omni-moderation-latest",
+                input=[
+                    {"type": "text", "text": f"{user_text}"},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    },
+                ],
+            )
         return response.results[0].flagged, response.results[0].categories
     except openai.APIError as e:
         await logs(f"Error in openai_api_photo_moderations: {e}", type_e="error")
@@ -60,11 +70,13 @@ async def openai_api_text_request(lang, user_model, set_answer, web_enabled, con
     """
     try:
         if web_enabled:
-            response = await client.responses.create(
-                model=user_model,
-                input=conversation,
-                tools=[{"type": "web_search"}]
-            )
+            async with track_llm("openai", user_model, "web_search"):
+                response = await get_client().responses.create(
+                    model=user_model,
+                    input=conversation,
+                    tools=[{"type": "web_search"}]
+                )
+            record_llm_usage("openai", user_model, response.usage)
             if response.output and response.output[0].status == "completed":
                 answer_parts = []
                 for block in response.output[1].content:
@@ -74,13 +86,15 @@ async def openai_api_text_request(lang, user_model, set_answer, web_enabled, con
                 return text, tokens
             return "", response.usage.total_tokens
 
-        response = await client.chat.completions.create(
-            model=user_model,
-            messages=conversation,
-            max_tokens=1000,
-            temperature=float(set_answer[0]) if set_answer else 0.7,
-            top_p=float(set_answer[1])     if set_answer else 1.0
-        )
+        async with track_llm("openai", user_model, "chat"):
+            response = await get_client().chat.completions.create(
+                model=user_model,
+                messages=conversation,
+                max_tokens=1000,
+                temperature=float(set_answer[0]) if set_answer else 0.7,
+                top_p=float(set_answer[1])     if set_answer else 1.0
+            )
+        record_llm_usage("openai", user_model, response.usage)
         text = response.choices[0].message.content
         tokens = response.usage.total_tokens
         return text, tokens
@@ -105,12 +119,14 @@ async def openai_api_photo_request(lang, user_model, set_answer, web_enabled, co
                 {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
             ]
         }]
-        await logs(f"Sending photo request to model {user_model} with image from {image_path}", type_e="info")
-        response = await client.chat.completions.create(
-            model=user_model,
-            messages=conversation_photo,
-            max_tokens=1000
-        )
+        await logs("Sending photo request to model %s with image from %s", user_model, image_path, type_e="info")
+        async with track_llm("openai", user_model, "vision"):
+            response = await get_client().chat.completions.create(
+                model=user_model,
+                messages=conversation_photo,
+                max_tokens=1000
+            )
+        record_llm_usage("openai", user_model, response.usage)
         return response.choices[0].message.content, response.usage.total_tokens
     except openai.APIError as e:
         await logs(f"Error in openai_api_photo_request: {e}", type_e="error")
@@ -124,8 +140,9 @@ async def openai_api_photo_request(lang, user_model, set_answer, web_enabled, co
 async def openai_api_voice_request(lang, audio_path):
     try:
         with open(audio_path, "rb") as audio:
-            transcript = await client.audio.transcriptions.create(model="whisper-1", file = audio)
-        await logs(f"Audio transcription completed for {audio_path}", type_e="info")
+            async with track_llm("openai", "whisper-1", "transcription"):
+                transcript = await get_client().audio.transcriptions.create(model="whisper-1", file = audio)
+        await logs("Audio transcription completed for %s", audio_path, type_e="info")
         return transcript.text
     except openai.APIError as e:
         await logs(f"Error in openai_api_voice_request: {e}", type_e="error")
@@ -143,13 +160,14 @@ async def openai_api_generate_image(lang, user_model, resolution, quality, user_
     :return: AI response
     """
     try:
-        response = await client.images.generate(
-            model=user_model,
-            prompt=user_text,
-            n=1,
-            size=resolution,
-            quality=quality
-        )
+        async with track_llm("openai", user_model, "image"):
+            response = await get_client().images.generate(
+                model=user_model,
+                prompt=user_text,
+                n=1,
+                size=resolution,
+                quality=quality
+            )
         return response.data[0].url
     except openai.APIError as e:
         await logs(f"Error in openai_api_generate_image: {e}", type_e="error")
@@ -168,25 +186,27 @@ async def openai_api_photo_check_analysis_request(lang, user_model, set_answer,
         with open(pdf_file_name,"wb") as f:
             f.write(img2pdf.convert([image_path]))
 
-        file = await client.files.create(
+        file = await get_client().files.create(
             file=open(pdf_file_name, "rb"),
             purpose="user_data"
         )
 
-        response = await client.chat.completions.create(
-            model=DEFAULT_MODEL_FOR_VISION,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "file", "file": {"file_id": file.id}},
-                        {"type": "text", "text": conversation}
-                    ]
-                }
-            ]
-        )
+        async with track_llm("openai", DEFAULT_MODEL_FOR_VISION, "receipt"):
+            response = await get_client().chat.completions.create(
+                model=DEFAULT_MODEL_FOR_VISION,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "file", "file": {"file_id": file.id}},
+                            {"type": "text", "text": conversation}
+                        ]
+                    }
+                ]
+            )
+        record_llm_usage("openai", DEFAULT_MODEL_FOR_VISION, response.usage)
         
-        await logs(f"Text extraction completed for {image_path}", type_e="info")
+        await logs("Text extraction completed for %s", image_path, type_e="info")
         return response.choices[0].message.content, response.usage.total_tokens
     except openai.APIError as e:
         await logs(f"Error in openai_api_photo_check_analysis_request: {e}", type_e="error")
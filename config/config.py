@@ -2,6 +2,7 @@ from functools import lru_cache
 import json
 from pathlib import Path
 from setuptools._distutils.util import strtobool
+from config.snapshot import publish, SnapshotMapping, SnapshotSequence
 
 def load_config(file_path: str):
     """
@@ -59,6 +60,17 @@ CHECKS_ANALYTICS = "checks_analytics"
 CHAT_HISTORIES_FILE_PATH = "context"
 LOGGING_FILE_PATH = config.get("LOGGING_FILE_PATH")
 LOGGING_SETTINGS_TO_SEND = config.get("LOGGING_SETTINGS_TO_SEND")
+LOG_LEVEL = config.get("LOG_LEVEL", "INFO")
+LOG_LEVELS = config.get("LOG_LEVELS", {})  # logger name -> level, e.g. {"services.handle_message": "DEBUG"}
+LOG_ROTATION = config.get("LOG_ROTATION", "size")  # size / time
+LOG_MAX_BYTES = int(config.get("LOG_MAX_BYTES", 20 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(config.get("LOG_BACKUP_COUNT", 10))
+LOG_ROTATION_WHEN = config.get("LOG_ROTATION_WHEN", "midnight")
+LOG_COMPRESS = bool(strtobool(str(config.get("LOG_COMPRESS", "True"))))
+ALERT_FLUSH_INTERVAL = float(config.get("ALERT_FLUSH_INTERVAL", 5))
+ALERT_DIGEST_WINDOW = int(config.get("ALERT_DIGEST_WINDOW", 60))
+ALERT_MAX_PER_MINUTE = int(config.get("ALERT_MAX_PER_MINUTE", 20))
+ALERT_MAX_PENDING = int(config.get("ALERT_MAX_PENDING", 500))
 TELEGRAM_BOT_TOKEN = config.get("TELEGRAM_BOT_TOKEN")
 TELEGRAM_INFO_BOT_TOKEN = config.get("TELEGRAM_INFO_BOT_TOKEN")
 BOT_USERNAME = config.get("BOT_USERNAME")
@@ -66,30 +78,158 @@ WEBAPP_URL = config.get("WEBAPP_URL")
 DEBUG_WEBAPP = bool(strtobool(config.get("DEBUG_WEBAPP", "False")))
 OPENAI_API_KEY = config.get("OPENAI_API_KEY")
 DEEPSEEK_API_KEY = config.get("DEEPSEEK_API_KEY")
+# API endpoints; only set to point the bot at local stand-ins (python -m services.load_test)
+TELEGRAM_API_URL = config.get("TELEGRAM_API_URL")
+OPENAI_BASE_URL = config.get("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+DEEPSEEK_BASE_URL = config.get("DEEPSEEK_BASE_URL") or "https://api.deepseek.com/v1"
 GEMINI_API_KEY = config.get("GEMINI_API_KEY")
 GOOGLE_CREDENTIALS_PATH = config.get("GOOGLE_APPLICATION_CREDENTIALS")
 GOOGLE_SERVICE_ACC = config.get("GOOGLE_SERVICE_ACC")
 PRODUCT_KEYS = config.get("PRODUCT_KEYS")
 PRODUCT_KEYS_FOR_PARSE = config.get("PRODUCT_KEYS_FOR_PARSE")
-SUPPORTED_EXTENSIONS = config.get("SUPPORTED_EXTENSIONS")
-SUPPORTED_IMAGE_EXTENSIONS = config.get("SUPPORTED_IMAGE_EXTENSIONS")
-SUPPORTED_LANGUAGES = config.get("SUPPORTED_LANGUAGES")
 DEFAULT_LANGUAGES = config.get("DEFAULT_LANGUAGES")
 DEFAULT_MODEL_FOR_VISION = config.get("DEFAULT_MODEL_FOR_VISION")
-MODELS = config.get("MODELS")
-MODELS_FOR_MENU = config.get("MODELS_FOR_MENU")
-MODELS_TEXT = config.get("MODELS_TEXT")
-MODELS_OPEN_AI = config.get("MODELS_OPEN_AI")
-MODELS_DEEPSEEK = config.get("MODELS_DEEPSEEK")
-WHITE_LIST = config.get("white_list")
 DB_DSN = config.get("DB_DSN")
+DB_POOL_MIN_SIZE = int(config.get("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(config.get("DB_POOL_MAX_SIZE", 10))
+MEDIA_CACHE_ENABLED = bool(strtobool(str(config.get("MEDIA_CACHE_ENABLED", "True"))))
+MEDIA_CACHE_TTL = int(config.get("MEDIA_CACHE_TTL", 7 * 24 * 3600))
+MEDIA_CACHE_MAX_ITEMS = int(config.get("MEDIA_CACHE_MAX_ITEMS", 1000))
+MEDIA_CACHE_PURGE_INTERVAL = int(config.get("MEDIA_CACHE_PURGE_INTERVAL", 3600))
+UPDATES_MODE = config.get("UPDATES_MODE", "polling")  # polling / webhook
+WEBHOOK_BASE_URL = config.get("WEBHOOK_BASE_URL", WEBAPP_URL)
+WEBHOOK_PATH = config.get("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = config.get("WEBHOOK_SECRET")
+WEBHOOK_QUEUE_SIZE = int(config.get("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_MAX_IN_FLIGHT = int(config.get("WEBHOOK_MAX_IN_FLIGHT", 100))
+WORKER_PROCESSES = int(config.get("WORKER_PROCESSES", 1))  # > 1 enables the supervisor mode
+WORKER_QUEUE_SIZE = int(config.get("WORKER_QUEUE_SIZE", 1000))
+WORKER_MAX_IN_FLIGHT = int(config.get("WORKER_MAX_IN_FLIGHT", 100))
+WORKER_STATS_INTERVAL = int(config.get("WORKER_STATS_INTERVAL", 60))
+FSM_STORAGE = config.get("FSM_STORAGE", "postgres")  # postgres / memory
+FSM_STATE_TTL = int(config.get("FSM_STATE_TTL", 24 * 3600))
+FSM_CACHE_MAX_ITEMS = int(config.get("FSM_CACHE_MAX_ITEMS", 10000))
+FSM_PURGE_INTERVAL = int(config.get("FSM_PURGE_INTERVAL", 3600))
+JOB_WORKERS = int(config.get("JOB_WORKERS", 4))  # per process
+JOB_MAX_ATTEMPTS = int(config.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BASE_DELAY = float(config.get("JOB_RETRY_BASE_DELAY", 10))
+JOB_RETRY_MAX_DELAY = float(config.get("JOB_RETRY_MAX_DELAY", 600))
+JOB_LEASE_SECONDS = int(config.get("JOB_LEASE_SECONDS", 600))
+JOB_POLL_INTERVAL = float(config.get("JOB_POLL_INTERVAL", 1))
+JOB_RETENTION = int(config.get("JOB_RETENTION", 7 * 24 * 3600))
+JOB_DOCUMENT_MIN_SIZE = int(config.get("JOB_DOCUMENT_MIN_SIZE", 512 * 1024))  # bytes; smaller documents are answered inline
+RATE_LIMIT_GLOBAL = float(config.get("RATE_LIMIT_GLOBAL", 30))  # requests/s per bot
+RATE_LIMIT_PER_CHAT = float(config.get("RATE_LIMIT_PER_CHAT", 1))  # messages/s in a private chat
+RATE_LIMIT_PER_GROUP = float(config.get("RATE_LIMIT_PER_GROUP", 20 / 60))  # messages/s in a group
+RATE_LIMIT_BURST = float(config.get("RATE_LIMIT_BURST", 3))
+RATE_LIMIT_MAX_RETRIES = int(config.get("RATE_LIMIT_MAX_RETRIES", 3))
+METRICS_ENABLED = bool(strtobool(str(config.get("METRICS_ENABLED", "True"))))
+METRICS_TOKEN = config.get("METRICS_TOKEN")  # /metrics is only served if set and requires "Authorization: Bearer <token>"
+HEALTH_PROBE_TTL = float(config.get("HEALTH_PROBE_TTL", 5))  # seconds a probe result is reused
+HEALTH_PROBE_TIMEOUT = float(config.get("HEALTH_PROBE_TIMEOUT", 2))
+RESOURCE_SAMPLE_INTERVAL = float(config.get("RESOURCE_SAMPLE_INTERVAL", 5))  # seconds
+RESOURCE_SAMPLE_HISTORY = int(config.get("RESOURCE_SAMPLE_HISTORY", 720))  # samples kept in memory
+LOOP_WATCHDOG_ENABLED = bool(strtobool(str(config.get("LOOP_WATCHDOG_ENABLED", "True"))))
+LOOP_WATCHDOG_INTERVAL = float(config.get("LOOP_WATCHDOG_INTERVAL", 0.1))  # seconds between heartbeats
+LOOP_STALL_THRESHOLD = float(config.get("LOOP_STALL_THRESHOLD", 0.5))  # seconds the loop may be blocked before the stack is captured
+LOOP_STALL_STACK_DEPTH = int(config.get("LOOP_STALL_STACK_DEPTH", 20))
+ADMIN_IDS = config.get("ADMIN_IDS", [])  # Telegram user IDs allowed to use the admin commands of the info bot
+DEBUG_TOKEN = config.get("DEBUG_TOKEN")  # enables the /debug/* endpoints, sent as "Authorization: Bearer <token>"
+MEMORY_PROFILE_FRAMES = int(config.get("MEMORY_PROFILE_FRAMES", 10))  # frames kept per allocation while profiling
+MEMORY_PROFILE_TOP = int(config.get("MEMORY_PROFILE_TOP", 30))  # allocation sites per report
+TRACING_ENABLED = bool(strtobool(str(config.get("TRACING_ENABLED", "True"))))
+TRACE_SAMPLE_RATE = float(config.get("TRACE_SAMPLE_RATE", 0.05))  # share of updates whose trace is always exported
+TRACE_SLOW_THRESHOLD = float(config.get("TRACE_SLOW_THRESHOLD", 10))  # seconds; slower or failed traces are exported too, 0 disables
+TRACE_EXPORTERS = config.get("TRACE_EXPORTERS", ["jsonl"])  # jsonl / console
+TRACE_FILE_PATH = config.get("TRACE_FILE_PATH") or str(Path(LOGGING_FILE_PATH or "logs/log.txt").with_name("traces.jsonl"))
+TRACE_MAX_SPANS = int(config.get("TRACE_MAX_SPANS", 500))  # per trace
+CPU_PROFILE_INTERVAL = float(config.get("CPU_PROFILE_INTERVAL", 0.01))  # seconds between stack samples
+CPU_PROFILE_MAX_SECONDS = int(config.get("CPU_PROFILE_MAX_SECONDS", 300))
+STATS_WINDOW_MINUTES = int(config.get("STATS_WINDOW_MINUTES", 15))  # rolling window of /stats on the info bot
+USAGE_FLUSH_INTERVAL = float(config.get("USAGE_FLUSH_INTERVAL", 5))  # seconds between ledger batches
+USAGE_BATCH_SIZE = int(config.get("USAGE_BATCH_SIZE", 500))  # flush early when this many events are buffered
+USAGE_MAX_PENDING = int(config.get("USAGE_MAX_PENDING", 50000))  # oldest events are dropped beyond this while the DB is down
+USAGE_EVENT_RETENTION_DAYS = int(config.get("USAGE_EVENT_RETENTION_DAYS", 90))  # daily rollups are kept
+UPDATE_LANES = {
+    "interactive": 50,
+    "text_ai": 20,
+    "heavy": 5,
+    **config.get("UPDATE_LANES", {})
+}
+# Most DB round trips an update of each flow may take; checked by python -m services.benchmarks.query_budget
+DB_QUERY_BUDGETS = {
+    "start": 15,
+    "text": 10,
+    "photo": 10,
+    "settings.toggle": 6,
+    "receipt.open": 5,
+    "receipt.recognize": 15,
+    "receipt.accept": 12,
+    "report": 6,
+    **config.get("DB_QUERY_BUDGETS", {})
+}
+# Seconds a cold start may take, checked by python -m services.benchmarks.startup --check:
+# importing main, and starting main.py until both bots call getUpdates
+STARTUP_BUDGETS = {
+    "imports": 1.5,
+    "first_poll": 5.0,
+    **config.get("STARTUP_BUDGETS", {})
+}
+# Heavy modules importing main must not execute; they load on first use (services.lazy_modules)
+STARTUP_LAZY_MODULES = config.get("STARTUP_LAZY_MODULES", ["pandas", "openai", "tika", "PIL", "img2pdf", "django", "telebot"])
 
-MESSAGES = lang_dict.get("MESSAGES")
+CONFIG_RELOAD_INTERVAL = float(config.get("CONFIG_RELOAD_INTERVAL", 5))  # seconds between checks of the config files, 0 disables
+CONFIG_FILE = str(path)
+LANG_DICT_FILE = "config/lang_dict.json"
 
-LIMITS = {
-        "default_list": [10, 1000],
-        "x5": [50, 5000],
-        "x10": [100, 10000],
-        "x100": [1000, 100000],
-        "white_list": [9999, 999999]
-    }
\ No newline at end of file
+#_____________________________________________________________
+#_____________________HOT-RELOADABLE VALUES___________________
+#_____________________________________________________________
+# Keys of the main config behind the values below; a change of any other key needs a restart
+RELOADABLE_CONFIG_KEYS = (
+    "SUPPORTED_EXTENSIONS", "SUPPORTED_IMAGE_EXTENSIONS", "SUPPORTED_LANGUAGES",
+    "MODELS", "MODELS_FOR_MENU", "MODELS_TEXT", "MODELS_OPEN_AI", "MODELS_DEEPSEEK",
+    "white_list", "LIMITS"
+)
+
+def reloadable_values(config: dict, lang_dict: dict) -> dict:
+    """
+    Values that change without a restart (services.config_reload), by constant name
+    :param config: Main config
+    :param lang_dict: Contents of lang_dict.json
+    """
+    return {
+        "MESSAGES": lang_dict.get("MESSAGES") or {},
+        "SUPPORTED_EXTENSIONS": config.get("SUPPORTED_EXTENSIONS") or [],
+        "SUPPORTED_IMAGE_EXTENSIONS": config.get("SUPPORTED_IMAGE_EXTENSIONS") or [],
+        "SUPPORTED_LANGUAGES": config.get("SUPPORTED_LANGUAGES") or [],
+        "MODELS": config.get("MODELS") or [],
+        "MODELS_FOR_MENU": config.get("MODELS_FOR_MENU") or [],
+        "MODELS_TEXT": config.get("MODELS_TEXT") or [],
+        "MODELS_OPEN_AI": config.get("MODELS_OPEN_AI") or [],
+        "MODELS_DEEPSEEK": config.get("MODELS_DEEPSEEK") or [],
+        "WHITE_LIST": config.get("white_list") or [],
+        "LIMITS": {
+            "default_list": [10, 1000],
+            "x5": [50, 5000],
+            "x10": [100, 10000],
+            "x100": [1000, 100000],
+            "white_list": [9999, 999999],
+            **config.get("LIMITS", {})
+        },
+    }
+
+publish(reloadable_values(config, lang_dict), config)
+
+# Read the snapshot of the moment on every access, so they follow a reload
+MESSAGES = SnapshotMapping("MESSAGES")
+SUPPORTED_EXTENSIONS = SnapshotSequence("SUPPORTED_EXTENSIONS")
+SUPPORTED_IMAGE_EXTENSIONS = SnapshotSequence("SUPPORTED_IMAGE_EXTENSIONS")
+SUPPORTED_LANGUAGES = SnapshotSequence("SUPPORTED_LANGUAGES")
+MODELS = SnapshotSequence("MODELS")
+MODELS_FOR_MENU = SnapshotSequence("MODELS_FOR_MENU")
+MODELS_TEXT = SnapshotSequence("MODELS_TEXT")
+MODELS_OPEN_AI = SnapshotSequence("MODELS_OPEN_AI")
+MODELS_DEEPSEEK = SnapshotSequence("MODELS_DEEPSEEK")
+WHITE_LIST = SnapshotSequence("WHITE_LIST")
+LIMITS = SnapshotMapping("LIMITS")
@@ -0,0 +1,122 @@
+"""
+Immutable snapshot of the hot-reloadable config values.
+
+config.config publishes the values read at import as version 1 and exposes
+each of them through a proxy (MESSAGES, MODELS, WHITE_LIST, ...), so
+`from config.config import MESSAGES` keeps working and always reads the
+current version. A reload builds a complete new snapshot and swaps it in
+with a single assignment: readers never lock and never see half of a new
+version. Only the top level of a snapshot is read-only: the nested dicts and
+lists are the parsed JSON, shared by every reader, and by convention are
+never changed in place (handlers pass them to code that expects real dicts
+and lists, so they aren't frozen). Every reload parses the files again, so
+two versions never share a nested object. Code that needs several values of
+one version takes current_snapshot() once.
+
+A proxy compares equal to the value it stands for, but it isn't a dict or a
+list: json.dumps() and isinstance(..., dict) need proxy.current(), the
+value of the current version itself.
+"""
+import time
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    version: int
+    values: Mapping[str, Any]    # constant name -> value
+    raw: Mapping[str, Any]       # the main config file it was built from
+    loaded_at: float
+
+_snapshot: ConfigSnapshot | None = None
+
+def current_snapshot() -> ConfigSnapshot:
+    return _snapshot
+
+def publish(values: dict, raw: dict) -> ConfigSnapshot:
+    """
+    Swaps in a new snapshot. `values` and `raw` are copied into read-only mappings;
+    the objects nested in them are taken as they are and must not be changed afterwards
+    :param values: Every reloadable value, by constant name
+    :param raw: The main config the values were read from
+    :return: The new snapshot
+    """
+    global _snapshot
+    _snapshot = ConfigSnapshot(
+        version=_snapshot.version + 1 if _snapshot else 1,
+        values=MappingProxyType(dict(values)),
+        raw=MappingProxyType(dict(raw)),
+        loaded_at=time.time(),
+    )
+    return _snapshot
+
+def _unwrap(value):
+    return value.current() if isinstance(value, (SnapshotMapping, SnapshotSequence)) else value
+
+class SnapshotMapping(Mapping):
+    """Read-only view of a dict value of the current snapshot"""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def current(self) -> dict:
+        """The dict of the current version, e.g. for json.dumps()"""
+        return _snapshot.values[self.name]
+
+    def __getitem__(self, key):
+        return _snapshot.values[self.name][key]
+
+    def get(self, key, default=None):
+        return _snapshot.values[self.name].get(key, default)
+
+    def __contains__(self, key) -> bool:
+        return key in _snapshot.values[self.name]
+
+    def __iter__(self):
+        return iter(_snapshot.values[self.name])
+
+    def __len__(self) -> int:
+        return len(_snapshot.values[self.name])
+
+    def __eq__(self, other) -> bool:
+        return _snapshot.values[self.name] == _unwrap(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(_snapshot.values[self.name])
+
+class SnapshotSequence(Sequence):
+    """Read-only view of a list value of the current snapshot; slices are lists"""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def current(self) -> list:
+        """The list of the current version, e.g. for json.dumps()"""
+        return _snapshot.values[self.name]
+
+    def __getitem__(self, index):
+        return _snapshot.values[self.name][index]
+
+    def __contains__(self, item) -> bool:
+        return item in _snapshot.values[self.name]
+
+    def __iter__(self):
+        return iter(_snapshot.values[self.name])
+
+    def __len__(self) -> int:
+        return len(_snapshot.values[self.name])
+
+    def __eq__(self, other) -> bool:
+        return _snapshot.values[self.name] == _unwrap(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        # As the list did, messages format these into user-facing texts
+        return repr(_snapshot.values[self.name])
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import timedelta
+from aiogram import types, Router
+from aiogram.filters import Command, CommandObject, Filter
+from aiogram.types import BufferedInputFile
+from config.config import ADMIN_IDS, CPU_PROFILE_MAX_SECONDS, STATS_WINDOW_MINUTES
+from logs.log import logs
+from services import memory_profiler, cpu_profiler, supervisor
+from services.live_stats import live_stats, merge, render
+from services import usage_ledger
+from services.config_reload import reload_config, get_config_stats
+from services.db_utils import read_top_users, read_model_usage, read_usage_trend
+
+# Commands of the info bot, only for ADMIN_IDS
+admin_router = Router()
+
+class IsAdmin(Filter):
+    async def __call__(self, message: types.Message) -> bool:
+        return message.from_user is not None and message.from_user.id in ADMIN_IDS
+
+async def send_report(message: types.Message, text: str, filename: str, caption: str):
+    """
+    Sends a diagnostic report as a text file
+    """
+    await message.answer_document(BufferedInputFile(text.encode("utf-8"), filename=filename), caption=caption)
+
+@admin_router.message(Command("memory"), IsAdmin())
+async def memory_command(message: types.Message, command: CommandObject):
+    """
+    /memory start|stop|status|snapshot|top|diff
+    """
+    action = (command.args or "status").split()[0].lower()
+    try:
+        # Snapshots of a large heap take a while; keep the event loop free meanwhile
+        text, is_report = await asyncio.to_thread(memory_profiler.run_action, action)
+        await logs(f"Admin {message.from_user.id} ran /memory {action}", type_e="info")
+        if is_report:
+            await send_report(message, text, memory_profiler.report_filename(action), memory_profiler.status())
+        else:
+            await message.answer(text)
+    except Exception as e:
+        await logs(f"Module: admin. Error in /memory {action}: {e}", type_e="error")
+        await message.answer(f"Error: {e}")
+
+@admin_router.message(Command("profile"), IsAdmin())
+async def profile_command(message: types.Message, command: CommandObject):
+    """
+    /profile [seconds] [all] - samples the event loop (or every thread) and sends a flamegraph-ready file
+    """
+    args = (command.args or "").split()
+    try:
+        seconds = float(args[0]) if args else 30.0
+    except ValueError:
+        await message.answer("Usage: /profile [seconds] [all]")
+        return
+    if cpu_profiler.is_running():
+        await message.answer("A profile is already running.")
+        return
+    all_threads = "all" in args[1:]
+    try:
+        await message.answer(f"Profiling for {min(seconds, CPU_PROFILE_MAX_SECONDS):g}s...")
+        await logs(f"Admin {message.from_user.id} ran /profile {seconds:g}", type_e="info")
+        text, summary = await cpu_profiler.profile(seconds, all_threads=all_threads)
+        # Captions are limited to 1024 characters; the full summary goes in a message
+        await send_report(message, text, cpu_profiler.report_filename(), summary.split("\n", 1)[0])
+        await message.answer(summary)
+    except Exception as e:
+        await logs(f"Module: admin. Error in /profile: {e}", type_e="error")
+        await message.answer(f"Error: {e}")
+
+@admin_router.message(Command("stats"), IsAdmin())
+async def stats_command(message: types.Message):
+    """
+    /stats - load of the last STATS_WINDOW_MINUTES from the in-memory windows
+    """
+    try:
+        summaries = [live_stats.summary()]
+        if supervisor.worker_pool is not None:
+            # Updates are handled by the workers; their windows come with the stats they report
+            summaries += supervisor.worker_pool.live_stats()
+        await message.answer(render(merge(summaries), STATS_WINDOW_MINUTES, processes=len(summaries)))
+    except Exception as e:
+        await logs(f"Module: admin. Error in /stats: {e}", type_e="error")
+        await message.answer(f"Error: {e}")
+
+@admin_router.message(Command("reload_config"), IsAdmin())
+async def reload_config_command(message: types.Message):
+    """
+    /reload_config - reloads the config files now instead of with the next check of the watcher
+    """
+    try:
+        await logs(f"Admin {message.from_user.id} ran /reload_config", type_e="info")
+        snapshot = await reload_config()
+        stats = get_config_stats()
+        if snapshot is not None:
+            text = f"Config version {snapshot.version} loaded"
+        elif stats["last_error"]:
+            text = f"Config version {stats['version']} stays: {stats['last_error']}"
+        else:
+            text = f"Config version {stats['version']} is up to date"
+        if supervisor.worker_pool is not None:
+            text += "\nWorkers reload with their next check of the files"
+        await message.answer(text)
+    except Exception as e:
+        await logs(f"Module: admin. Error in /reload_config: {e}", type_e="error")
+        await message.answer(f"Error: {e}")
+
+@admin_router.message(Command("usage"), IsAdmin())
+async def usage_command(message: types.Message, command: CommandObject):
+    """
+    /usage [days] - tokens per model, top users and the daily trend from the usage_daily rollup
+    """
+    args = (command.args or "").split()
+    days = int(args[0]) if args and args[0].isdigit() else 7
+    end_date = usage_ledger.today()
+    start_date = end_date - timedelta(days=max(1, days) - 1)
+    try:
+        await usage_ledger.flush()
+        models = await read_model_usage(start_date, end_date)
+        users = await read_top_users(start_date, end_date, limit=10)
+        trend = await read_usage_trend(start_date, end_date)
+        lines = [f"Usage {start_date} - {end_date} (UTC)", "", "By model (tokens, requests, users):"]
+        lines += [f"  {row['model']}: {row['tokens']}, {row['requests']}, {row['users']}" for row in models] or ["  none"]
+        lines += ["", "Top users (tokens, requests):"]
+        lines += [f"  {row['user_id']}: {row['tokens']}, {row['requests']}" for row in users] or ["  none"]
+        lines += ["", "By day (tokens, requests, users):"]
+        lines += [f"  {row['day']}: {row['tokens']}, {row['requests']}, {row['users']}" for row in trend] or ["  none"]
+        await message.answer("\n".join(lines))
+    except Exception as e:
+        await logs(f"Module: admin. Error in /usage: {e}", type_e="error")
+        await message.answer(f"Error: {e}")
@@ -6,26 +6,28 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 from config.config import DEFAULT_LANGUAGES, MESSAGES, CHECKS_ANALYTICS, SUPPORTED_IMAGE_EXTENSIONS
 from logs.log import logs
+from services.routing_index import callback_route
 from services.handle_message import handle_message
 from services.utils import map_keys, dict_to_str, dict_to_str_for_webapp
 from keyboards.reply_kb import get_persistent_menu
 from handlers.callbacks_data import PromptState, PromtImageState, CheckImageState, MemoryInputFile
 from keyboards.inline_kb_options import get_options_inline, get_generate_image_inline, get_add_check_inline, get_continue_add_check_accept_inline, get_add_check_accept_inline
 from services.db_utils import read_user_all_data, write_user_to_json, update_user_data, clear_user_context
+from services.session_context import SessionContext, load_session, get_chat_state, chat_isolation
+from services.job_queue import Job, enqueue_message_job
 import services.telegram_bot_init as bot_tg
 from services.telegram_bot_init import initialize_bots
 
 callbacks_options_router = Router()
 
-return_message = {}
-
-@callbacks_options_router.callback_query(lambda call: call.data.startswith("options:"))
+@callback_route("options")
 async def process_options_callback(query: types.CallbackQuery, state: FSMContext):
     try:
         chat_id = query.message.chat.id if query.message.chat.type == ChatType.PRIVATE else query.from_user.id
 
-        user_data = await read_user_all_data(chat_id)
-        lang = user_data.get("language") or DEFAULT_LANGUAGES
+        session = await load_session(chat_id, state)
+        user_data = session.user_data
+        lang = session.lang
 
         current_resolution = user_data.get("resolution")
         quality = user_data.get("quality")
@@ -35,7 +37,7 @@ async def process_options_callback(query: types.CallbackQuery, state: FSMContext
 
         if data == "clear_context":
             await clear_user_context(chat_id)
-            await logs(f"Context for user {chat_id} successfully cleared.", type_e="info")
+            await logs("Context for user %s successfully cleared.", chat_id, type_e="info")
             await query.answer(text=MESSAGES[lang]['context_cleared'], show_alert=False)
 
         elif data == "generate_image":
@@ -63,11 +65,21 @@ async def process_options_callback(query: types.CallbackQuery, state: FSMContext
             await query.answer()
 
         elif data == "accept":
+            pending_receipt = await session.get_pending_receipt()
             await state.clear()
-            list_of_dict_for_db = await map_keys(return_message, chat_id, lang)
+            persistent_menu = await get_persistent_menu(chat_id)
+            if not pending_receipt:
+                # The receipt was already accepted or cancelled
+                await query.message.answer(
+                    text=f"<b>System: </b>{MESSAGES[lang]['inline_kb']['options']['error']}",
+                    reply_markup=persistent_menu
+                )
+                await query.message.delete()
+                return
+            check_successful_writing = None
+            list_of_dict_for_db = await map_keys(pending_receipt, chat_id, lang)
             for dict_to_db in list_of_dict_for_db:
                 check_successful_writing = await write_user_to_json(CHECKS_ANALYTICS, dict_to_db)
-            persistent_menu = await get_persistent_menu(chat_id)
             if check_successful_writing:    
                 await query.message.answer(text=MESSAGES[lang]['inline_kb']['options']['accept'], reply_markup=persistent_menu)
                 await query.message.delete()
@@ -110,7 +122,7 @@ async def process_options_callback(query: types.CallbackQuery, state: FSMContext
             await update_user_data(chat_id, "message_id", 0)
             return
 
-        await logs(f"Options callback processed for chat_id {chat_id} with data: {data}", type_e="info")
+        await logs("Options callback processed for chat_id %s with data: %s", chat_id, data, type_e="info")
 
     except Exception as e:
         await logs(f"Error in process_options_callback for chat_id {chat_id}: {e}", type_e="error")
@@ -118,7 +130,7 @@ async def process_options_callback(query: types.CallbackQuery, state: FSMContext
 
 @callbacks_options_router.message(PromtImageState.waiting_for_input_promt)
 async def handle_text_input(message: types.Message, state: FSMContext):
-    await logs(f"[FSM] Prompt generatio image received from {message.chat.id}: {message.text}", type_e="debug")
+    await logs("[FSM] Prompt generatio image received from %s: %s", message.chat.id, message.text, type_e="debug")
 
     chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
 
@@ -173,18 +185,17 @@ async def handle_text_input(message: types.Message, state: FSMContext):
             await logs(f"[FSM] Error {image_response.status_code} loading image: {return_message}", type_e="error")
         
         await state.clear()
-        await logs(f"Image generation message processed for user {chat_id}", type_e="info")
+        await logs("Image generation message processed for user %s", chat_id, type_e="info")
 
 @callbacks_options_router.message(CheckImageState.waiting_for_image_input)
 async def handle_text_input(message: types.Message, state: FSMContext):
-    global return_message
-    await logs(f"[FSM] Image received from {message.chat.id}: {message.text}", type_e="debug")
+    await logs("[FSM] Image received from %s: %s", message.chat.id, message.text, type_e="debug")
 
     chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
 
-    user_data = await read_user_all_data(chat_id)
-    lang = user_data.get("language") or DEFAULT_LANGUAGES
-    struckture_data = MESSAGES[lang]['check_struckture_data']
+    session = await load_session(chat_id, state)
+    user_data = session.user_data
+    lang = session.lang
     message_id_for_deletion = user_data.get("message_id") or None
     if message_id_for_deletion and message_id_for_deletion != 0:
             try:
@@ -201,45 +212,89 @@ async def handle_text_input(message: types.Message, state: FSMContext):
                         parse_mode=ParseMode.HTML
                     )
     elif message.content_type == types.ContentType.DOCUMENT:
-        try:
-            # Process request through handle_message function (generation_type="check")
-            return_message = await handle_message(message, tools_type="check", ai_handler="api_vision")
+        # Cleared before queuing, so it can't wipe the receipt the job stores
+        await state.clear()
+        # Receipt recognition takes a while, so it runs as a background job. The confirmation
+        # goes to the chat of the message, its accept callback reads this chat's and user's state
+        await enqueue_message_job("receipt_document", message, lang, chat_id=message.chat.id, user_id=message.from_user.id)
+        return
+    await state.clear()
 
-            if return_message is None:
-                await bot_tg.bot.delete_message(
-                    chat_id=chat_id, 
-                    message_id=message_id_for_deletion
-                )
-                await bot_tg.bot.send_message(
-                    chat_id=chat_id, 
-                    text=f"<b>System: </b>{MESSAGES.get(lang, {}).get('no_answer', 'No answer available.')}", 
-                    parse_mode=ParseMode.HTML
-                )
-                return
+async def run_receipt_document_job(job: Job):
+    """
+    Background job: recognizes a receipt sent as a document and asks the user to confirm it
+    """
+    message = job.message
+    chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
+    # Jobs queued before the payload carried the keys take them from the message
+    origin_chat_id = job.payload.get("chat_id", message.chat.id)
+    user_id = job.payload.get("user_id", message.from_user.id)
+    session = await load_session(chat_id, get_chat_state(origin_chat_id, user_id))
+    session.processing_message = job.status_message
+    # Until the last attempt a transient AI error fails the job, so it is retried with backoff
+    return_message = await handle_message(
+        message, tools_type="check", ai_handler="api_vision", session=session, retry_errors=job.attempts < job.max_attempts
+    )
+    # Jobs run outside the dispatcher, so the chat lock is taken here; the recognition above doesn't need it
+    async with chat_isolation.lock(session.state.key):
+        await _send_receipt_for_confirmation(session, return_message, origin_chat_id)
 
-            message_to_web_app = [return_message[k] for k in struckture_data]
-            message_to_web_app[4] = await dict_to_str_for_webapp(message_to_web_app[4])
-            message_to = await dict_to_str(return_message)
-            persistent_menu = await get_persistent_menu(chat_id)
-            inline_add_check_accept_kb = await get_add_check_accept_inline(chat_id, message_to_web_app)
-            message_sended = await message.answer(
-                text=message_to,
-                reply_markup=inline_add_check_accept_kb,
-                parse_mode=ParseMode.HTML
-            )
-            await update_user_data(chat_id, "message_id", message_sended.message_id)
-        except Exception as e:
-            await logs(f"Error processing document message: {e}", type_e="error")
-    await state.clear()
+async def run_receipt_input_job(job: Job):
+    """
+    Background job: re-analyzes a receipt submitted from the web app
+    """
+    await process_user_input_list(job.payload["user_input_list"], retry_errors=job.attempts < job.max_attempts)
+
+async def _send_receipt_for_confirmation(session: SessionContext, receipt, target_chat_id: int | None = None):
+    """
+    Sends the recognized receipt with the accept keyboard and keeps it in session.state;
+    the caller holds the chat lock of that state
+    :param target_chat_id: Chat to send it to, the user's private chat by default
+    """
+    chat_id = session.chat_id
+    lang = session.lang
+    target_chat_id = target_chat_id or chat_id
+    if not isinstance(receipt, dict):
+        # No answer or a system error text from handle_message
+        await bot_tg.bot.send_message(
+            chat_id=target_chat_id,
+            text=receipt or f"<b>System: </b>{MESSAGES.get(lang, {}).get('no_answer', 'No answer available.')}",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    struckture_data = MESSAGES[lang]['check_struckture_data']
+    message_to_web_app = [receipt[k] for k in struckture_data]
+    message_to_web_app[4] = await dict_to_str_for_webapp(message_to_web_app[4])
+    message_to = await dict_to_str(receipt)
+    inline_add_check_accept_kb = await get_add_check_accept_inline(chat_id, message_to_web_app)
+    # Kept in this chat's FSM data until the user accepts or cancels it. Stored before the keyboard
+    # is sent: the accept callback is an interactive update and doesn't wait for this lock
+    await session.set_pending_receipt(receipt)
+    message_sended = await bot_tg.bot.send_message(
+        chat_id=target_chat_id,
+        text=message_to,
+        reply_markup=inline_add_check_accept_kb,
+        parse_mode=ParseMode.HTML
+    )
+    await update_user_data(chat_id, "message_id", message_sended.message_id)
 
-async def process_user_input_list(user_text_input: list):
-    global return_message
+async def process_user_input_list(user_text_input: list, retry_errors: bool = False):
+    """
+    :param user_text_input: Receipt fields from the web app, the chat ID last
+    :param retry_errors: Raise transient AI errors instead of sending their text (see handle_message)
+    """
+    chat_id = int(user_text_input[7])
+    state = get_chat_state(chat_id)
+    # Web app submissions don't pass through the dispatcher, so take the chat lock here
+    async with chat_isolation.lock(state.key):
+        await _process_user_input_list(chat_id, user_text_input[:7], state, retry_errors)
+
+async def _process_user_input_list(chat_id: int, user_text_input: list, state: FSMContext, retry_errors: bool = False):
     try:
-        chat_id = user_text_input[7]
-        user_text_input.pop()
-        print(user_text_input, type(user_text_input))
-        user_data = await read_user_all_data(chat_id)
-        lang = user_data.get("language") or DEFAULT_LANGUAGES
+        session = await load_session(chat_id, state)
+        user_data = session.user_data
+        lang = session.lang
         message_id_for_deletion = user_data.get("message_id") or None
         struckture_data = MESSAGES[lang]['check_struckture_data']
         if bot_tg is None:
@@ -259,31 +314,19 @@ async def process_user_input_list(user_text_input: list):
             text=f"Data received, processing...\n{message_raw}", 
             parse_mode=ParseMode.HTML)
         
-        return_message = await handle_message(temporary_message, tools_type="check", user_input_list=user_text_input)
-        if return_message is None:
+        try:
+            return_message = await handle_message(
+                temporary_message, tools_type="check", user_input_list=user_text_input, session=session, retry_errors=retry_errors
+            )
+        finally:
+            # A retried job sends it again
             await bot_tg.bot.delete_message(
                 chat_id=chat_id, 
                 message_id=temporary_message.message_id
             )
-            await bot_tg.bot.send_message(
-                chat_id=chat_id, 
-                text=f"<b>System: </b>{MESSAGES.get(lang, {}).get('no_answer', 'No answer available.')}", 
-                parse_mode=ParseMode.HTML
-            )
-            return
-        await bot_tg.bot.delete_message(
-            chat_id=chat_id, 
-            message_id=temporary_message.message_id
-        )    
-        message_to_web_app = [return_message[k] for k in struckture_data]
-        message_to_web_app[4] = await dict_to_str_for_webapp(message_to_web_app[4])
-        message_to = await dict_to_str(return_message)
-        persistent_menu = await get_persistent_menu(chat_id)
-        inline_add_check_accept_kb = await get_add_check_accept_inline(chat_id, message_to_web_app)
-        message_sended = await bot_tg.bot.send_message(chat_id=chat_id, text=message_to, reply_markup=inline_add_check_accept_kb, parse_mode=ParseMode.HTML)
-        await update_user_data(chat_id, "message_id", message_sended.message_id)
+        await _send_receipt_for_confirmation(session, return_message)
         
-        await logs(f"User input list processed for chat_id {chat_id}", type_e="info")
+        await logs("User input list processed for chat_id %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error processing user input list for chat_id {chat_id}: {e}", type_e="error")
         raise
\ No newline at end of file
@@ -1,19 +1,20 @@
-import pandas as pd
-from datetime import datetime, date, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime, date
 from aiogram import types, Router, F
 from aiogram.enums import ChatType
 from services.db_utils import read_user_all_data, read_with_period
 from logs.log import logs
+from services.routing_index import callback_route
 from config.config import DEFAULT_LANGUAGES, MESSAGES
 from keyboards.inline_kb_profile import get_profile_inline, get_limits_inline, get_check_report_inline, get_report_inline, create_day_keyboard
 from aiogram.fsm.context import FSMContext
 from handlers.callbacks_data import DateCB, PeriodCB, ReportСB, CustomPeriod
-from services.report_services import generate_report
+from services.report_services import generate_report, preset_period
+from services.lazy_modules import lazy_module
 
+pd = lazy_module("pandas")
 callbacks_profile_router = Router()
 
-@callbacks_profile_router.callback_query(lambda call: call.data.startswith("profile:"))
+@callback_route("profile")
 async def process_profile_callback(query: types.CallbackQuery):
     try:
         # Determine chat_id based on chat type
@@ -41,7 +42,7 @@ async def process_profile_callback(query: types.CallbackQuery):
             await query.message.edit_text(MESSAGES[lang]['inline_kb']['profile']['check_report_title'], reply_markup=inline_calendar_kb)
             await query.answer()
 
-        await logs(f"Profile callback processed for chat_id {chat_id} with data: {data}", type_e="info")
+        await logs("Profile callback processed for chat_id %s with data: %s", chat_id, data, type_e="info")
     except Exception as e:
         await logs(f"Error in process_profile_callback for chat_id {chat_id}: {e}", type_e="error")
         raise
@@ -84,7 +85,7 @@ async def unified_period_handler(
                     if current_state == CustomPeriod.waiting_for_start
                     else MESSAGES[lang]['calendar']['end_date']
                 )
-                await logs(f"Month navigation activated for chat_id {chat_id}", type_e="info")
+                await logs("Month navigation activated for chat_id %s", chat_id, type_e="info")
                 new_markup = await create_day_keyboard(year, month, chat_id, lang)
 
             # Установили начальную дату → переходим к выбору конца
@@ -94,7 +95,7 @@ async def unified_period_handler(
                 await state.set_state(CustomPeriod.waiting_for_end)
 
                 new_text = MESSAGES[lang]['calendar']['end_date']
-                await logs(f"Start date set for chat_id {chat_id}: {start}", type_e="info")
+                await logs("Start date set for chat_id %s: %s", chat_id, start, type_e="info")
                 new_markup = await create_day_keyboard(year, month, chat_id, lang)
 
             # Установили конечную дату → выходим из FSM и показываем результат
@@ -108,21 +109,9 @@ async def unified_period_handler(
 
         # 2) Пресеты («сегодня», «месяц» и т.д.)
         elif isinstance(callback_data, PeriodCB) and callback_data.mode == "preset":
-            today = date.today()
-            match callback_data.value:
-                case "today":
-                    start = end = today
-                case "week":
-                    start, end = today - timedelta(days=6), today
-                case "current_month":
-                    start, end = today.replace(day=1), today
-                case "last_month":
-                    start = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
-                    end   = today.replace(day=1) - timedelta(days=1)
-                case "year":
-                    start, end = today - relativedelta(years=1), today
-
-            await logs(f"Preset period handler activated for chat_id {chat_id}", type_e="info")
+            start, end = preset_period(callback_data.value, date.today())
+
+            await logs("Preset period handler activated for chat_id %s", chat_id, type_e="info")
             new_text, new_markup = await get_text_and_markup(start, end)
 
         # 3) Кастомный старт периода
@@ -132,7 +121,7 @@ async def unified_period_handler(
             await state.set_state(CustomPeriod.waiting_for_start)
 
             new_text = MESSAGES[lang]['calendar']['start_date']
-            await logs(f"Custom period handler activated for chat_id {chat_id}", type_e="info")
+            await logs("Custom period handler activated for chat_id %s", chat_id, type_e="info")
             new_markup = await create_day_keyboard(
                 year     = datetime.now().year,
                 month    = datetime.now().month,
@@ -143,7 +132,7 @@ async def unified_period_handler(
         # --- ЕДИНСТВЕННЫЙ вызов edit_text и answer ---
         await query.message.edit_text(new_text, reply_markup=new_markup)
         await query.answer()
-        await logs(f"Unified period handler processed for chat_id {chat_id} with data: {callback_data}", type_e="info")
+        await logs("Unified period handler processed for chat_id %s with data: %s", chat_id, callback_data, type_e="info")
     except Exception as e:
         await logs(f"Error in unified_period_handler for chat_id {chat_id}: {e}", type_e="error")
         raise    
@@ -183,7 +172,7 @@ async def process_report_callback(query: types.CallbackQuery, callback_data: Rep
         await query.message.edit_text(text)#MESSAGES[lang]['inline_kb']['profile']['check_report_title_finally'])
         await query.answer()
 
-        await logs(f"Report callback processed for chat_id {chat_id} with report type: {report_type}", type_e="info")
+        await logs("Report callback processed for chat_id %s with report type: %s", chat_id, report_type, type_e="info")
     except Exception as e:
         await logs(f"Error in process_report_callback for chat_id {chat_id}: {e}", type_e="error")
         raise
\ No newline at end of file
@@ -6,6 +6,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 from config.config import DEFAULT_LANGUAGES, MESSAGES, SUPPORTED_LANGUAGES
 from logs.log import logs
+from services.routing_index import callback_route
 from services.db_utils import read_user_all_data, update_user_data
 from keyboards.inline_kb_settings import (get_settings_inline, 
                                           get_model_inline, 
@@ -20,7 +21,7 @@ from handlers.callbacks_data import PromptState
 
 callbacks_settings_router = Router()
 
-@callbacks_settings_router.callback_query(lambda call: call.data.startswith("settings:"))
+@callback_route("settings")
 async def process_settings_callback(query: types.CallbackQuery, state: FSMContext):
     try:
         # Determine chat_id based on chat type
@@ -98,12 +99,12 @@ async def process_settings_callback(query: types.CallbackQuery, state: FSMContex
             await query.answer()
             return
 
-        await logs(f"Settings callback processed for chat_id {chat_id} with data: {data}", type_e="info")
+        await logs("Settings callback processed for chat_id %s with data: %s", chat_id, data, type_e="info")
     except Exception as e:
         await logs(f"Error in process_settings_callback for chat_id {chat_id}: {e}", type_e="error")
         raise
 
-@callbacks_settings_router.callback_query(lambda call: call.data.startswith("model:"))
+@callback_route("model")
 async def process_set_model_callback(query: types.CallbackQuery):
     try:
         # Determine chat_id based on chat type
@@ -136,12 +137,12 @@ async def process_set_model_callback(query: types.CallbackQuery):
                     f"Model changed to: {new_model}"
                 )
         await query.answer(text=response_text, show_alert=False)
-        await logs(f"ChatGPT model changed to: {new_model} for chat_id {chat_id}", type_e="info")
+        await logs("ChatGPT model changed to: %s for chat_id %s", new_model, chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in process_set_model_callback for chat_id {chat_id}: {e}", type_e="error")
         raise
 
-@callbacks_settings_router.callback_query(lambda call: call.data.startswith("answer:"))
+@callback_route("answer")
 async def process_answer_callback(query: types.CallbackQuery):
     try:
         # Extract selected answer option
@@ -186,12 +187,12 @@ async def process_answer_callback(query: types.CallbackQuery):
             )
             await query.answer(text=response_text, show_alert=False)
         
-        await logs(f"Answer configured for user {chat_id}: {chosen_set_answer}", type_e="info")
+        await logs("Answer configured for user %s: %s", chat_id, chosen_set_answer, type_e="info")
     except Exception as e:
         await logs(f"Error in process_answer_callback for user {chat_id}: {e}", type_e="error")
         raise
 
-@callbacks_settings_router.callback_query(lambda call: call.data.startswith("role:"))
+@callback_route("role")
 async def process_role_callback(query: types.CallbackQuery, state: FSMContext):
     try:
         # Determine chat_id
@@ -248,12 +249,12 @@ async def process_role_callback(query: types.CallbackQuery, state: FSMContext):
             )
             await query.answer(text=confirmation_text, show_alert=False)
 
-        await logs(f"Role for user {chat_id} updated to: {selected_value}", type_e="info")
+        await logs("Role for user %s updated to: %s", chat_id, selected_value, type_e="info")
     except Exception as e:
         await logs(f"Error in process_role_callback for user {chat_id}: {e}", type_e="error")
         raise
 
-@callbacks_settings_router.callback_query(lambda call: call.data.startswith("generation:"))
+@callback_route("generation")
 async def process_generation_callback(query: types.CallbackQuery):
     try:
         chat_id = query.message.chat.id if query.message.chat.type == ChatType.PRIVATE else query.from_user.id
@@ -309,13 +310,13 @@ async def process_generation_callback(query: types.CallbackQuery):
             else:
                 raise
 
-        await logs(f"[DALL·E] User {chat_id} updated {setting_type} to {value}", type_e="info")
+        await logs("[DALL·E] User %s updated %s to %s", chat_id, setting_type, value, type_e="info")
 
     except Exception as e:
         await logs(f"[DALL·E] Error in process_generation_callback for chat_id {chat_id}: {e}", type_e="error")
         raise
 
-@callbacks_settings_router.callback_query(lambda call: call.data.startswith("lang:"))
+@callback_route("lang")
 async def process_lang_callback(query: types.CallbackQuery):
     try:
         chosen_lang = query.data.split(":", 1)[1]
@@ -353,14 +354,14 @@ async def process_lang_callback(query: types.CallbackQuery):
                 parse_mode=ParseMode.HTML
             )
 
-        await logs(f"Language changed for user {chat_id} to {chosen_lang}", type_e="info")
+        await logs("Language changed for user %s to %s", chat_id, chosen_lang, type_e="info")
     except Exception as e:
         await logs(f"Error in process_lang_callback for user {chat_id}: {e}", type_e="error")
         raise
 
 @callbacks_settings_router.message(PromptState.waiting_for_input)
 async def handle_text_input(message: types.Message, state: FSMContext):
-    await logs(f"[FSM] Prompt received from {message.chat.id}: {message.text}", type_e="debug")
+    await logs("[FSM] Prompt received from %s: %s", message.chat.id, message.text, type_e="debug")
 
     chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
     user_data = await read_user_all_data(chat_id)
@@ -6,6 +6,7 @@ from aiogram.types import ReplyKeyboardRemove
 from services.db_utils import read_user_all_data, write_user_to_json, user_exists
 from config.config import MESSAGES, SUPPORTED_LANGUAGES, DEFAULT_LANGUAGES, USERS_FILE_PATH, CHECKS_ANALYTICS, CHATGPT_MODEL, LIMITS, WHITE_LIST, LOGGING_SETTINGS_TO_SEND
 from logs.log import logs, send_info_msg
+from services.routing_index import reply_route
 from keyboards.reply_kb import get_persistent_menu
 from keyboards.inline_kb_settings import get_settings_inline
 from keyboards.inline_kb_options import get_options_inline
@@ -17,7 +18,7 @@ commands_router = Router()
 async def send_welcome(message: types.Message):
     try:
         # Log command receipt
-        await logs(f"Received /start command from user {message.from_user.id}", type_e="info")
+        await logs("Received /start command from user %s", message.from_user.id, type_e="info")
         
         chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
         user_lang = message.from_user.language_code
@@ -26,7 +27,7 @@ async def send_welcome(message: types.Message):
         
         # Check user existence
         chat_id_exists = await user_exists(chat_id)
-        await logs(f"Checking existence of user {chat_id}: {'found' if chat_id_exists else 'not found'}", type_e="info")
+        await logs("Checking existence of user %s: %s", chat_id, 'found' if chat_id_exists else 'not found', type_e="info")
         
         if chat_id_exists == False:
             if chat_id in WHITE_LIST:
@@ -56,18 +57,18 @@ async def send_welcome(message: types.Message):
                 "message_id": 0
             }
             await write_user_to_json(USERS_FILE_PATH, user_data)
-            await logs(f"Created new user {chat_id} with chat_id {chat_id}", type_e="info")
+            await logs("Created new user %s with chat_id %s", chat_id, chat_id, type_e="info")
             await send_info_msg(text=f'Type message: Info\nNew user: {user_data["username"]}\nUser ID: {user_data["user_id"]}', message_thread_id=LOGGING_SETTINGS_TO_SEND["message_thread_id"])
         
         # Send message based on chat type
         if message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
             remove_keyboard = ReplyKeyboardRemove()
             await message.reply(MESSAGES[lang]['welcome_group'], reply_markup=remove_keyboard)
-            await logs(f"Sent welcome message in group chat {chat_id}", type_e="info")
+            await logs("Sent welcome message in group chat %s", chat_id, type_e="info")
         else:
             persistent_menu = await get_persistent_menu(chat_id)
             await message.reply(MESSAGES[lang]["welcome"], reply_markup=persistent_menu)
-            await logs(f"Sent welcome message in private chat {chat_id}", type_e="info")
+            await logs("Sent welcome message in private chat %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in send_welcome: {e}", type_e="error")
         raise
@@ -92,12 +93,12 @@ async def command_help(message: types.Message):
             persistent_menu = await get_persistent_menu(chat_id)
             await message.answer(MESSAGES[lang]['help'], reply_markup=persistent_menu)
         
-        await logs(f"Command /help successfully executed for chat_id {chat_id}", type_e="info")
+        await logs("Command /help successfully executed for chat_id %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in command_help: {e}", type_e="error")
         raise
 
-@commands_router.message(lambda message: message.text in [MESSAGES[lang]["settings_title"] for lang in SUPPORTED_LANGUAGES])
+@reply_route("settings")
 async def command_settings_reply_kb(message: types.Message):
     try:
         # Determine chat_id based on chat type
@@ -116,12 +117,12 @@ async def command_settings_reply_kb(message: types.Message):
         if message.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
             await message.answer(MESSAGES[lang]['settings_title'], reply_markup=inline_menu)
 
-        await logs(f"Command settings successfully executed for chat_id {chat_id}", type_e="info")
+        await logs("Command settings successfully executed for chat_id %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in command_settings: {e}", type_e="error")
         raise
 
-@commands_router.message(lambda message: message.text in [MESSAGES[lang]["reply_kb"]["options"] for lang in SUPPORTED_LANGUAGES])
+@reply_route("options")
 async def command_options(message: types.Message):
     try:
         # Determine chat_id based on chat type
@@ -140,12 +141,12 @@ async def command_options(message: types.Message):
         if message.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
             await message.answer(MESSAGES[lang]['inline_kb']['options']['options_title'], reply_markup=inline_menu)
         
-        await logs(f"Command options successfully executed for chat_id {chat_id}", type_e="info")
+        await logs("Command options successfully executed for chat_id %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in command_options: {e}", type_e="error")
         raise
 
-@commands_router.message(lambda message: message.text in [MESSAGES[lang]["reply_kb"]["profile"] for lang in SUPPORTED_LANGUAGES])
+@reply_route("profile")
 async def command_profile(message: types.Message):
     try:
         # Determine chat_id
@@ -162,7 +163,7 @@ async def command_profile(message: types.Message):
         # Send message with profile menu in private chats
         if message.chat.type not in [ChatType.GROUP, ChatType.SUPERGROUP]:
             await message.answer(MESSAGES[lang]['inline_kb']['profile']['profile_title'], reply_markup=inline_menu)
-        await logs(f"Command profile successfully executed for chat_id {chat_id}", type_e="info")
+        await logs("Command profile successfully executed for chat_id %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in command_profile: {e}", type_e="error")
         raise
\ No newline at end of file
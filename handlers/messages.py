@@ -1,9 +1,11 @@
 from aiogram import types, F, Router
 from aiogram.enums import ChatType, ParseMode
-from config.config import BOT_USERNAME
+from config.config import BOT_USERNAME, JOB_DOCUMENT_MIN_SIZE
 from keyboards.reply_kb import get_persistent_menu
 from logs.log import logs
 from services.handle_message import handle_message
+from services.job_queue import Job, enqueue_message_job
+from services.session_context import load_session, get_chat_state, chat_isolation
 
 messages_router = Router()
 
@@ -12,15 +14,12 @@ async def private_message_handler(message: types.Message):
     try:
         # Determine chat_id
         chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
+        if await queue_large_document(message, chat_id):
+            return
         # Process other messages through handle_message function
         return_message = await handle_message(message)
-        persistent_menu = await get_persistent_menu(chat_id)
-        await message.answer(
-            return_message,
-            reply_markup=persistent_menu,
-            parse_mode=ParseMode.HTML
-        )
-        await logs(f"Message processed for user {chat_id}", type_e="info")
+        await deliver_answer(message, chat_id, return_message)
+        await logs("Message processed for user %s", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error in private_message_handler for user {chat_id}: {e}", type_e="error")
 
@@ -34,8 +33,50 @@ async def private_message_handler(message: types.Message):
 )
 async def group_message_handler(message: types.Message):
     try:
+        if await queue_large_document(message, message.from_user.id):
+            return
         return_message = await handle_message(message)
-        await message.reply(return_message, parse_mode=ParseMode.HTML)
-        await logs(f"Group message processed for chat {message.chat.id}", type_e="info")
+        await deliver_answer(message, message.from_user.id, return_message)
+        await logs("Group message processed for chat %s", message.chat.id, type_e="info")
     except Exception as e:
-        await logs(f"Error in group_message_handler for chat {message.chat.id}: {e}", type_e="error")
\ No newline at end of file
+        await logs(f"Error in group_message_handler for chat {message.chat.id}: {e}", type_e="error")
+
+async def deliver_answer(message: types.Message, chat_id: int, return_message: str):
+    """
+    Sends the answer to a message: with the persistent menu in private chats, as a reply in groups
+    """
+    if message.chat.type == ChatType.PRIVATE:
+        persistent_menu = await get_persistent_menu(chat_id)
+        await message.answer(
+            return_message,
+            reply_markup=persistent_menu,
+            parse_mode=ParseMode.HTML
+        )
+    else:
+        await message.reply(return_message, parse_mode=ParseMode.HTML)
+
+async def queue_large_document(message: types.Message, chat_id: int) -> bool:
+    """
+    Moves processing of large documents to a background job
+    :return: True if the message was queued
+    """
+    if message.content_type != "document" or (message.document.file_size or 0) < JOB_DOCUMENT_MIN_SIZE:
+        return False
+    session = await load_session(chat_id)
+    await enqueue_message_job("document", message, session.lang)
+    return True
+
+async def run_document_job(job: Job):
+    """
+    Background job: answers a large document and delivers the answer to the chat
+    """
+    message = job.message
+    chat_id = message.chat.id if message.chat.type == ChatType.PRIVATE else message.from_user.id
+    # Jobs run outside the dispatcher: without the chat lock the request counters and the history
+    # written from this session would race with the chat's live updates
+    async with chat_isolation.lock(get_chat_state(message.chat.id, message.from_user.id).key):
+        session = await load_session(chat_id)
+        session.processing_message = job.status_message
+        # Until the last attempt a transient AI error fails the job, so it is retried with backoff
+        return_message = await handle_message(message, session=session, retry_errors=job.attempts < job.max_attempts)
+        await deliver_answer(message, chat_id, return_message)
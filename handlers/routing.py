@@ -0,0 +1,27 @@
+from typing import Any
+from aiogram import Router, types
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters import Filter
+from services.routing_index import get_routing_index
+
+routing_router = Router()
+
+class ReplyButton(Filter):
+    """Matches reply-keyboard button texts and passes the routed handler"""
+    async def __call__(self, message: types.Message) -> bool | dict:
+        handler = get_routing_index().reply_handler(message.text)
+        return {"routed_handler": handler} if handler else False
+
+class RoutedCallback(Filter):
+    """Matches callback queries with a registered prefix and passes the routed handler"""
+    async def __call__(self, query: types.CallbackQuery) -> bool | dict:
+        handler = get_routing_index().callback_handler(query.data)
+        return {"routed_handler": handler} if handler else False
+
+@routing_router.message(ReplyButton())
+async def dispatch_reply_button(message: types.Message, routed_handler: CallableObject, **data: Any):
+    return await routed_handler.call(message, **data)
+
+@routing_router.callback_query(RoutedCallback())
+async def dispatch_callback(query: types.CallbackQuery, routed_handler: CallableObject, **data: Any):
+    return await routed_handler.call(query, **data)
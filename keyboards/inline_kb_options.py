@@ -19,7 +19,7 @@ async def get_options_inline(chat_id: int) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['options']['add_check'], callback_data="options:add_check")],
         [InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['options']['close'], callback_data="settings:close")]
     ])
-    await logs(f"Inline options menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline options menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def get_generation_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -80,7 +80,7 @@ async def get_generation_inline(chat_id: int) -> InlineKeyboardMarkup:
         back_button
     ]
 
-    await logs(f"Inline 'generation' menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline 'generation' menu successfully created for user %s", chat_id, type_e="info")
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 async def get_generate_image_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -93,7 +93,7 @@ async def get_generate_image_inline(chat_id: int) -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['options']['back'], callback_data="options:back")]
     ])
-    await logs(f"Inline image generation menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline image generation menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def get_add_check_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -109,7 +109,7 @@ async def get_add_check_inline(chat_id: int) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['options']['manual_entry'], web_app=WebAppInfo(url=webapp_url_with_chat_id)),
         InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['options']['back'], callback_data="options:back")]
     ])
-    await logs(f"Inline add check menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline add check menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def get_add_check_accept_inline(chat_id: int, user_text_input: list = None) -> InlineKeyboardMarkup:
@@ -138,7 +138,7 @@ async def get_add_check_accept_inline(chat_id: int, user_text_input: list = None
         InlineKeyboardButton(text="📝", web_app=WebAppInfo(url=web_url_with_all_data)),
         InlineKeyboardButton(text="❌", callback_data="options:cancel")],
     ])
-    await logs(f"Inline check confirmation menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline check confirmation menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def get_continue_add_check_accept_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -152,5 +152,5 @@ async def get_continue_add_check_accept_inline(chat_id: int) -> InlineKeyboardMa
         [InlineKeyboardButton(text="✅", callback_data="options:add_check:"),
         InlineKeyboardButton(text="❌", callback_data="options:close")],
     ])
-    await logs(f"Inline continue check confirmation menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline continue check confirmation menu successfully created for user %s", chat_id, type_e="info")
     return kb
\ No newline at end of file
@@ -1,5 +1,5 @@
 import calendar
-from datetime import date
+from datetime import date, datetime
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from services.db_utils import read_user_all_data
@@ -21,7 +21,7 @@ async def get_profile_inline(chat_id: int) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['profile']['check_report'], callback_data="profile:check_report")],
         [InlineKeyboardButton(text=MESSAGES[lang]['inline_kb']['profile']['close'], callback_data="settings:close")]
     ])
-    await logs(f"Inline profile menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline profile menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def get_limits_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -39,9 +39,13 @@ async def get_limits_inline(chat_id: int) -> InlineKeyboardMarkup:
         if not lang:
             lang = DEFAULT_LANGUAGES
 
-        # Get number of requests and tokens, list of limits and category
-        tokens = user_data.get("tokens")
-        requests = user_data.get("requests")
+        # The counters check_user_limits enforces; they are reset by the first request of a new day
+        date_requests = user_data.get("date_requests")
+        if date_requests and date_requests.strftime("%Y-%m-%d") == datetime.now().strftime("%Y-%m-%d"):
+            tokens = user_data.get("tokens") or 0
+            requests = user_data.get("requests") or 0
+        else:
+            tokens = requests = 0
         which_list = user_data.get("in_limit_list")
 
         lost_req = LIMITS[which_list][0] - requests
@@ -61,7 +65,7 @@ async def get_limits_inline(chat_id: int) -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text=MESSAGES[lang]['settings_back'], callback_data="profile:back")]
         ])
 
-        await logs(f"Inline limits successfully executed for chat_id {chat_id}", type_e="info")
+        await logs("Inline limits successfully executed for chat_id %s", chat_id, type_e="info")
         return kb, message_to_send
     except Exception as e:
         await logs(f"Error in command_limits: {e}", type_e="error")
@@ -84,7 +88,7 @@ async def get_check_report_inline(chat_id: int) -> InlineKeyboardMarkup:
          InlineKeyboardButton(text=MESSAGES[lang]['calendar']['your_period'], callback_data=PeriodCB(mode="custom", value="your_period").pack())],
         [InlineKeyboardButton(text=MESSAGES[lang]['settings_back'], callback_data="profile:back")]
     ])
-    await logs(f"Inline check report menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline check report menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def create_day_keyboard(year: int, month: int, chat_id: int, lang: str):
@@ -145,7 +149,7 @@ async def create_day_keyboard(year: int, month: int, chat_id: int, lang: str):
 
         builder.row(btn_prev, btn_mid, btn_next)
         builder.row(btn_back)
-        await logs(f"Inline calendar successfully created for user {chat_id}", type_e="info")
+        await logs("Inline calendar successfully created for user %s", chat_id, type_e="info")
 
         return builder.as_markup()
     except Exception as e:
@@ -174,7 +178,7 @@ async def get_report_inline(chat_id: int, lang: str, start_date, end_date) -> In
             #  InlineKeyboardButton(text="CSV", callback_data=ReportСB(report_type="csv", start_date=start_date, end_date=end_date).pack())],
             [InlineKeyboardButton(text=MESSAGES[lang]['settings_back'], callback_data="profile:back")]
         ])
-        await logs(f"Inline report menu successfully created for user {chat_id}", type_e="info")
+        await logs("Inline report menu successfully created for user %s", chat_id, type_e="info")
         return kb
     except Exception as e:
         await logs(f"Error in get_report_inline: {e}", type_e="error")
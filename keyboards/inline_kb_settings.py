@@ -28,7 +28,7 @@ async def get_settings_inline(chat_id: int) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=MESSAGES[lang]['settings_interface_language'], callback_data="settings:interface_language")],
         [InlineKeyboardButton(text=MESSAGES[lang]['settings_close'], callback_data="settings:close")]
     ])
-    await logs(f"Inline settings menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline settings menu successfully created for user %s", chat_id, type_e="info")
     return kb
 
 async def get_model_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -69,7 +69,7 @@ async def get_model_inline(chat_id: int) -> InlineKeyboardMarkup:
         text=MESSAGES[lang]['settings_back'], callback_data="settings:back"
     )])
 
-    await logs(f"Inline model selection menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline model selection menu successfully created for user %s", chat_id, type_e="info")
     return InlineKeyboardMarkup(inline_keyboard=inline_rows)
 
 async def get_answer_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -98,7 +98,7 @@ async def get_answer_inline(chat_id: int) -> InlineKeyboardMarkup:
         callback_data="settings:back"
     )])
     
-    await logs(f"Inline 'answer' menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline 'answer' menu successfully created for user %s", chat_id, type_e="info")
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 async def get_role_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -139,7 +139,7 @@ async def get_role_inline(chat_id: int) -> InlineKeyboardMarkup:
         callback_data="settings:back"
     )])
 
-    await logs(f"Inline roles menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline roles menu successfully created for user %s", chat_id, type_e="info")
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 async def get_user_role_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -212,7 +212,7 @@ async def get_generation_inline(chat_id: int) -> InlineKeyboardMarkup:
         back_button
     ]
 
-    await logs(f"Inline 'generation' menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline 'generation' menu successfully created for user %s", chat_id, type_e="info")
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 async def get_language_inline(chat_id: int) -> InlineKeyboardMarkup:
@@ -229,5 +229,5 @@ async def get_language_inline(chat_id: int) -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="🇪🇸 Español", callback_data="lang:es")],
         [InlineKeyboardButton(text=MESSAGES[lang]['settings_back'], callback_data="settings:back")]
     ])
-    await logs(f"Inline languages menu successfully created for user {chat_id}", type_e="info")
+    await logs("Inline languages menu successfully created for user %s", chat_id, type_e="info")
     return kb
\ No newline at end of file
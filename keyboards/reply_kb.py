@@ -25,7 +25,7 @@ async def get_persistent_menu(chat_id: int, user_settings=None) -> ReplyKeyboard
             is_persistent=True
         )
         
-        await logs(f"Persistent menu created for user {chat_id}", type_e="info")
+        await logs("Persistent menu created for user %s", chat_id, type_e="info")
         return menu
     except Exception as e:
         await logs(f"Module: reply_kb. Error in get_persistent_menu for user {chat_id}: {e}", type_e="error")
@@ -0,0 +1,142 @@
+"""
+Alert queue between logs() and the info bot.
+
+logs() only pushes warnings and errors here and returns. A background task
+sends them: the first occurrence of an alert goes out on the next flush,
+repeats of the same alert (same text once numbers and IDs are masked) are
+counted and sent as one digest per ALERT_DIGEST_WINDOW, e.g.
+"x120 in the last 60s: Error in handle_message ... 429". At most
+ALERT_MAX_PER_MINUTE messages are sent; the rest are merged into one message.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable
+from config.config import ALERT_FLUSH_INTERVAL, ALERT_DIGEST_WINDOW, ALERT_MAX_PER_MINUTE, ALERT_MAX_PENDING
+
+# Telegram message length limit
+MAX_MESSAGE_LENGTH = 4096
+
+_VOLATILE = re.compile(r"0x[0-9a-fA-F]+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}|\d+")
+
+def fingerprint(kind: str, text: str) -> str:
+    """
+    Identifies alerts that differ only in numbers, IDs and addresses
+    """
+    normalized = _VOLATILE.sub("#", text)[:300]
+    return hashlib.sha1(f"{kind}:{normalized}".encode("utf-8", "replace")).hexdigest()
+
+class _Alert:
+    __slots__ = ("kind", "sample", "count", "first_seen")
+
+    def __init__(self, kind: str, sample: str, now: float):
+        self.kind = kind
+        self.sample = sample
+        self.count = 1
+        self.first_seen = now
+
+class AlertQueue:
+    """
+    Collects alerts without blocking the caller and sends them in batches
+    """
+    def __init__(self, send: Callable[[str], Awaitable[None]]):
+        self._send = send
+        self._pending: dict[str, _Alert] = {}
+        self._last_sent: dict[str, float] = {}
+        self._sent_times: deque = deque()
+        self._task: asyncio.Task | None = None
+        self._stats = {"received": 0, "sent": 0, "collapsed": 0, "dropped": 0}
+
+    def push(self, kind: str, text: str):
+        """
+        Registers an alert; never awaits and never sends from the caller
+        :param kind: Alert type shown in the message (Error, Warning)
+        :param text: Alert text
+        """
+        self._stats["received"] += 1
+        key = fingerprint(kind, text)
+        alert = self._pending.get(key)
+        if alert is not None:
+            alert.count += 1
+            self._stats["collapsed"] += 1
+        elif len(self._pending) >= ALERT_MAX_PENDING:
+            self._stats["dropped"] += 1
+        else:
+            self._pending[key] = _Alert(kind, text, time.monotonic())
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="alert-sender")
+
+    async def stop(self):
+        """
+        Stops the sender and sends everything still pending
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._flush(final=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(ALERT_FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception as e:
+                # Never through logs(): that would queue yet another alert
+                logging.getLogger(__name__).error(f"Alert flush failed: {e}")
+
+    def _due(self, now: float, final: bool) -> list:
+        """Takes the alerts that should be sent now out of the pending ones"""
+        due = []
+        for key, alert in list(self._pending.items()):
+            last_sent = self._last_sent.get(key)
+            # First occurrence goes out at once, repeats wait for the end of the window
+            if final or last_sent is None or now - last_sent >= ALERT_DIGEST_WINDOW:
+                del self._pending[key]
+                self._last_sent[key] = now
+                due.append(alert)
+        for key in [k for k, sent_at in self._last_sent.items() if now - sent_at >= ALERT_DIGEST_WINDOW and k not in self._pending]:
+            del self._last_sent[key]
+        return due
+
+    def _format(self, alert: _Alert, now: float) -> str:
+        if alert.count == 1:
+            return f"Type message: {alert.kind}\n{alert.sample}"
+        seconds = max(1, int(now - alert.first_seen))
+        return f"Type message: {alert.kind}\nx{alert.count} in the last {seconds}s: {alert.sample}"
+
+    async def _flush(self, final: bool = False):
+        now = time.monotonic()
+        texts = [self._format(alert, now) for alert in self._due(now, final)]
+        if self._stats["dropped"] and final:
+            texts.append(f"Type message: Warning\n{self._stats['dropped']} alerts were dropped, the queue was full")
+        if not texts:
+            return
+
+        while self._sent_times and now - self._sent_times[0] >= 60:
+            self._sent_times.popleft()
+        budget = max(1, ALERT_MAX_PER_MINUTE - len(self._sent_times))
+        if len(texts) > budget:
+            # Over the rate limit: the overflow goes out as one combined message
+            texts = texts[:budget - 1] + ["\n\n".join(texts[budget - 1:])]
+
+        for text in texts:
+            if len(text) > MAX_MESSAGE_LENGTH:
+                text = text[:MAX_MESSAGE_LENGTH - 3] + "..."
+            try:
+                await self._send(text)
+                self._stats["sent"] += 1
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Alert not sent: {e}")
+            self._sent_times.append(time.monotonic())
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending": len(self._pending)}
@@ -1,41 +1,193 @@
+import atexit
+import gzip
 import logging
-import asyncio
+import logging.handlers
 import os
-from config.config import LOGGING_FILE_PATH, LOGGING_SETTINGS_TO_SEND
+import queue
+import shutil
+import sys
+from config.config import (
+    LOGGING_FILE_PATH,
+    LOGGING_SETTINGS_TO_SEND,
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_ROTATION,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_ROTATION_WHEN,
+    LOG_COMPRESS
+)
+from logs.alerts import AlertQueue
 _initialized = False
+_listener = None
+_log_file_suffix = None
+_record_listeners = []
+_loggers = {}
+# level -> module -> number of records, exposed as bot_log_events_total
+_log_events = {"warning": {}, "error": {}}
 
 # Updated to avoid circular imports
 _info_bot = None
 
-async def init_logging():
-    global _initialized
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR
+}
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records into the queue unformatted: the message is built by the
+    listener thread, so formatting never runs on the event loop
+    """
+    def prepare(self, record):
+        return record
+
+def set_log_file_suffix(suffix: str):
+    """
+    Makes this process write to its own log file (e.g. worker processes),
+    so several processes never rotate the same file. Call before the first log.
+    """
+    global _log_file_suffix
+    _log_file_suffix = suffix
+
+def _log_file_path(path: str = None) -> str:
+    path = path or LOGGING_FILE_PATH
+    if not _log_file_suffix:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{_log_file_suffix}{ext}"
+
+def _compress_rotated(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def _file_handler(path: str) -> logging.Handler:
+    if LOG_ROTATION == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATION_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    if LOG_COMPRESS:
+        # Rotation runs in the listener thread, so compressing doesn't block the bot
+        handler.namer = lambda name: f"{name}.gz"
+        handler.rotator = _compress_rotated
+    return handler
+
+def setup_logging():
+    """
+    Routes all records through a queue to a background listener thread that
+    writes them to the console and to the rotated log file
+    """
+    global _initialized, _listener
     if _initialized:
         return
 
-    await asyncio.sleep(0)  # To maintain asynchronous interface
-
-    # Ensure log directory exists
-    log_dir = os.path.dirname(LOGGING_FILE_PATH)
-    if not os.path.exists(log_dir):
+    path = _log_file_path()
+    log_dir = os.path.dirname(path)
+    if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir, exist_ok=True)
-    
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(LOGGING_FILE_PATH, encoding="utf-8")
-        ],
-        force=True
-    )
+
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    handlers = [logging.StreamHandler(), _file_handler(path)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL.upper())
+    # Per-module levels, e.g. {"services.handle_message": "DEBUG", "aiogram.event": "WARNING"}
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    atexit.register(stop_logging)
     _initialized = True
 
+def stop_logging():
+    """
+    Writes out the queued records and stops the listener thread
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for listener in _record_listeners:
+        listener.stop()
+    _record_listeners.clear()
+
+def open_record_file(name: str, path: str) -> logging.Logger:
+    """
+    Returns a logger that writes bare messages (e.g. JSON lines) to its own
+    rotated file, through its own listener thread. Not propagated to the main log.
+    :param name: Logger name
+    :param path: File path; worker processes get their suffix like the main log
+    """
+    if not _initialized:
+        setup_logging()
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    path = _log_file_path(path)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = _file_handler(path)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    record_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(record_queue, handler)
+    listener.start()
+    _record_listeners.append(listener)
+    logger.addHandler(_DeferredQueueHandler(record_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+async def init_logging():
+    setup_logging()
+
+def _level_of(type_e: str) -> int:
+    level = LEVELS.get(type_e)
+    if level is None:
+        level = next((value for key, value in LEVELS.items() if key in type_e), logging.INFO)
+    return level
+
+async def _send_alert(text: str):
+    await send_info_msg(
+        text=text,
+        message_thread_id=LOGGING_SETTINGS_TO_SEND["message_thread_id"],
+        info_bot=_info_bot
+    )
+
+# Warnings and errors reach the info bot through this queue, see logs/alerts.py
+alert_queue = AlertQueue(_send_alert)
+
 async def set_info_bot(bot):
     """Set the info bot instance to use for logging"""
     global _info_bot
     _info_bot = bot
+    alert_queue.start()
     await logs("Info_bot for logging set successfully", type_e="info")
 
+async def flush_alerts():
+    """Sends the queued alerts; called before the info bot session is closed"""
+    await alert_queue.stop()
+
+def get_log_stats() -> dict:
+    """
+    Returns the number of warnings and errors logged by each module
+    """
+    return {level: dict(modules) for level, modules in _log_events.items()}
+
 async def send_info_msg(text=None, message_thread_id=None, info_bot=None, chat_id=None):
     """
     Function for sending a message to the logging bot
@@ -59,25 +211,31 @@ async def send_info_msg(text=None, message_thread_id=None, info_bot=None, chat_i
             # Log that we couldn't send the message due to missing bot instance
             logging.warning("Could not send info message - info_bot instance not provided")
     except Exception as e:
-        await logs(f"Module: logs. Error sending message: {e}", type_e="error")
-
-async def logs(message: str, type_e: str, *args, **kwargs: str):
-    await init_logging()
-    if "info" in type_e:  
-        logging.info(message, *args, extra=kwargs)
-    elif "error" in type_e:
-        logging.error(message, *args, extra=kwargs)
-        # Import here to avoid circular import
-        await send_info_msg(
-            text=f'Type message: Error\n{message}', 
-            message_thread_id=LOGGING_SETTINGS_TO_SEND["message_thread_id"],
-            info_bot=_info_bot
-        )
-    elif "warning" in type_e:
-        logging.warning(message, *args, extra=kwargs)
-        # Import here to avoid circular import
-        await send_info_msg(
-            text=f'Type message: Warning\n{message}', 
-            message_thread_id=LOGGING_SETTINGS_TO_SEND["message_thread_id"],
-            info_bot=_info_bot
-        )
\ No newline at end of file
+        # Not through logs(): a failed alert must not raise another alert
+        logging.getLogger(__name__).error(f"Module: logs. Error sending message: {e}")
+
+async def logs(message: str, *args, type_e: str, **kwargs: str):
+    """
+    Logs a message with the logger of the calling module.
+    Disabled levels return right away, before a record is created; with %-style args
+    (logs("Answer for %s: %s", chat_id, answer, type_e="debug")) the message isn't formatted either.
+    """
+    if not _initialized:
+        setup_logging()
+    module = sys._getframe(1).f_globals.get("__name__", "root")
+    logger = _loggers.get(module)
+    if logger is None:
+        logger = _loggers[module] = logging.getLogger(module)
+    level = _level_of(type_e)
+    if not logger.isEnabledFor(level):
+        return
+
+    logger.log(level, message, *args, extra=kwargs)
+    if level >= logging.WARNING and args:
+        message = message % args
+    if level == logging.ERROR:
+        _log_events["error"][module] = _log_events["error"].get(module, 0) + 1
+        alert_queue.push("Error", message)
+    elif level == logging.WARNING:
+        _log_events["warning"][module] = _log_events["warning"].get(module, 0) + 1
+        alert_queue.push("Warning", message)
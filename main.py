@@ -1,22 +1,33 @@
 import asyncio
-import tracemalloc
 import contextlib
 import signal
 import sys
 import os
 import asyncio
 import traceback
-import threading
-import django
 from aiogram.types import BotCommand, BotCommandScopeAllPrivateChats, BotCommandScopeAllGroupChats
-from services import sysmonitoring, telegram_bot_init, db_utils
-from handlers import callbacks_settings, callbacks_options, callbacks_profile, commands, messages
-from logs.log import logs, set_info_bot
+from services import telegram_bot_init, db_utils, media_cache
+from handlers import callbacks_settings, callbacks_options, callbacks_profile, commands, messages, routing, admin
+from logs.log import logs, set_info_bot, flush_alerts
 from pathlib import Path
 from hypercorn.asyncio import serve
 from hypercorn.config import Config
 from hypercorn.middleware import ProxyFixMiddleware
-from config.config import DEBUG_WEBAPP
+from config.config import DEBUG_WEBAPP, UPDATES_MODE, WORKER_PROCESSES, METRICS_ENABLED, LOOP_WATCHDOG_ENABLED
+from services import supervisor
+from services.asgi_routes import web_routes
+from services.webhook import WebhookIngress
+from services.fsm_storage import PostgresStorage, run_fsm_janitor
+from services.job_queue import run_job_workers
+from services import health, metrics
+from services.debug_endpoints import register_debug_routes
+from services.resource_sampler import resource_sampler
+from services.loop_watchdog import loop_watchdog
+from services import usage_ledger
+from services.config_reload import run_config_watcher
+from services.lazy_modules import lazy_module
+
+django = lazy_module("django")
 
 async def set_commands(bot):
     """Set bot commands for different scopes"""
@@ -33,13 +44,25 @@ async def set_commands(bot):
     await bot.set_my_commands(private_commands, scope=BotCommandScopeAllPrivateChats())
     await bot.set_my_commands(group_commands, scope=BotCommandScopeAllGroupChats())
 
+def setup_dispatchers(dp, info_dp):
+    dp.include_router(commands.commands_router)
+    # Reply-keyboard buttons and prefixed callbacks of all modules below are dispatched here
+    dp.include_router(routing.routing_router)
+    dp.include_router(callbacks_settings.callbacks_settings_router)
+    dp.include_router(callbacks_options.callbacks_options_router)
+    dp.include_router(callbacks_profile.callbacks_profile_router)
+    dp.include_router(messages.messages_router)
+    info_dp.include_router(admin.admin_router)
+
 @contextlib.asynccontextmanager
-async def database_connection(bot, info_bot):
+async def database_connection(bot, info_bot, pool_share=1):
     try:
-        await db_utils.create_pool()
+        await db_utils.create_pool(pool_share)
         await db_utils.create_connection()
         yield
     finally:
+        # Pending alerts go out while the info bot session is still open
+        await flush_alerts()
         try:
             await db_utils.close_connection()
         except Exception:
@@ -52,7 +75,7 @@ async def database_connection(bot, info_bot):
             if hasattr(b, "session"):
                 await b.session.close()
 
-async def run_web_app(shutdown_event: asyncio.Event):
+async def run_web_app(stop_event: asyncio.Event):
     BASE_DIR = Path(__file__).resolve().parent
     DJANGO_PROJECT_ROOT = BASE_DIR / "webapp"
     sys.path.insert(0, str(DJANGO_PROJECT_ROOT))
@@ -61,7 +84,7 @@ async def run_web_app(shutdown_event: asyncio.Event):
     django.setup()
 
     from webapp.asgi import application
-    asgi_app = ProxyFixMiddleware(application, mode="legacy", trusted_hops=1)
+    asgi_app = web_routes.wrap(ProxyFixMiddleware(application, mode="legacy", trusted_hops=1))
 
     config = Config()
     config.bind = ["0.0.0.0:5000"]
@@ -71,21 +94,53 @@ async def run_web_app(shutdown_event: asyncio.Event):
         await serve(
             asgi_app,
             config,
-            shutdown_trigger=shutdown_event.wait
+            shutdown_trigger=stop_event.wait
         )
     finally:
         await logs("Django/Hypercorn web server has stopped", type_e="info")
 
+def register_service_endpoints(update_tasks, ingresses, fsm_storages, sharded):
+    """
+    Serves /metrics, /healthz and /readyz on the web server
+    """
+    async def check_updates():
+        stopped = [task.get_name() for task in update_tasks if task.done()]
+        stopped += [f"webhook-{ingress.name}" for ingress in ingresses if not ingress.running]
+        if sharded:
+            stopped += [process.name for process in supervisor.worker_pool.processes if not process.is_alive()]
+        return not stopped, f"stopped: {', '.join(stopped)}" if stopped else f"receiving updates ({UPDATES_MODE})"
+
+    health.add_probe("updates", check_updates, liveness=True)
+    health.register_health_routes()
+    register_debug_routes()
+    if not METRICS_ENABLED:
+        return
+    metrics.register_process_collectors()
+    metrics.register_stats("bot_fsm", lambda: {name: storage.stats() for name, storage in fsm_storages.items()}, label="bot",
+                           counters=("hits", "misses", "writes"))
+    if ingresses:
+        metrics.register_stats("bot_webhook", lambda: {ingress.name: ingress.stats() for ingress in ingresses}, label="bot",
+                               counters=("received", "rejected", "processed", "failed"))
+    if sharded:
+        metrics.register_stats("bot_worker", lambda: {stats["worker"]: stats for stats in supervisor.worker_pool.stats()}, label="worker",
+                               counters=("routed", "processed", "failed"))
+        metrics.REGISTRY.add_collector(supervisor.worker_pool.collect_metrics)
+    metrics.register_metrics_route()
+
 async def on_startup_bot(bot):
     await bot.delete_webhook(drop_pending_updates=True)
     await set_commands(bot)
 
-async def main():
-    tracemalloc.start()
+async def on_startup_webhook(ingress: WebhookIngress):
+    await ingress.set_webhook()
+    await set_commands(ingress.bot)
 
+async def main():
     bot, dp, info_bot, info_dp = await telegram_bot_init.initialize_bots()
 
     loop = asyncio.get_running_loop()
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
     shutdown_event = asyncio.Event()
     if sys.platform == "win32":
         signal.signal(signal.SIGINT,  lambda *_: shutdown_event.set())
@@ -97,53 +152,98 @@ async def main():
             except (NotImplementedError, ValueError):
                 pass
 
-    async with database_connection(bot, info_bot):
+    # In supervisor mode this process only receives updates and serves the web app,
+    # the main bot's updates are handled by worker processes sharded by chat_id
+    sharded = WORKER_PROCESSES > 1
+    async with database_connection(bot, info_bot, pool_share=WORKER_PROCESSES + 1 if sharded else 1):
         await db_utils.init_db_tables()
 
-        dp.include_router(commands.commands_router)
-        dp.include_router(callbacks_settings.callbacks_settings_router)
-        dp.include_router(callbacks_options.callbacks_options_router)
-        dp.include_router(callbacks_profile.callbacks_profile_router)
-        dp.include_router(messages.messages_router)
-
-        poll_main = asyncio.create_task(
-            dp.start_polling(
-                bot,
-                on_startup=lambda: on_startup_bot(bot),
-                handle_signals=False,
-                close_bot_session=False,
-            )
-        )
-        poll_info = asyncio.create_task(
-            info_dp.start_polling(
-                info_bot,
-                on_startup=lambda: on_startup_bot(info_bot),
-                handle_signals=False,
-                close_bot_session=False,
-            )
-        )
+        setup_dispatchers(dp, info_dp)
 
-        await set_info_bot(info_bot)
+        if sharded:
+            supervisor.worker_pool = supervisor.WorkerPool(WORKER_PROCESSES)
+            supervisor.worker_pool.start()
 
-        web_task = asyncio.create_task(run_web_app(shutdown_event))
+        ingresses = []
+        update_tasks = []
+        if UPDATES_MODE == "webhook":
+            if sharded:
+                ingresses = [supervisor.ShardedWebhookIngress("main", dp, bot, supervisor.worker_pool)]
+            else:
+                ingresses = [WebhookIngress("main", dp, bot)]
+            ingresses.append(WebhookIngress("info", info_dp, info_bot))
+            for ingress in ingresses:
+                ingress.start()
+        else:
+            if sharded:
+                await set_commands(bot)
+                update_tasks.append(asyncio.create_task(supervisor.worker_pool.poll_updates(bot, dp), name="polling-main"))
+            else:
+                update_tasks.append(asyncio.create_task(
+                    dp.start_polling(
+                        bot,
+                        on_startup=lambda: on_startup_bot(bot),
+                        handle_signals=False,
+                        close_bot_session=False,
+                    ),
+                    name="polling-main"
+                ))
+            update_tasks.append(asyncio.create_task(
+                info_dp.start_polling(
+                    info_bot,
+                    on_startup=lambda: on_startup_bot(info_bot),
+                    handle_signals=False,
+                    close_bot_session=False,
+                ),
+                name="polling-info"
+            ))
+        await logs(f"Updates are received in {UPDATES_MODE} mode" + (f" by {WORKER_PROCESSES} workers" if sharded else ""), type_e="info")
 
-        th = threading.Thread(
-        target=sysmonitoring.main,
-        name="sysmon",
-        daemon=True
-        )
-        th.start()
+        await set_info_bot(info_bot)
+
+        fsm_storages = {name: d.storage for name, d in (("main", dp), ("info", info_dp)) if isinstance(d.storage, PostgresStorage)}
+        register_service_endpoints(update_tasks, ingresses, fsm_storages, sharded)
+        # Stopped after the webhook ingresses drained, not on shutdown_event: until then they answer 503
+        web_stop_event = asyncio.Event()
+        web_task = asyncio.create_task(run_web_app(web_stop_event))
+        # The endpoints are served by the web server, so Telegram is pointed at them once it runs
+        for ingress in ingresses:
+            await on_startup_webhook(ingress)
+        background_tasks = [
+            asyncio.create_task(media_cache.run_cache_janitor(shutdown_event)),
+            asyncio.create_task(run_fsm_janitor(list(fsm_storages.values()), shutdown_event)),
+            asyncio.create_task(resource_sampler.run(shutdown_event), name="resource-sampler"),
+            asyncio.create_task(usage_ledger.run_usage_writer(shutdown_event), name="usage-writer"),
+            asyncio.create_task(run_config_watcher(shutdown_event), name="config-watcher")
+        ]
+        if not sharded:
+            # In supervisor mode the workers run the jobs of their own chats
+            background_tasks.append(asyncio.create_task(run_job_workers(shutdown_event)))
 
         await shutdown_event.wait()
         await logs("Shutdown signal received", type_e="info")
 
-        await dp.stop_polling()
-        await info_dp.stop_polling()
+        if ingresses:
+            # Every ingress answers 503 from now on while its queue drains
+            await asyncio.gather(*(ingress.stop() for ingress in ingresses))
+        else:
+            if sharded:
+                update_tasks[0].cancel()
+            else:
+                await dp.stop_polling()
+            await info_dp.stop_polling()
+
+        if sharded:
+            await supervisor.worker_pool.stop()
 
+        web_stop_event.set()
         with contextlib.suppress(asyncio.CancelledError):
             await web_task
 
-        await asyncio.gather(poll_main, poll_info, return_exceptions=True)
+        await asyncio.gather(*update_tasks, *background_tasks, return_exceptions=True)
+        # Handlers that finished after the writer stopped
+        await usage_ledger.flush()
+        await loop_watchdog.stop()
 
     await logs("Cleanup finished, exiting.", type_e="info")
 
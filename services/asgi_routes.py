@@ -0,0 +1,72 @@
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+
+MAX_BODY_SIZE = 1024 * 1024
+
+class WebRequest:
+    """
+    Minimal request object passed to the service routes
+    """
+    def __init__(self, scope: dict, body: bytes):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.body = body
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.query_string = scope.get("query_string", b"").decode("latin-1")
+
+class WebResponse:
+    def __init__(self, status: int = 200, body: bytes | str = b"", content_type: str = "text/plain; charset=utf-8", headers: Iterable[Tuple[str, str]] = ()):
+        self.status = status
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.headers = [(b"content-type", content_type.encode("latin-1"))]
+        self.headers.extend((k.encode("latin-1"), v.encode("latin-1")) for k, v in headers)
+
+RouteHandler = Callable[[WebRequest], Awaitable[WebResponse]]
+
+class WebRoutes:
+    """
+    Serves bot service endpoints (webhooks, metrics, health checks) on the same
+    Hypercorn server as Django. Unknown paths are passed to the wrapped ASGI app.
+    """
+    def __init__(self):
+        self._routes: Dict[str, Tuple[frozenset, RouteHandler]] = {}
+
+    def add_route(self, path: str, handler: RouteHandler, methods: Iterable[str] = ("GET",)):
+        self._routes[path] = (frozenset(m.upper() for m in methods), handler)
+
+    def remove_route(self, path: str):
+        self._routes.pop(path, None)
+
+    def wrap(self, app):
+        async def asgi_app(scope, receive, send):
+            route = self._routes.get(scope["path"]) if scope["type"] == "http" else None
+            if route is None:
+                await app(scope, receive, send)
+                return
+            methods, handler = route
+            if scope["method"] not in methods:
+                response = WebResponse(405, "Method Not Allowed", headers=[("allow", ", ".join(sorted(methods)))])
+            else:
+                body = await _read_body(receive)
+                if body is None:
+                    response = WebResponse(413, "Payload Too Large")
+                else:
+                    response = await handler(WebRequest(scope, body))
+            await send({"type": "http.response.start", "status": response.status, "headers": response.headers})
+            await send({"type": "http.response.body", "body": response.body})
+        return asgi_app
+
+async def _read_body(receive) -> bytes | None:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+web_routes = WebRoutes()
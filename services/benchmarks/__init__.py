@@ -0,0 +1,30 @@
+"""
+Micro-benchmarks of hot pure functions.
+
+cases.py builds realistic synthetic inputs (200-item receipts, a year of
+receipt rows for the report) and registers one benchmark per function;
+runner.py times them, measures their allocations and compares the results
+with a baseline file.
+
+    python -m services.benchmarks                      # run everything
+    python -m services.benchmarks -k keyboards         # only names containing "keyboards"
+    python -m services.benchmarks --save-baseline      # write services/benchmarks/baseline.json
+    python -m services.benchmarks --compare --check    # compare, exit 1 on a regression
+
+Timings depend on the machine and the Python version: save the baseline and
+compare on the same host. The benchmarks read MESSAGES from the bot's
+config but never touch the database or the network; the keyboard builders
+get a fixed user record instead of read_user_all_data. Logging below
+warnings is disabled while they run (the log lines are still formatted),
+use --with-logs to keep it.
+
+query_budget.py is the end-to-end counterpart for the database: it counts
+the round trips each update type makes against a local Postgres and checks
+them against DB_QUERY_BUDGETS (python -m services.benchmarks.query_budget).
+report_scaling.py fills checks_analytics with synthetic receipts (10k to
+10M rows) and measures the report of every period preset at each size
+(python -m services.benchmarks.report_scaling).
+startup.py profiles the import time of main and the time until the bots
+first poll, and checks them against STARTUP_BUDGETS
+(python -m services.benchmarks.startup).
+"""
@@ -0,0 +1,83 @@
+"""
+python -m services.benchmarks [options]; see services/benchmarks/__init__.py
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import sys
+from pathlib import Path
+from services.benchmarks import runner
+from services.benchmarks.cases import BENCHMARKS
+
+DEFAULT_BASELINE = str(Path(__file__).with_name("baseline.json"))
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m services.benchmarks", description="Micro-benchmarks of hot pure functions")
+    parser.add_argument("-k", dest="filters", action="append", default=[], help="run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--repeat", type=int, default=7, help="timed runs per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds one run takes at least")
+    parser.add_argument("--gc", action="store_true", help="keep the garbage collector on while timing")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--with-logs", action="store_true", help="keep info and debug logging on")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported as slower/faster")
+    parser.add_argument("--check", action="store_true", help="with --compare: exit 1 if a benchmark got slower or uses more memory")
+    parser.add_argument("--json", dest="json_path", help="also write the raw results to this file")
+    return parser.parse_args(argv)
+
+def selected(filters: list) -> list:
+    return [name for name in BENCHMARKS if not filters or any(part in name for part in filters)]
+
+async def run(args: argparse.Namespace) -> int:
+    names = selected(args.filters)
+    if args.list or not names:
+        print("\n".join(names) if names else "No benchmark matches " + ", ".join(args.filters))
+        return 0 if names else 1
+    if not args.with_logs:
+        # logs() returns before creating a record for disabled levels, so only the message formatting is timed
+        logging.disable(logging.INFO)
+
+    results = {}
+    for name in names:
+        fn = BENCHMARKS[name]()
+        if inspect.isawaitable(fn):
+            fn = await fn
+        results[name] = await runner.run_benchmark(
+            fn, args.min_time, args.repeat, keep_gc=args.gc, memory=not args.no_memory
+        )
+        print(runner.render({name: results[name]}).splitlines()[1], file=sys.stderr)
+
+    comparison = None
+    if args.compare:
+        try:
+            baseline = runner.load_baseline(args.baseline)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}; create it with --save-baseline", file=sys.stderr)
+            return 1
+        if not runner.same_environment(baseline):
+            print(f"Baseline was recorded on {baseline.get('environment')}, this is {runner.environment()}; "
+                  "the ratios are not comparable", file=sys.stderr)
+        comparison = runner.compare(results, baseline, args.threshold)
+
+    print()
+    print(runner.render(results, comparison))
+    if args.save_baseline:
+        runner.save_baseline(args.baseline, results)
+        print(f"\nBaseline written to {args.baseline}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"environment": runner.environment(), "results": results, "comparison": comparison}, f, indent=2)
+    if args.check and comparison:
+        regressions = [name for name, entry in comparison.items() if entry["verdict"] in ("slower", "more memory")]
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
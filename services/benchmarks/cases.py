@@ -0,0 +1,224 @@
+"""
+Benchmarked functions and their synthetic inputs.
+
+@benchmark registers a setup function (plain or async); setup builds the
+inputs and returns the async callable that is timed, so only the selected
+benchmarks pay for their inputs and imports. Inputs come from a seeded random generator and
+are the same on every run.
+"""
+import json
+import random
+from datetime import date, time, timedelta
+from typing import Callable, Dict
+from config.config import DEFAULT_LANGUAGES, MESSAGES
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+CHAT_ID = 100000001
+SEED = 2024
+CATEGORIES = ("Food", "Drinks", "Household", "Hygiene", "Pets", "Electronics", "Clothes", "Other")
+STORES = ("Lidl", "Aldi", "Rewe", "Edeka", "Penny", "Kaufland", "dm", "Rossmann", "MediaMarkt", "IKEA")
+CURRENCIES = ("EUR", "USD")
+# read_user_all_data gives the keyboard builders a record like this one
+USER_DATA = {
+    "user_id": CHAT_ID, "language": DEFAULT_LANGUAGES, "model": "gpt-4o-mini", "context_enabled": True,
+    "web_enabled": False, "set_answer": "moderate", "role": None, "resolution": "1024x1024", "quality": "standard",
+    "in_limit_list": "default_list"
+}
+
+def benchmark(name: str):
+    def register(setup: Callable):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+#_____________________________________________________________
+#___________________________INPUTS____________________________
+#_____________________________________________________________
+def receipt_goods(items: int, rng: random.Random) -> Dict[str, list]:
+    """Goods block of a receipt: category -> ["<name> x <qty> - <price> - <line total>", ...]"""
+    goods: Dict[str, list] = {}
+    for index in range(items):
+        quantity = rng.randint(1, 5)
+        price = round(rng.uniform(0.19, 49.99), 2)
+        goods.setdefault(rng.choice(CATEGORIES), []).append(
+            f"Product {index} {rng.choice(('Bio', 'Classic', 'XL', 'Light', 'Family pack'))} "
+            f"x {quantity} - {price:.2f} - {quantity * price:.2f}"
+        )
+    return goods
+
+def receipt(lang: str, items: int = 200, keys: str = "check_struckture_data_for_db", seed: int = SEED) -> dict:
+    """
+    Receipt as the model returns it, keyed with the names of the language
+    :param keys: check_struckture_data (model answer) or check_struckture_data_for_db (map_keys input)
+    """
+    rng = random.Random(seed)
+    goods = receipt_goods(items, rng)
+    total = sum(float(line.rsplit(" - ", 1)[1]) for lines in goods.values() for line in lines)
+    db_keys = MESSAGES[lang]["check_struckture_data_for_db"]
+    values = dict(zip(db_keys, [
+        "2024-03-15", "18:42:07", rng.choice(STORES), f"{rng.randint(10**8, 10**9)}", "", goods, "", "", f"{total:.2f}", "EUR"
+    ]))
+    if keys == "check_struckture_data_for_db":
+        return values
+    # The model answer uses the display keys; goods sit under the fifth one
+    answer_keys = MESSAGES[lang][keys]
+    answer = {key: values.get(key, "") for key in answer_keys}
+    answer[answer_keys[4]] = goods
+    return answer
+
+def model_answer(lang: str, items: int = 200) -> str:
+    """Model text with the receipt JSON between explanations, as extract_with_recursive_regex gets it"""
+    body = json.dumps(receipt(lang, items, "check_struckture_data"), ensure_ascii=False, indent=2)
+    return f"Here is the recognized receipt {{as requested}}:\n```json\n{body}\n```\nAll prices are in EUR. Let me know if anything is wrong."
+
+def report_rows(days: int = 365, checks_per_day: int = 3, items_per_check: int = 15, seed: int = SEED) -> list:
+    """Rows as read_with_period returns them: one per receipt line, over `days` days up to today"""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=days - 1)
+    rows = []
+    for day in range(days):
+        current = first_day + timedelta(days=day)
+        for check in range(checks_per_day):
+            store = rng.choice(STORES)
+            currency = CURRENCIES[0] if rng.random() < 0.9 else CURRENCIES[1]
+            check_time = time(rng.randint(8, 21), rng.randint(0, 59), rng.randint(0, 59))
+            lines = []
+            for item in range(items_per_check):
+                quantity = rng.randint(1, 5)
+                price = round(rng.uniform(0.19, 49.99), 2)
+                lines.append({
+                    "date": current, "time": check_time, "store": store, "check_id": f"{day}-{check}",
+                    "category": rng.choice(CATEGORIES), "product": f"Product {rng.randint(1, 2000)}",
+                    "quantity": quantity, "price": price, "currency": currency
+                })
+            total = round(sum(line["quantity"] * line["price"] for line in lines), 2)
+            for line in lines:
+                line["total"] = total
+            rows.extend(lines)
+    return rows
+
+def _fixed_user_data(*modules):
+    """The keyboard modules read the user from the database; give them USER_DATA instead"""
+    async def read_user_all_data(chat_id: int):
+        return USER_DATA
+    for module in modules:
+        module.read_user_all_data = read_user_all_data
+
+#_____________________________________________________________
+#_________________________BENCHMARKS__________________________
+#_____________________________________________________________
+@benchmark("utils.map_keys[200 items]")
+def _map_keys():
+    from services.utils import map_keys
+    check = receipt(DEFAULT_LANGUAGES)
+    return lambda: map_keys(check, CHAT_ID, DEFAULT_LANGUAGES)
+
+@benchmark("utils.map_keys[10 receipts x 20]")
+def _map_keys_batch():
+    from services.utils import map_keys
+    checks = [receipt(DEFAULT_LANGUAGES, items=20, seed=SEED + index) for index in range(10)]
+    return lambda: map_keys(checks, CHAT_ID, DEFAULT_LANGUAGES)
+
+@benchmark("utils.dict_to_str[200 items]")
+def _dict_to_str():
+    from services.utils import dict_to_str
+    check = receipt(DEFAULT_LANGUAGES, keys="check_struckture_data")
+    return lambda: dict_to_str(check)
+
+@benchmark("utils.dict_to_str_for_webapp[200 items]")
+def _dict_to_str_for_webapp():
+    from services.utils import dict_to_str_for_webapp
+    goods = receipt_goods(200, random.Random(SEED))
+    return lambda: dict_to_str_for_webapp(goods)
+
+@benchmark("handle_message.extract_json[200 items]")
+def _extract_json():
+    from services.handle_message import extract_with_recursive_regex
+    answer = model_answer(DEFAULT_LANGUAGES)
+    return lambda: extract_with_recursive_regex(answer)
+
+@benchmark("handle_message.extract_json[no json]")
+def _extract_json_missing():
+    from services.handle_message import extract_with_recursive_regex
+    # Prose with unbalanced braces makes the recursive pattern backtrack the most
+    answer = "I could not read the receipt { the photo is blurry. " * 200
+    return lambda: extract_with_recursive_regex(answer)
+
+@benchmark("report.generate_report[month]")
+def _report_month():
+    return _report(days=30)
+
+@benchmark("report.generate_report[year]")
+def _report_year():
+    return _report(days=365)
+
+def _report(days: int):
+    import pandas as pd
+    from services.report_services import generate_report
+    # Built the way process_report_callback does it
+    df = pd.DataFrame(report_rows(days=days))
+    df["date"] = pd.to_datetime(df["date"])
+    end = date.today()
+    start = (end - timedelta(days=days - 1)).isoformat()
+    return lambda: generate_report(df, start, end.isoformat(), DEFAULT_LANGUAGES)
+
+@benchmark("keyboards.settings_menus")
+def _settings_menus():
+    from keyboards import inline_kb_settings as kb
+    _fixed_user_data(kb)
+    builders = (kb.get_settings_inline, kb.get_model_inline, kb.get_answer_inline, kb.get_role_inline,
+                kb.get_generation_inline, kb.get_language_inline)
+
+    async def build():
+        for builder in builders:
+            await builder(CHAT_ID)
+    return build
+
+@benchmark("keyboards.options_menus")
+async def _options_menus():
+    from keyboards import inline_kb_options as kb
+    from services.utils import dict_to_str_for_webapp
+    _fixed_user_data(kb)
+    # The confirmation keyboard gets the receipt fields as _send_receipt_for_confirmation prepares them
+    check = receipt(DEFAULT_LANGUAGES, keys="check_struckture_data")
+    web_app_fields = [check[key] for key in MESSAGES[DEFAULT_LANGUAGES]["check_struckture_data"]]
+    web_app_fields[4] = await dict_to_str_for_webapp(web_app_fields[4])
+
+    async def build():
+        await kb.get_options_inline(CHAT_ID)
+        await kb.get_generation_inline(CHAT_ID)
+        await kb.get_generate_image_inline(CHAT_ID)
+        await kb.get_add_check_inline(CHAT_ID)
+        await kb.get_add_check_accept_inline(CHAT_ID, web_app_fields)
+        await kb.get_continue_add_check_accept_inline(CHAT_ID)
+    return build
+
+@benchmark("keyboards.profile_menus")
+def _profile_menus():
+    from keyboards import inline_kb_profile as kb, reply_kb
+    _fixed_user_data(kb, reply_kb)
+    end = date.today()
+
+    async def build():
+        await kb.get_profile_inline(CHAT_ID)
+        await kb.get_check_report_inline(CHAT_ID)
+        await kb.get_report_inline(CHAT_ID, DEFAULT_LANGUAGES, end - timedelta(days=30), end)
+        await reply_kb.get_persistent_menu(CHAT_ID)
+    return build
+
+@benchmark("keyboards.create_day_keyboard[month]")
+def _calendar_month():
+    from keyboards.inline_kb_profile import create_day_keyboard
+    return lambda: create_day_keyboard(2024, 3, CHAT_ID, DEFAULT_LANGUAGES)
+
+@benchmark("keyboards.create_day_keyboard[12 months]")
+def _calendar_year():
+    from keyboards.inline_kb_profile import create_day_keyboard
+    # Paging through a year, as a user looking for a date does
+    months = [(2024, month) for month in range(1, 13)]
+
+    async def build():
+        for year, month in months:
+            await create_day_keyboard(year, month, CHAT_ID, DEFAULT_LANGUAGES)
+    return build
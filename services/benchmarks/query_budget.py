@@ -0,0 +1,370 @@
+"""
+Query budget: database round trips per update type.
+
+Runs the bot's dispatcher in this process against a local Postgres, the
+fake Bot API and the fake model APIs of services/load_test, and sends
+each flow (start, text, photo, settings toggle, receipt open/recognize/
+accept, report) `--repeat` times, one update at a time. The asyncpg pool
+is wrapped so every query of the update is counted: from pushing the
+update until the bot's answer has arrived and neither the database nor
+the Bot API saw a call for --settle seconds, which takes in the history
+writes and jobs that finish after the answer.
+
+    python -m services.benchmarks.query_budget --repeat 5
+
+Counted per update: pool acquires, statements, round trips (statements
+plus transaction control and the reset query the pool runs on release)
+and the time spent in the database. The medians are checked against
+DB_QUERY_BUDGETS; the exit code is 1 if a flow goes over its budget.
+
+Requires the same config as the load test (TELEGRAM_API_URL,
+OPENAI_BASE_URL and DEEPSEEK_BASE_URL on local ports) and a DB_DSN on
+localhost; the virtual users (IDs from --user-base on) are written to
+that database. Usage events are counted apart, as one ledger flush, since
+the ledger writes them in batches rather than per update. The job
+workers only wake up for enqueued jobs here, so their idle polls of the
+jobs table don't land in the counts.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import re
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+from config.config import (
+    TELEGRAM_API_URL,
+    OPENAI_BASE_URL,
+    DEEPSEEK_BASE_URL,
+    TELEGRAM_BOT_TOKEN,
+    BOT_USERNAME,
+    DEFAULT_LANGUAGES,
+    MESSAGES,
+    DB_DSN,
+    DB_QUERY_BUDGETS
+)
+from services.load_test import local_address, local_database
+from services.load_test.fake_llm import FakeLLMServer
+from services.load_test.fake_telegram import FakeTelegramServer
+from services.load_test.scenarios import (
+    Results,
+    VirtualUser,
+    Done,
+    register_files,
+    llm_reply,
+    ai_answer,
+    any_message,
+    menu_edit,
+    markup_edit,
+    receipt_confirmation
+)
+
+TRANSACTION_CONTROL = re.compile(r"^\s*(BEGIN|START TRANSACTION|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b", re.IGNORECASE)
+# asyncpg resets a connection on release with a query made of these statements
+RESET_STATEMENTS = ("pg_advisory_unlock_all", "CLOSE ALL", "UNLISTEN", "RESET ALL")
+
+#_____________________________________________________________
+#________________________COUNTING POOL________________________
+#_____________________________________________________________
+class Window:
+    """What the database did while one update was processed"""
+    def __init__(self):
+        self.acquires = 0
+        self.statements = 0
+        self.transaction = 0
+        self.resets = 0
+        self.errors = 0
+        self.db_time = 0.0
+        self.queries: Dict[str, int] = {}
+
+    @property
+    def round_trips(self) -> int:
+        return self.statements + self.transaction + self.resets
+
+    def add_query(self, query: str, elapsed: float, failed: bool):
+        self.db_time += elapsed
+        self.errors += failed
+        if TRANSACTION_CONTROL.match(query):
+            self.transaction += 1
+        elif any(statement in query for statement in RESET_STATEMENTS):
+            self.resets += 1
+        else:
+            self.statements += 1
+            statement = " ".join(query.split())[:120]
+            self.queries[statement] = self.queries.get(statement, 0) + 1
+
+class _AcquireContext:
+    """Wraps PoolAcquireContext, so connections are watched however they are acquired"""
+    def __init__(self, counter: "CountingPool", context):
+        self._counter = counter
+        self._context = context
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def _acquire(self):
+        connection = await self._context
+        self._counter.watch(connection)
+        return connection
+
+    async def __aenter__(self):
+        connection = await self._context.__aenter__()
+        self._counter.watch(connection)
+        return connection
+
+    async def __aexit__(self, *exc_info):
+        return await self._context.__aexit__(*exc_info)
+
+class CountingPool:
+    """
+    Stands in for the asyncpg pool of db_utils: counts acquires and, through a query
+    logger on every connection it hands out, the queries, into the current window
+    """
+    def __init__(self, pool):
+        self._pool = pool
+        self.window: Window | None = None
+        self.background = Window()  # queries outside any update
+        self.last_activity = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def _current(self) -> Window:
+        return self.window if self.window is not None else self.background
+
+    def acquire(self, *args, **kwargs):
+        self._current().acquires += 1
+        self.last_activity = time.monotonic()
+        return _AcquireContext(self, self._pool.acquire(*args, **kwargs))
+
+    def watch(self, connection):
+        # A set of callbacks per connection, so adding it again is a no-op
+        connection.add_query_logger(self._on_query)
+
+    def _on_query(self, record):
+        self.last_activity = time.monotonic()
+        self._current().add_query(record.query, record.elapsed, record.exception is not None)
+
+#_____________________________________________________________
+#___________________________FLOWS_____________________________
+#_____________________________________________________________
+# A scenario is a list of (flow, update builder, completion); its flows run in order
+Step = tuple[str, Callable[[VirtualUser], dict], Done]
+
+def _report_callback(user: VirtualUser) -> dict:
+    from handlers.callbacks_data import ReportСB
+    end = date.today()
+    return user.callback(ReportСB(report_type="send_in_chat", start_date=(end - timedelta(days=365)).isoformat(), end_date=end.isoformat()).pack())
+
+SCENARIOS: Dict[str, List[Step]] = {
+    "text": [("text", VirtualUser.text_update, ai_answer)],
+    "photo": [("photo", VirtualUser.photo_update, ai_answer)],
+    "settings": [("settings.toggle", lambda user: user.callback("settings:toggle_context"), markup_edit)],
+    "receipt": [
+        ("receipt.open", lambda user: user.callback("options:add_check"), menu_edit),
+        ("receipt.recognize", VirtualUser.receipt_update, receipt_confirmation),
+        ("receipt.accept", lambda user: user.callback("options:accept:"), any_message),
+    ],
+}
+# Every run has its own user, so the report is preceded by a receipt to read
+SCENARIOS["report"] = SCENARIOS["receipt"] + [("report", _report_callback, menu_edit)]
+
+class BudgetRun:
+    def __init__(self, counter: CountingPool, telegram: FakeTelegramServer, settle: float, step_timeout: float):
+        self.counter = counter
+        self.telegram = telegram
+        self.settle = settle
+        self.step_timeout = step_timeout
+        self.results = Results()
+        self.windows: Dict[str, List[Window]] = {}
+        self.failed: Dict[str, int] = {}
+
+    async def _quiet(self):
+        """Waits until neither the database nor the Bot API was used for `settle` seconds"""
+        deadline = time.monotonic() + self.step_timeout
+        while time.monotonic() < deadline:
+            idle = time.monotonic() - self.counter.last_activity
+            if idle >= self.settle:
+                return
+            await asyncio.sleep(self.settle - idle)
+
+    def on_call(self):
+        self.counter.last_activity = time.monotonic()
+
+    async def measure(self, user: VirtualUser, flow: str, build: Callable[[VirtualUser], dict], done: Done) -> bool:
+        await self._quiet()
+        window = self.counter.window = Window()
+        try:
+            ok = await user.step(flow, build(user), done)
+            await self._quiet()
+        finally:
+            self.counter.window = None
+        if ok:
+            self.windows.setdefault(flow, []).append(window)
+        else:
+            self.failed[flow] = self.failed.get(flow, 0) + 1
+        return ok
+
+def _median(windows: List[Window], metric: Callable[[Window], float]) -> float:
+    return statistics.median(metric(window) for window in windows) if windows else 0
+
+def render(run: BudgetRun, budgets: Dict[str, int]) -> tuple[str, List[str]]:
+    """Budget table and the flows over budget"""
+    lines = [
+        f"{'flow':<20} {'runs':>4} {'failed':>6} {'acquires':>8} {'statements':>10} {'round trips':>11} {'max':>4} "
+        f"{'db ms':>7} {'wall s':>7} {'budget':>6}  verdict"
+    ]
+    over = []
+    flows = list(run.windows) + [flow for flow in run.failed if flow not in run.windows]
+    for flow in flows:
+        windows = run.windows.get(flow, [])
+        round_trips = _median(windows, lambda window: window.round_trips)
+        latencies = [latency for latency, outcome in run.results.steps.get(flow, []) if outcome == "ok"]
+        budget = budgets.get(flow)
+        if not windows:
+            verdict = "no successful run"
+        elif budget is None:
+            verdict = "no budget"
+        elif round_trips > budget:
+            verdict = "OVER"
+            over.append(flow)
+        else:
+            verdict = "ok"
+        lines.append(
+            f"{flow:<20} {len(windows):>4} {run.failed.get(flow, 0):>6} "
+            f"{_median(windows, lambda window: window.acquires):>8g} {_median(windows, lambda window: window.statements):>10g} "
+            f"{round_trips:>11g} {max((window.round_trips for window in windows), default=0):>4} "
+            f"{_median(windows, lambda window: window.db_time) * 1000:>7.1f} "
+            f"{statistics.median(latencies) if latencies else 0:>7.2f} {budget if budget is not None else '-':>6}  {verdict}"
+        )
+    return "\n".join(lines), over
+
+def render_statements(run: BudgetRun, flows: List[str]) -> str:
+    """Statements of the last run of each flow, most frequent first"""
+    lines = []
+    for flow in flows:
+        windows = run.windows.get(flow)
+        if not windows:
+            continue
+        lines.append(f"\n{flow}:")
+        for statement, count in sorted(windows[-1].queries.items(), key=lambda item: -item[1]):
+            lines.append(f"  {count:>3} x {statement}")
+    return "\n".join(lines)
+
+#_____________________________________________________________
+#____________________________MAIN_____________________________
+#_____________________________________________________________
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m services.benchmarks.query_budget", description="DB round trips per update type")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every scenario, each with its own user")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--settle", type=float, default=0.5, help="seconds without DB or Bot API calls that end an update")
+    parser.add_argument("--step-timeout", type=float, default=60, help="seconds to wait for the bot's answer")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per model request")
+    parser.add_argument("--user-base", type=int, default=7_100_000_000, help="user ID of the first virtual user")
+    parser.add_argument("--statements", action="store_true", help="also list the statements of every flow")
+    parser.add_argument("--json", dest="json_path", help="also write the raw counts to this file")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> int:
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenario {', '.join(unknown)}, use {', '.join(SCENARIOS)}")
+    local_database(DB_DSN)
+    lang = DEFAULT_LANGUAGES
+    users: Dict[int, VirtualUser] = {}
+    budget_run: BudgetRun | None = None
+
+    def on_call(token: str, method: str, params: dict):
+        if budget_run is not None:
+            budget_run.on_call()
+        try:
+            user = users.get(int(params.get("chat_id"))) if token == TELEGRAM_BOT_TOKEN else None
+        except (TypeError, ValueError):
+            user = None
+        if user is not None:
+            user.on_call(method, params)
+
+    telegram = FakeTelegramServer(*local_address("TELEGRAM_API_URL", TELEGRAM_API_URL), BOT_USERNAME, on_call)
+    llms = [
+        FakeLLMServer(name, *local_address(setting, url), latency=args.llm_latency, reply=llm_reply(MESSAGES, lang))
+        for name, setting, url in (("openai", "OPENAI_BASE_URL", OPENAI_BASE_URL), ("deepseek", "DEEPSEEK_BASE_URL", DEEPSEEK_BASE_URL))
+    ]
+    register_files(telegram)
+    for server in (telegram, *llms):
+        await server.start()
+
+    # Imported here: they read the config that was checked above
+    from main import setup_dispatchers
+    from services import db_utils, telegram_bot_init, usage_ledger
+    from services import job_queue
+
+    # Enqueuing wakes the workers of this process, so idle polls would only add noise to the counts
+    job_queue.JOB_POLL_INTERVAL = 3600
+    bot, dp, info_bot, info_dp = await telegram_bot_init.initialize_bots()
+    setup_dispatchers(dp, info_dp)
+    await db_utils.create_pool()
+    await db_utils.init_db_tables()
+    counter = db_utils._pool = CountingPool(db_utils._pool)
+    budget_run = BudgetRun(counter, telegram, args.settle, args.step_timeout)
+    shutdown_event = asyncio.Event()
+    background = [
+        asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False), name="polling"),
+        asyncio.create_task(job_queue.run_job_workers(shutdown_event), name="job-workers"),
+    ]
+    ledger = Window()
+    try:
+        await telegram.wait_polling(TELEGRAM_BOT_TOKEN, timeout=30)
+        user_id = args.user_base
+        for scenario in scenarios:
+            for _ in range(args.repeat):
+                # A new user per run keeps every run under the daily limits
+                user = users[user_id] = VirtualUser(user_id, TELEGRAM_BOT_TOKEN, telegram, budget_run.results, lang, args.step_timeout, False)
+                user_id += 1
+                if not await budget_run.measure(user, "start", VirtualUser.start_update, any_message):
+                    continue
+                for flow, build, done in SCENARIOS[scenario]:
+                    if not await budget_run.measure(user, flow, build, done):
+                        break
+            print(f"{scenario}: done", file=sys.stderr)
+        # The usage events of all runs, written as the ledger writes them
+        counter.window = ledger
+        events = await usage_ledger.flush()
+        counter.window = None
+    finally:
+        shutdown_event.set()
+        with contextlib.suppress(RuntimeError):
+            # Not started if the bot never polled
+            await dp.stop_polling()
+        await asyncio.gather(*background, return_exceptions=True)
+        db_utils._pool = counter._pool
+        await db_utils.close_pool()
+        for session_bot in (bot, info_bot):
+            await session_bot.session.close()
+        for server in (telegram, *llms):
+            await server.stop()
+
+    table, over = render(budget_run, DB_QUERY_BUDGETS)
+    print(table)
+    # The query logger doesn't see COPY, so the COPY into usage_events comes on top
+    print(f"\nUsage ledger: {events} events written in {ledger.round_trips} round trips + 1 COPY ({ledger.db_time * 1000:.1f} ms)")
+    print(f"Outside updates: {counter.background.round_trips} round trips")
+    if args.statements:
+        print(render_statements(budget_run, list(budget_run.windows)))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                flow: [{**vars(window), "round_trips": window.round_trips} for window in windows]
+                for flow, windows in budget_run.windows.items()
+            }, f, indent=2)
+    if over:
+        print(f"\nOver budget: {', '.join(over)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
@@ -0,0 +1,285 @@
+"""
+Report scaling: read_with_period + generate_report against growing checks_analytics tables.
+
+Fills a local Postgres with synthetic receipts up to each scale (10k, 100k,
+1M, 10M rows by default) and measures the report of every period preset
+(today, week, current_month, year) the way process_report_callback builds
+it: query latency, report latency, rows transferred and peak RSS. Each
+measurement runs in a fresh process, so its peak RSS is its own.
+
+    python -m services.benchmarks.report_scaling --scales 10k,100k,1m,10m
+    python -m services.benchmarks.report_scaling --scales 1m --reset --explain
+
+Receipts (1-30 lines, one store, date, time and currency each) belong to
+--users synthetic users with IDs from --user-base on. The first one is the
+heavy user that gets --heavy-share of all receipts, the second one a
+typical user with an even share of the rest; both are measured. Dates are
+spread over the last --days days. Filling only tops the table up to the
+next scale, so a run from --reset over the same scales always produces the
+same rows. --reset deletes the synthetic users' rows, nothing else.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, time as day_time, timedelta
+from multiprocessing import get_context
+from config.config import DB_DSN, DEFAULT_LANGUAGES, CHECKS_ANALYTICS
+from services.benchmarks.cases import CATEGORIES, CURRENCIES, STORES
+from services.benchmarks.runner import format_size
+from services.load_test import local_database
+
+PRESETS = ("today", "week", "current_month", "year")
+COLUMNS = ("user_id", "date", "time", "store", "check_id", "category", "product", "quantity", "price", "total", "currency")
+COPY_BATCH = 50_000
+
+def parse_scale(value: str) -> int:
+    """10k, 1m, 2.5M or a plain number of rows"""
+    value = value.strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+#_____________________________________________________________
+#__________________________GENERATOR__________________________
+#_____________________________________________________________
+def synthetic_rows(count: int, seed: int, user_base: int, users: int, heavy_share: float, days: int):
+    """
+    Yields `count` checks_analytics rows, grouped into receipts
+    :param seed: Seeds the generator, so the same arguments give the same rows
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    made = 0
+    receipt = 0
+    while made < count:
+        if users == 1 or rng.random() < heavy_share:
+            user_id = user_base
+        else:
+            user_id = user_base + rng.randint(1, users - 1)
+        day = today - timedelta(days=rng.randrange(days))
+        check_time = day_time(rng.randint(7, 22), rng.randint(0, 59), rng.randint(0, 59))
+        store = rng.choice(STORES)
+        currency = CURRENCIES[0] if rng.random() < 0.9 else CURRENCIES[1]
+        check_id = f"s{seed}-{receipt}"
+        lines = []
+        for _ in range(min(rng.randint(1, 30), count - made)):
+            quantity = rng.randint(1, 5)
+            price = round(rng.uniform(0.19, 49.99), 2)
+            lines.append([user_id, day, check_time, store, check_id, rng.choice(CATEGORIES),
+                          f"Product {rng.randint(1, 5000)}", quantity, price, 0.0, currency])
+        total = round(sum(line[7] * line[8] for line in lines), 2)
+        for line in lines:
+            line[9] = total
+            yield tuple(line)
+        made += len(lines)
+        receipt += 1
+
+async def synthetic_count(connection, user_base: int, users: int) -> int:
+    return await connection.fetchval(
+        f"SELECT count(*) FROM {CHECKS_ANALYTICS} WHERE user_id >= $1 AND user_id < $2", user_base, user_base + users
+    )
+
+async def fill(target: int, user_base: int, users: int, heavy_share: float, days: int) -> tuple[int, float]:
+    """
+    Tops the synthetic rows up to `target`
+    :return: Rows added and the seconds it took
+    """
+    from services.db_utils import get_connection, release_connection
+    connection = await get_connection()
+    try:
+        existing = await synthetic_count(connection, user_base, users)
+        missing = target - existing
+        if missing <= 0:
+            return 0, 0.0
+        started = time.monotonic()
+        # Seeded by the rows already there, so topping up in the same steps repeats the same data
+        rows = synthetic_rows(missing, existing, user_base, users, heavy_share, days)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == COPY_BATCH:
+                await connection.copy_records_to_table(CHECKS_ANALYTICS, records=batch, columns=COLUMNS)
+                batch = []
+        if batch:
+            await connection.copy_records_to_table(CHECKS_ANALYTICS, records=batch, columns=COLUMNS)
+        await connection.execute(f"ANALYZE {CHECKS_ANALYTICS}")
+        return missing, time.monotonic() - started
+    finally:
+        await release_connection(connection)
+
+async def reset(user_base: int, users: int) -> int:
+    from services.db_utils import get_connection, release_connection
+    connection = await get_connection()
+    try:
+        status = await connection.execute(
+            f"DELETE FROM {CHECKS_ANALYTICS} WHERE user_id >= $1 AND user_id < $2", user_base, user_base + users
+        )
+        return int(status.split()[-1])
+    finally:
+        await release_connection(connection)
+
+async def table_info(user_ids: list) -> dict:
+    """Size of checks_analytics, its indexes and the rows of the measured users"""
+    from services.db_utils import get_connection, release_connection
+    connection = await get_connection()
+    try:
+        return {
+            "rows": await connection.fetchval(f"SELECT count(*) FROM {CHECKS_ANALYTICS}"),
+            "size": await connection.fetchval(f"SELECT pg_total_relation_size('{CHECKS_ANALYTICS}')"),
+            "indexes": [row["indexdef"] for row in await connection.fetch(
+                "SELECT indexdef FROM pg_indexes WHERE tablename = $1", CHECKS_ANALYTICS
+            )],
+            "user_rows": {user_id: await connection.fetchval(
+                f"SELECT count(*) FROM {CHECKS_ANALYTICS} WHERE user_id = $1", user_id
+            ) for user_id in user_ids},
+        }
+    finally:
+        await release_connection(connection)
+
+async def explain(user_id: int, start: date, end: date) -> str:
+    """Plan and timing of the report query (the one read_with_period runs)"""
+    from services.db_utils import get_connection, release_connection
+    connection = await get_connection()
+    try:
+        rows = await connection.fetch(f"""
+            EXPLAIN (ANALYZE, BUFFERS)
+            SELECT date, time, store, check_id, category, product, quantity, price, total, currency
+            FROM {CHECKS_ANALYTICS}
+            WHERE user_id = $1 AND date >= $2 AND date <= $3
+        """, user_id, start, end)
+        return "\n".join(row[0] for row in rows)
+    finally:
+        await release_connection(connection)
+
+#_____________________________________________________________
+#_________________________MEASUREMENT_________________________
+#_____________________________________________________________
+def _peak_rss() -> int:
+    try:
+        import resource
+    except ImportError:
+        # Windows: the peak working set is the closest
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+async def _measure(user_id: int, preset: str, lang: str, repeat: int) -> dict:
+    import pandas as pd
+    from services import db_utils
+    from services.report_services import generate_report, preset_period
+    start_date, end_date = (day.isoformat() for day in preset_period(preset, date.today()))
+    await db_utils.create_pool()
+    try:
+        base_rss = _peak_rss()
+        query_times, report_times, rows = [], [], 0
+        for _ in range(repeat):
+            # As process_report_callback does it
+            started = time.perf_counter()
+            data = await db_utils.read_with_period(user_id, start_date, end_date)
+            queried = time.perf_counter()
+            rows = len(data or [])
+            if data:
+                df = pd.DataFrame(data)
+                df['date'] = pd.to_datetime(df['date'])
+                await generate_report(df, start_date, end_date, lang)
+                del df
+            del data
+            query_times.append(queried - started)
+            report_times.append(time.perf_counter() - queried)
+        return {
+            "rows": rows,
+            "query": statistics.median(query_times),
+            "report": statistics.median(report_times),
+            "total": statistics.median(q + r for q, r in zip(query_times, report_times)),
+            "total_max": max(q + r for q, r in zip(query_times, report_times)),
+            "peak_rss": _peak_rss(),
+            "rss_growth": _peak_rss() - base_rss,
+        }
+    finally:
+        await db_utils.close_pool()
+
+def measure_in_process(user_id: int, preset: str, lang: str, repeat: int) -> dict:
+    return asyncio.run(_measure(user_id, preset, lang, repeat))
+
+async def measure(user_id: int, preset: str, lang: str, repeat: int) -> dict:
+    """Runs one measurement in a new process"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return await asyncio.get_running_loop().run_in_executor(executor, measure_in_process, user_id, preset, lang, repeat)
+
+#_____________________________________________________________
+#____________________________MAIN_____________________________
+#_____________________________________________________________
+def render(scale: int, info: dict, results: dict, names: dict) -> str:
+    lines = [
+        f"\n== {scale:,} synthetic rows ({info['rows']:,} in {CHECKS_ANALYTICS}, {format_size(info['size'])}) ==",
+        f"{'user':<8} {'rows':>9} {'preset':<14} {'fetched':>9} {'query s':>8} {'report s':>9} {'total s':>8} {'max s':>7} {'peak RSS':>10} {'growth':>10}"
+    ]
+    for (user_id, preset), result in results.items():
+        lines.append(
+            f"{names[user_id]:<8} {info['user_rows'][user_id]:>9,} {preset:<14} {result['rows']:>9,} {result['query']:>8.3f} "
+            f"{result['report']:>9.3f} {result['total']:>8.3f} {result['total_max']:>7.3f} "
+            f"{format_size(result['peak_rss']):>10} {format_size(result['rss_growth']):>10}"
+        )
+    return "\n".join(lines)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m services.benchmarks.report_scaling", description="Report latency and memory by table size")
+    parser.add_argument("--scales", default="10k,100k,1m,10m", help="synthetic rows to fill up to, comma-separated")
+    parser.add_argument("--presets", default=",".join(PRESETS), help=f"period presets to measure, from {', '.join(PRESETS)}, last_month")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users")
+    parser.add_argument("--user-base", type=int, default=7_200_000_000, help="user ID of the first synthetic user")
+    parser.add_argument("--heavy-share", type=float, default=0.05, help="share of all receipts that belong to the heavy user")
+    parser.add_argument("--days", type=int, default=730, help="receipts are spread over this many days up to today")
+    parser.add_argument("--repeat", type=int, default=3, help="reports per measurement")
+    parser.add_argument("--reset", action="store_true", help="delete the synthetic rows first")
+    parser.add_argument("--explain", action="store_true", help="print the plan of the heavy user's year query at every scale")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> int:
+    from services import db_utils
+    from services.report_services import preset_period
+    local_database(DB_DSN)
+    scales = sorted(parse_scale(value) for value in args.scales.split(","))
+    presets = [preset.strip() for preset in args.presets.split(",") if preset.strip()]
+    heavy, typical = args.user_base, args.user_base + 1
+    names = {heavy: "heavy", typical: "typical"}
+    report = []
+
+    await db_utils.create_pool()
+    try:
+        await db_utils.init_db_tables()
+        if args.reset:
+            print(f"Deleted {await reset(args.user_base, args.users):,} synthetic rows", file=sys.stderr)
+        for scale in scales:
+            added, seconds = await fill(scale, args.user_base, args.users, args.heavy_share, args.days)
+            if added:
+                print(f"Added {added:,} rows in {seconds:.1f}s ({added / seconds:,.0f} rows/s)", file=sys.stderr)
+            info = await table_info([heavy, typical])
+            results = {}
+            for user_id in (heavy, typical):
+                for preset in presets:
+                    results[(user_id, preset)] = await measure(user_id, preset, DEFAULT_LANGUAGES, args.repeat)
+            print(render(scale, info, results, names))
+            if args.explain:
+                print(f"\nPlan of the heavy user's year report:\n{await explain(heavy, *preset_period('year', date.today()))}")
+            report.append({
+                "scale": scale, "table": {key: value for key, value in info.items() if key != "user_rows"},
+                "users": {names[user_id]: rows for user_id, rows in info["user_rows"].items()},
+                "results": [{"user": names[user_id], "preset": preset, **result} for (user_id, preset), result in results.items()],
+            })
+    finally:
+        await db_utils.close_pool()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "scales": report}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
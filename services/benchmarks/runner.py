@@ -0,0 +1,183 @@
+"""
+Timing, allocation measurement and baseline comparison of the benchmarks.
+
+Each benchmark is an async callable without arguments. The runner picks a
+number of loops so one run takes at least min_time, then times `repeat`
+runs with the garbage collector off (as timeit does) and reports the
+per-call min, median and spread. A separate pass under tracemalloc
+measures the peak memory of one call and the bytes still held per call
+afterwards.
+"""
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+
+Benchmark = Callable[[], Awaitable[object]]
+
+async def _timed(fn: Benchmark, loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        await fn()
+    return time.perf_counter() - started
+
+async def calibrate(fn: Benchmark, min_time: float) -> int:
+    """Smallest loop count of the 1-2-5 series whose run takes at least min_time"""
+    for power in range(10):
+        for multiplier in (1, 2, 5):
+            loops = multiplier * 10 ** power
+            if await _timed(fn, loops) >= min_time:
+                return loops
+    return loops
+
+async def measure_time(fn: Benchmark, loops: int, repeat: int, keep_gc: bool = False) -> List[float]:
+    """Per-call seconds of each run"""
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        if not keep_gc:
+            gc.disable()
+        try:
+            runs.append(await _timed(fn, loops) / loops)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    return runs
+
+async def measure_memory(fn: Benchmark, loops: int) -> Dict[str, int]:
+    """
+    Peak bytes allocated during one call, and bytes per call still held after `loops` calls
+    (caches and leaks); tracemalloc slows the calls down, so this runs apart from the timing
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await fn()  # first call outside: lazy imports and caches
+        gc.collect()
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await fn()
+        _, peak = tracemalloc.get_traced_memory()
+        for _ in range(loops - 1):
+            await fn()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak": max(0, peak - before), "retained": max(0, after - before) // max(1, loops)}
+
+async def run_benchmark(fn: Benchmark, min_time: float, repeat: int, keep_gc: bool = False, memory: bool = True) -> dict:
+    await fn()  # warm-up
+    loops = await calibrate(fn, min_time)
+    runs = await measure_time(fn, loops, repeat, keep_gc)
+    median = statistics.median(runs)
+    result = {
+        "loops": loops,
+        "runs": runs,
+        "min": min(runs),
+        "median": median,
+        "spread": (statistics.stdev(runs) / median) if len(runs) > 1 and median else 0.0,
+    }
+    if memory:
+        result.update(await measure_memory(fn, min(loops, 100)))
+    return result
+
+#_____________________________________________________________
+#__________________________BASELINE___________________________
+#_____________________________________________________________
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(terse=True),
+    }
+
+def save_baseline(path: str, results: Dict[str, dict]):
+    """Writes median, min and memory of every benchmark, merged into the existing baseline"""
+    try:
+        baseline = load_baseline(path)
+    except FileNotFoundError:
+        baseline = {"results": {}}
+    baseline["environment"] = environment()
+    baseline["created"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    for name, result in results.items():
+        baseline["results"][name] = {key: result[key] for key in ("median", "min", "peak", "retained") if key in result}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def load_baseline(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float) -> Dict[str, dict]:
+    """
+    Ratio of each result to the baseline and its verdict
+    :param threshold: Relative change that counts as slower/faster (0.1 = 10 %); memory uses the same threshold
+    :return: name -> {"time": ratio, "peak": ratio, "verdict": "slower" / "faster" / "more memory" / "same" / "new"}
+    """
+    comparison = {}
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            comparison[name] = {"verdict": "new"}
+            continue
+        time_ratio = result["median"] / base["median"] if base.get("median") else None
+        # A few hundred bytes of noise make ratios of tiny peaks meaningless
+        peak_ratio = (result["peak"] / base["peak"]) if base.get("peak", 0) >= 1024 and "peak" in result else None
+        verdict = "same"
+        # The spread of the run widens the band, so a noisy benchmark doesn't flag itself
+        band = max(threshold, 2 * result.get("spread", 0.0))
+        if time_ratio is not None and time_ratio > 1 + band:
+            verdict = "slower"
+        elif peak_ratio is not None and peak_ratio > 1 + threshold:
+            verdict = "more memory"
+        elif time_ratio is not None and time_ratio < 1 - band:
+            verdict = "faster"
+        comparison[name] = {"time": time_ratio, "peak": peak_ratio, "verdict": verdict}
+    return comparison
+
+def same_environment(baseline: dict) -> bool:
+    recorded = baseline.get("environment", {})
+    current = environment()
+    return all(recorded.get(key) == current[key] for key in ("python", "implementation", "machine"))
+
+#_____________________________________________________________
+#___________________________REPORT____________________________
+#_____________________________________________________________
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+def render(results: Dict[str, dict], comparison: Dict[str, dict] | None = None) -> str:
+    header = f"{'benchmark':<42} {'median':>10} {'min':>10} {'spread':>7} {'loops':>7} {'peak':>10} {'retained':>9}"
+    if comparison is not None:
+        header += f" {'vs base':>8}  verdict"
+    lines = [header]
+    for name, result in results.items():
+        line = (
+            f"{name:<42} {format_time(result['median']):>10} {format_time(result['min']):>10} "
+            f"{result['spread'] * 100:>6.1f}% {result['loops']:>7} "
+            f"{format_size(result.get('peak', 0)):>10} {format_size(result.get('retained', 0)):>9}"
+        )
+        if comparison is not None:
+            entry = comparison.get(name, {})
+            ratio = entry.get("time")
+            line += f" {f'x{ratio:.2f}' if ratio else '-':>8}  {entry.get('verdict', '')}"
+        lines.append(line)
+    return "\n".join(lines)
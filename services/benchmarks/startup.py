@@ -0,0 +1,252 @@
+"""
+Startup profile: import time per module, time to first poll and the startup budget.
+
+    python -m services.benchmarks.startup                   # import profile of main
+    python -m services.benchmarks.startup --first-poll      # also start main.py until both bots poll
+    python -m services.benchmarks.startup --first-poll --check
+
+The import profile runs `python -X importtime -c "import main"` in fresh
+processes (after one discarded run that writes the bytecode caches) and
+reports the run with the median total: the slowest modules, the time per
+top-level package and every module of STARTUP_LAZY_MODULES that got
+executed anyway, with the chain of imports that pulled it in.
+
+--first-poll starts main.py against the Telegram stub of services.load_test
+(TELEGRAM_API_URL must point at a local address, UPDATES_MODE must be
+polling) and a local Postgres, and measures the seconds from the spawn until
+the main and the info bot both call getUpdates.
+
+--check exits with 1 if a time is over STARTUP_BUDGETS or a lazy module is
+imported on startup.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+from config.config import (
+    DB_DSN,
+    TELEGRAM_API_URL,
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_INFO_BOT_TOKEN,
+    BOT_USERNAME,
+    UPDATES_MODE,
+    STARTUP_BUDGETS,
+    STARTUP_LAZY_MODULES
+)
+from services.load_test import local_address, local_database
+from services.load_test.fake_telegram import FakeTelegramServer
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+# Prints the modules that were executed; a lazy_module that was never touched is still a _LazyModule
+IMPORT_MAIN = (
+    "import json, sys; import main; "
+    "print(json.dumps([name for name, module in sys.modules.items() if type(module).__name__ != '_LazyModule']))"
+)
+
+#_____________________________________________________________
+#___________________________IMPORTS___________________________
+#_____________________________________________________________
+def parse_importtime(output: str) -> List[dict]:
+    """
+    Entries of -X importtime output, in its order (a module after the modules it imported)
+    :return: [{"module", "self", "cumulative" (seconds), "depth", "parent"}]
+    """
+    entries = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append({
+                "module": match.group(4),
+                "self": int(match.group(1)) / 1e6,
+                "cumulative": int(match.group(2)) / 1e6,
+                "depth": len(match.group(3)) // 2,
+                "parent": None,
+            })
+    # Backwards the output is in import order: a module's importer is the last shallower one seen
+    stack = []
+    for entry in reversed(entries):
+        while stack and stack[-1]["depth"] >= entry["depth"]:
+            stack.pop()
+        entry["parent"] = stack[-1]["module"] if stack else None
+        stack.append(entry)
+    return entries
+
+def import_chain(entries: List[dict], module: str) -> List[str]:
+    """Modules from the top-level import down to `module`"""
+    by_module = {entry["module"]: entry for entry in entries}
+    chain = []
+    while module is not None and module not in chain:
+        chain.append(module)
+        module = by_module[module]["parent"] if module in by_module else None
+    return chain[::-1]
+
+def profile_imports() -> dict:
+    """Imports main in a new interpreter; the wall time includes the interpreter's own startup"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_MAIN],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing main failed:\n{completed.stderr[-3000:]}")
+    entries = parse_importtime(completed.stderr)
+    # Only main and what it imported, the block of deeper entries right before it; not the interpreter's startup
+    end = next(index for index, entry in enumerate(entries) if entry["module"] == "main")
+    start = end
+    while start > 0 and entries[start - 1]["depth"] > 0:
+        start -= 1
+    entries = entries[start:end + 1]
+    loaded = set(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "wall": wall,
+        "imports": entries[-1]["cumulative"],
+        "entries": entries,
+        "eager": {module: import_chain(entries, module) for module in STARTUP_LAZY_MODULES if module in loaded},
+    }
+
+def by_package(entries: List[dict]) -> Dict[str, float]:
+    """Self time of every module summed per top-level package"""
+    totals = defaultdict(float)
+    for entry in entries:
+        totals[entry["module"].split(".")[0]] += entry["self"]
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+#_____________________________________________________________
+#_________________________FIRST POLL__________________________
+#_____________________________________________________________
+async def stop_bot(process, timeout: float = 30):
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+async def profile_first_poll(timeout: float) -> dict:
+    """
+    Starts main.py against the Telegram stub
+    :return: Seconds from the spawn until the first getUpdates of each bot, and the import time of that start
+    """
+    telegram = FakeTelegramServer(*local_address("TELEGRAM_API_URL", TELEGRAM_API_URL), BOT_USERNAME)
+    await telegram.start()
+    with tempfile.TemporaryFile() as output:
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-X", "importtime", "main.py", cwd=PROJECT_ROOT, stdout=asyncio.subprocess.DEVNULL, stderr=output
+        )
+        polls = {}
+        try:
+            async def first_poll(name: str, token: str):
+                await telegram.wait_polling(token, timeout=timeout)
+                polls[name] = time.perf_counter() - started
+
+            await asyncio.gather(first_poll("main", TELEGRAM_BOT_TOKEN), first_poll("info", TELEGRAM_INFO_BOT_TOKEN))
+        except asyncio.TimeoutError:
+            output.seek(0)
+            raise SystemExit(f"The bot didn't poll within {timeout:.0f}s:\n{output.read().decode(errors='replace')[-3000:]}")
+        finally:
+            await stop_bot(process)
+            await telegram.stop()
+        output.seek(0)
+        entries = parse_importtime(output.read().decode(errors="replace"))
+    return {
+        "first_poll": max(polls.values()),
+        "polls": polls,
+        "imports": sum(entry["cumulative"] for entry in entries if entry["depth"] == 0),
+    }
+
+#_____________________________________________________________
+#____________________________MAIN_____________________________
+#_____________________________________________________________
+def render(profile: dict, runs: List[float], top: int) -> str:
+    entries = profile["entries"]
+    lines = [
+        f"Importing main: {profile['imports']:.3f}s (median of {len(runs)}, min {min(runs):.3f}s), "
+        f"process {profile['wall']:.3f}s, {len(entries)} modules",
+        "",
+        f"{'slowest modules':<48} {'self s':>8} {'cumul. s':>9}  imported by",
+    ]
+    for entry in sorted(entries, key=lambda entry: entry["cumulative"], reverse=True)[:top]:
+        lines.append(f"{entry['module']:<48} {entry['self']:>8.3f} {entry['cumulative']:>9.3f}  {entry['parent'] or '-'}")
+    lines += ["", f"{'package':<48} {'self s':>8}"]
+    for package, seconds in list(by_package(entries).items())[:top]:
+        lines.append(f"{package:<48} {seconds:>8.3f}")
+    lines.append("")
+    if profile["eager"]:
+        lines.append("Imported on startup although they should load on first use:")
+        lines += [f"  {module}: {' -> '.join(chain)}" for module, chain in profile["eager"].items()]
+    else:
+        lines.append(f"None of {', '.join(STARTUP_LAZY_MODULES)} is imported on startup")
+    return "\n".join(lines)
+
+def over_budget(times: Dict[str, float]) -> List[str]:
+    return [
+        f"{name} {seconds:.2f}s > {STARTUP_BUDGETS[name]:.2f}s"
+        for name, seconds in times.items() if name in STARTUP_BUDGETS and seconds > STARTUP_BUDGETS[name]
+    ]
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m services.benchmarks.startup", description="Startup time of the bot")
+    parser.add_argument("--repeat", type=int, default=5, help="import profiles to take the median of")
+    parser.add_argument("--top", type=int, default=25, help="modules and packages to list")
+    parser.add_argument("--first-poll", action="store_true", help="also start main.py until both bots poll")
+    parser.add_argument("--poll-timeout", type=float, default=60, help="seconds to wait for the first poll")
+    parser.add_argument("--check", action="store_true", help="exit 1 if over STARTUP_BUDGETS or a lazy module is imported")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> int:
+    profile_imports()  # writes the bytecode caches
+    profiles = sorted((profile_imports() for _ in range(max(1, args.repeat))), key=lambda profile: profile["imports"])
+    profile = profiles[(len(profiles) - 1) // 2]
+    runs = [profile["imports"] for profile in profiles]
+    print(render(profile, runs, args.top))
+
+    times = {"imports": statistics.median(runs)}
+    first_poll = None
+    if args.first_poll:
+        if UPDATES_MODE != "polling":
+            raise SystemExit("The first poll is measured through getUpdates; set UPDATES_MODE to polling")
+        local_database(DB_DSN)
+        first_poll = await profile_first_poll(args.poll_timeout)
+        times["first_poll"] = first_poll["first_poll"]
+        print(f"\nFirst poll after {first_poll['first_poll']:.3f}s "
+              f"(main {first_poll['polls']['main']:.3f}s, info {first_poll['polls']['info']:.3f}s), "
+              f"{first_poll['imports']:.3f}s of it imports")
+
+    budget = ", ".join(f"{name} {seconds:.2f}s / {STARTUP_BUDGETS.get(name, 0):.2f}s" for name, seconds in times.items())
+    print(f"\nStartup budget: {budget}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "times": times,
+                "budgets": STARTUP_BUDGETS,
+                "import_runs": runs,
+                "first_poll": first_poll,
+                "eager": profile["eager"],
+                "packages": by_package(profile["entries"]),
+                "modules": profile["entries"],
+            }, f, indent=2)
+    failures = over_budget(times) + [f"{module} imported on startup" for module in profile["eager"]]
+    if args.check and failures:
+        print(f"\nOver budget: {'; '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    os.chdir(PROJECT_ROOT)
+    sys.exit(asyncio.run(run(parse_args())))
@@ -0,0 +1,159 @@
+"""
+Hot reload of the config files.
+
+run_config_watcher() checks the main config and lang_dict.json every
+CONFIG_RELOAD_INTERVAL seconds. When one of them changed, reload_config()
+reads both, validates the reloadable values (config.config.reloadable_values)
+and swaps in a new snapshot (config.snapshot); handlers read MESSAGES,
+MODELS, WHITE_LIST, LIMITS, ... through proxies, so the next access sees the
+new version and requests already running are not interrupted. Indexes built
+from these values register with on_config_reload() and are rebuilt after the
+swap. An invalid version is rejected and the running one is kept. Other keys
+(tokens, DSN, pool sizes, ...) are still read once at startup; a change of
+them is logged as needing a restart.
+"""
+import asyncio
+import inspect
+import os
+from typing import Callable, List
+from config.config import load_config, reloadable_values, CONFIG_FILE, LANG_DICT_FILE, CONFIG_RELOAD_INTERVAL, RELOADABLE_CONFIG_KEYS, DEFAULT_LANGUAGES
+from config.snapshot import ConfigSnapshot, current_snapshot, publish
+from logs.log import logs
+
+_listeners: List[Callable] = []
+_stats = {"checks": 0, "reloads": 0, "rejected": 0, "listener_errors": 0, "last_error": None}
+
+def on_config_reload(listener: Callable) -> Callable:
+    """
+    Registers a function (plain or async) called with the new ConfigSnapshot after every swap
+    """
+    _listeners.append(listener)
+    return listener
+
+def problems(values: dict, current: ConfigSnapshot) -> List[str]:
+    """
+    Problems that make a version unusable
+    :param values: Reloadable values of the version
+    :param current: The running snapshot; texts it has must not disappear
+    """
+    errors = []
+    for name, value in values.items():
+        expected = dict if name in ("MESSAGES", "LIMITS") else list
+        if not isinstance(value, expected):
+            errors.append(f"{name} must be a {expected.__name__}")
+    if errors:
+        return errors
+
+    messages = values["MESSAGES"]
+    languages = values["SUPPORTED_LANGUAGES"]
+    if DEFAULT_LANGUAGES not in languages:
+        errors.append(f"SUPPORTED_LANGUAGES must contain the default language {DEFAULT_LANGUAGES}")
+    for lang in languages:
+        if not isinstance(messages.get(lang), dict):
+            errors.append(f"MESSAGES has no texts for {lang}")
+            continue
+        # Handlers index the texts directly, a key the running version has can't go missing
+        missing = set(current.values["MESSAGES"].get(lang, {})) - set(messages[lang])
+        if missing:
+            errors.append(f"MESSAGES[{lang}] lacks {', '.join(sorted(missing))}")
+
+    # The model menu zips the models with their labels
+    if len(values["MODELS"]) != len(values["MODELS_FOR_MENU"]):
+        errors.append(f"MODELS has {len(values['MODELS'])} entries, MODELS_FOR_MENU {len(values['MODELS_FOR_MENU'])}")
+    for name, limits in values["LIMITS"].items():
+        if not (isinstance(limits, list) and len(limits) == 2 and all(isinstance(limit, int) for limit in limits)):
+            errors.append(f"LIMITS[{name}] must be [requests, tokens]")
+    if not all(isinstance(chat_id, int) for chat_id in values["WHITE_LIST"]):
+        errors.append("white_list must contain chat IDs (integers)")
+    return errors
+
+def validate(values: dict, current: ConfigSnapshot) -> List[str]:
+    """
+    Problems of a new version the running one doesn't have, so a quirk of the running config doesn't block every reload
+    """
+    known = problems(dict(current.values), current)
+    return [error for error in problems(values, current) if error not in known]
+
+def _changed(old: dict, new: dict) -> List[str]:
+    return sorted(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+
+async def reload_config() -> ConfigSnapshot | None:
+    """
+    Reads the config files and swaps in their version if it is valid
+    :return: The new snapshot, None if nothing changed or the new version was rejected
+    """
+    current = current_snapshot()
+    config, lang_dict = await asyncio.gather(
+        asyncio.to_thread(load_config, CONFIG_FILE), asyncio.to_thread(load_config, LANG_DICT_FILE)
+    )
+    if config is None or lang_dict is None:
+        errors = [f"{CONFIG_FILE} or {LANG_DICT_FILE} can't be read"]
+    else:
+        errors = validate(reloadable_values(config, lang_dict), current)
+    if errors:
+        _stats["rejected"] += 1
+        _stats["last_error"] = "; ".join(errors)
+        await logs(f"Module: config_reload. Config not reloaded, version {current.version} stays: {_stats['last_error']}", type_e="error")
+        return None
+    _stats["last_error"] = None
+    values = reloadable_values(config, lang_dict)
+
+    restart_keys = [key for key in _changed(current.raw, config) if key not in RELOADABLE_CONFIG_KEYS]
+    if restart_keys:
+        await logs(f"Module: config_reload. Changed keys that only take effect after a restart: {', '.join(restart_keys)}", type_e="warning")
+    changed = _changed(current.values, values)
+    if not changed:
+        return None
+
+    snapshot = publish(values, config)
+    _stats["reloads"] += 1
+    await logs(f"Config version {snapshot.version} loaded, changed: {', '.join(changed)}", type_e="info")
+    for listener in _listeners:
+        try:
+            result = listener(snapshot)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            _stats["listener_errors"] += 1
+            await logs(f"Module: config_reload. Listener {getattr(listener, '__qualname__', listener)} failed on version {snapshot.version}: {e}", type_e="error")
+    return snapshot
+
+def _signature() -> tuple:
+    signature = []
+    for file_path in (CONFIG_FILE, LANG_DICT_FILE):
+        try:
+            stat = os.stat(file_path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+async def run_config_watcher(shutdown_event: asyncio.Event):
+    """
+    Reloads the config whenever one of its files changes, until shutdown
+    """
+    if CONFIG_RELOAD_INTERVAL <= 0:
+        return
+    seen = _signature()
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=CONFIG_RELOAD_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        if shutdown_event.is_set():
+            break
+        _stats["checks"] += 1
+        signature = _signature()
+        if signature == seen:
+            continue
+        # A half-written file fails to parse and is retried with the next change of the file
+        seen = signature
+        try:
+            await reload_config()
+        except Exception as e:
+            _stats["rejected"] += 1
+            await logs(f"Module: config_reload. Error reloading the config: {e}", type_e="error")
+
+def get_config_stats() -> dict:
+    snapshot = current_snapshot()
+    return {"version": snapshot.version, "loaded_at": snapshot.loaded_at, **_stats}
@@ -0,0 +1,145 @@
+"""
+On-demand sampling CPU profiler.
+
+A thread wakes up every CPU_PROFILE_INTERVAL seconds for the requested
+duration and records the stack of the event loop thread (or of every
+thread), so nothing runs and nothing is slowed down unless a profile is
+being taken. Loop samples are tagged with the handler or job the running
+task is attributed to (see services/loop_watchdog.attributed), samples taken
+while the loop waits for I/O are tagged "idle".
+
+The result is in the collapsed-stack format ("frame;frame;frame count" per
+line) read by flamegraph.pl, speedscope and inferno. Started with
+/profile on the info bot (handlers/admin.py) or the /debug/profile endpoint.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+from config.config import CPU_PROFILE_INTERVAL, CPU_PROFILE_MAX_SECONDS
+from services.asgi_routes import WebRequest, WebResponse
+from services.loop_watchdog import task_context
+
+MAX_STACK_DEPTH = 64
+SUMMARY_TOP = 10
+
+_running = threading.Lock()
+
+def _frame_label(code) -> str:
+    # Grouped by function (first line), not by the line being executed
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+def _stack(frame) -> list:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+def _loop_tag(loop: asyncio.AbstractEventLoop) -> str:
+    task = asyncio.current_task(loop)
+    if task is None:
+        return "idle"
+    context = task_context(task) or {}
+    handler = context.get("handler")
+    return f"handler {handler}" if handler else f"task {task.get_name()}"
+
+def sample(seconds: float, interval: float, loop: asyncio.AbstractEventLoop, loop_thread_id: int, all_threads: bool = False) -> Counter:
+    """
+    Samples stacks for the given time in the calling thread
+    :param seconds: Duration
+    :param interval: Seconds between samples
+    :param loop: Event loop whose running task tags the loop samples
+    :param loop_thread_id: Thread running the loop
+    :param all_threads: Sample every thread, not only the loop
+    :return: Collapsed stack -> number of samples
+    """
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        stacks: Counter = Counter()
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own_id or (not all_threads and thread_id != loop_thread_id):
+                    continue
+                if thread_id == loop_thread_id:
+                    root = ["loop", _loop_tag(loop)]
+                else:
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    root = [f"thread {names.get(thread_id, thread_id)}"]
+                stacks[";".join(root + _stack(frame))] += 1
+            del frames
+            time.sleep(interval)
+        return stacks
+    finally:
+        _running.release()
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def summary(stacks: Counter, seconds: float) -> str:
+    """
+    Short text report: busy share of the loop, top handlers and top functions by own samples
+    """
+    total = sum(stacks.values())
+    if not total:
+        return "No samples."
+    tags: Counter = Counter()
+    leaves: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        if frames[0] == "loop":
+            tags[frames[1]] += count
+        if not (frames[0] == "loop" and frames[1] == "idle"):
+            leaves[frames[-1]] += count
+    loop_total = sum(tags.values())
+    lines = [f"{total} samples in {seconds:g}s"]
+    if loop_total:
+        lines[0] += f", event loop busy {100 * (loop_total - tags['idle']) / loop_total:.0f}%"
+    lines += [f"{100 * count / total:5.1f}% {tag}" for tag, count in tags.most_common(SUMMARY_TOP) if tag != "idle"]
+    lines.append("Top functions (own samples):")
+    lines += [f"{100 * count / total:5.1f}% {leaf}" for leaf, count in leaves.most_common(SUMMARY_TOP)]
+    return "\n".join(lines)
+
+async def profile(seconds: float, all_threads: bool = False) -> tuple[str, str]:
+    """
+    Profiles the running event loop for the given time without blocking it
+    :param seconds: Duration, capped at CPU_PROFILE_MAX_SECONDS
+    :param all_threads: Sample every thread, not only the loop
+    :return: Collapsed stacks and a summary
+    """
+    seconds = max(1.0, min(float(seconds), CPU_PROFILE_MAX_SECONDS))
+    loop = asyncio.get_running_loop()
+    stacks = await asyncio.to_thread(sample, seconds, CPU_PROFILE_INTERVAL, loop, threading.get_ident(), all_threads)
+    return collapsed(stacks), summary(stacks, seconds)
+
+def is_running() -> bool:
+    return _running.locked()
+
+def report_filename() -> str:
+    return f"cpu-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+
+async def profile_endpoint(request: WebRequest) -> WebResponse:
+    """
+    /debug/profile?seconds=30[&threads=all]; returns the collapsed stacks as an attachment
+    """
+    query = parse_qs(request.query_string)
+    try:
+        seconds = float(query.get("seconds", ["30"])[0])
+    except ValueError:
+        return WebResponse(400, "seconds must be a number")
+    try:
+        text, _ = await profile(seconds, all_threads=query.get("threads", [""])[0] == "all")
+    except RuntimeError as e:
+        return WebResponse(409, str(e))
+    return WebResponse(200, text, headers=[("content-disposition", f'attachment; filename="{report_filename()}"')])
@@ -3,7 +3,8 @@ import asyncpg
 import json
 from datetime import datetime, date
 from logs.log import logs
-from config.config import DB_DSN
+from config.config import DB_DSN, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, TRACING_ENABLED
+from services.tracing import record_query
 
 TABLE_SCHEMAS = {
     "chat_ids": {
@@ -44,19 +45,98 @@ TABLE_SCHEMAS = {
         "price": "double precision",
         "total": "double precision",
         "currency": "text"
+    },
+    "media_cache": {
+        "cache_key": "text",
+        "handler_type": "text",
+        "result": "json",
+        "created_at": "timestamptz",
+        "expires_at": "timestamptz"
+    },
+    "fsm_states": {
+        "storage_key": "text",
+        "state": "text",
+        "data": "json",
+        "updated_at": "timestamptz",
+        "expires_at": "timestamptz"
+    },
+    "jobs": {
+        "id": "bigserial PRIMARY KEY",
+        "job_type": "text",
+        "chat_id": "bigint",
+        "payload": "json",
+        "status": "text DEFAULT 'queued'",
+        "attempts": "integer DEFAULT 0",
+        "max_attempts": "integer DEFAULT 3",
+        "run_after": "timestamptz DEFAULT now()",
+        "locked_until": "timestamptz",
+        "last_error": "text",
+        "created_at": "timestamptz DEFAULT now()",
+        "updated_at": "timestamptz DEFAULT now()"
+    },
+    "usage_events": {
+        "id": "bigserial PRIMARY KEY",
+        "created_at": "timestamptz DEFAULT now()",
+        "user_id": "bigint",
+        "model": "text",
+        "operation": "text",
+        "tokens": "bigint DEFAULT 0"
+    },
+    "usage_daily": {
+        "day": "date",
+        "user_id": "bigint",
+        "model": "text",
+        "tokens": "bigint DEFAULT 0",
+        "requests": "bigint DEFAULT 0",
+        "updated_at": "timestamptz DEFAULT now()"
+    }
+}
+
+# Unique indexes are created after the table columns are in place; they back the
+# ON CONFLICT upserts used by the cache tables.
+TABLE_INDEXES = {
+    "media_cache": {
+        "media_cache_key_idx": "CREATE UNIQUE INDEX IF NOT EXISTS media_cache_key_idx ON media_cache (cache_key);",
+        "media_cache_expires_idx": "CREATE INDEX IF NOT EXISTS media_cache_expires_idx ON media_cache (expires_at);"
+    },
+    "fsm_states": {
+        "fsm_states_key_idx": "CREATE UNIQUE INDEX IF NOT EXISTS fsm_states_key_idx ON fsm_states (storage_key);",
+        "fsm_states_expires_idx": "CREATE INDEX IF NOT EXISTS fsm_states_expires_idx ON fsm_states (expires_at);"
+    },
+    "jobs": {
+        "jobs_claim_idx": "CREATE INDEX IF NOT EXISTS jobs_claim_idx ON jobs (status, run_after);"
+    },
+    "usage_events": {
+        "usage_events_created_idx": "CREATE INDEX IF NOT EXISTS usage_events_created_idx ON usage_events (created_at);"
+    },
+    "usage_daily": {
+        "usage_daily_key_idx": "CREATE UNIQUE INDEX IF NOT EXISTS usage_daily_key_idx ON usage_daily (day, user_id, model);",
+        "usage_daily_user_idx": "CREATE INDEX IF NOT EXISTS usage_daily_user_idx ON usage_daily (user_id, day);"
     }
 }
 
 _pool = None
 conn = None
 
-async def create_pool():
+async def create_pool(share: int = 1):
+    """
+    Creates the connection pool. With several processes each one passes the number
+    of processes as share, so together they stay within DB_POOL_MAX_SIZE connections.
+    """
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(DB_DSN, min_size=2, max_size=10)
-        await logs("PostgreSQL connection pool established", type_e="info")
+        max_size = max(2, DB_POOL_MAX_SIZE // share)
+        min_size = min(max(1, DB_POOL_MIN_SIZE // share), max_size)
+        _pool = await asyncpg.create_pool(DB_DSN, min_size=min_size, max_size=max_size, init=_init_connection)
+        await logs("PostgreSQL connection pool established (size %s-%s)", min_size, max_size, type_e="info")
     return _pool
 
+async def _init_connection(connection):
+    """Sets up every new pool connection"""
+    if TRACING_ENABLED:
+        # Queries run inside a trace become its DB spans
+        connection.add_query_logger(record_query)
+
 async def create_connection():
     """Creates a connection and initializes the global conn variable"""
     global conn
@@ -105,6 +185,32 @@ async def close_pool():
     finally:
         _pool = None
 
+def get_pool_stats() -> dict:
+    """
+    Returns the size of the connection pool of this process
+    """
+    if _pool is None:
+        return {}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    return {"size": size, "idle": idle, "in_use": size - idle, "max_size": _pool.get_max_size()}
+
+async def ping_db(timeout: float = 2) -> bool:
+    """
+    Checks that a pooled connection can be taken and answers a query in time
+    :param timeout: Seconds to wait for the connection and the query
+    :return: True if the database answered
+    """
+    if _pool is None:
+        return False
+    try:
+        async with _pool.acquire(timeout=timeout) as connection:
+            await connection.fetchval("SELECT 1", timeout=timeout)
+        return True
+    except Exception as e:
+        await logs(f"Module: db_utils. Database ping failed: {e!r}", type_e="warning")
+        return False
+
 async def init_db_tables():
     """
     Asynchronous function for checking and initializing tables in PostgreSQL.
@@ -116,7 +222,8 @@ async def init_db_tables():
          - If the table doesn't exist, creates it with the required columns.
          - If the table exists, checks for all necessary columns.
            If any column is missing, adds it using ALTER TABLE.
-      3. Closes the connection.
+      3. Creates the indexes listed in TABLE_INDEXES if they don't exist yet.
+      4. Closes the connection.
     In case of errors, logging is done using logs.
     """
     connection = None
@@ -138,7 +245,7 @@ async def init_db_tables():
                 columns_def = ", ".join([f"{col} {col_type}" for col, col_type in columns.items()])
                 create_query = f"CREATE TABLE {table_name} ({columns_def});"
                 await connection.execute(create_query)
-                await logs(f"Table {table_name} created with columns: {columns_def}", type_e="info")
+                await logs("Table %s created with columns: %s", table_name, columns_def, type_e="info")
             else:
                 # If the table exists, get a list of existing columns
                 columns_query = """
@@ -153,7 +260,13 @@ async def init_db_tables():
                     if col not in existing_columns:
                         alter_query = f"ALTER TABLE {table_name} ADD COLUMN {col} {col_type};"
                         await connection.execute(alter_query)
-                        await logs(f"Column {col} added to table {table_name}", type_e="info")
+                        await logs("Column %s added to table %s", col, table_name, type_e="info")
+
+        # Create indexes for tables that need them
+        for table_name, indexes in TABLE_INDEXES.items():
+            for index_name, index_query in indexes.items():
+                await connection.execute(index_query)
+                await logs("Index %s ensured on table %s", index_name, table_name, type_e="info")
     except Exception as e:
         await logs(f"Module: db_utils. Error initializing tables: {e}", type_e="error")
         raise
@@ -187,7 +300,7 @@ async def user_exists(user_id: int) -> bool:
         query = "SELECT 1 FROM chat_ids WHERE user_id = $1 LIMIT 1;"
         result = await connection.fetchval(query, user_id)
         
-        await logs(f"Check for user_id {user_id} in chat_ids table completed successfully", type_e="info")
+        await logs("Check for user_id %s in chat_ids table completed successfully", user_id, type_e="info")
         
         # If result is not None, the user was found.
         return True if result else False
@@ -216,7 +329,7 @@ async def read_user_all_data(chat_id: int):
         row = await connection.fetchrow(query, chat_id)
         
         # Log successful query execution
-        await logs(f"Query for chat_id: {chat_id} executed successfully", type_e="info")
+        await logs("Query for chat_id: %s executed successfully", chat_id, type_e="info")
         
         # If record is found, return it; otherwise return None
         return row
@@ -256,7 +369,7 @@ async def read_chat_history(chat_id: int):
             context_list = []
         
         # Log successful query execution
-        await logs(f"Chat history successfully retrieved for chat_id: {chat_id}", type_e="info")
+        await logs("Chat history successfully retrieved for chat_id: %s", chat_id, type_e="info")
         
         # If record is found, return it as dictionary, otherwise None
         return context_list
@@ -302,7 +415,7 @@ async def read_with_period(chat_id: int, start_date: str, end_date: str):
         rows = await connection.fetch(query, chat_id, start_date, end_date)
         
         # Log successful query execution
-        await logs(f"Query executed successfully for chat_id: {chat_id}", type_e="info")
+        await logs("Query executed successfully for chat_id: %s", chat_id, type_e="info")
         
         # If records are found, return them as a list of dictionaries
         if rows:
@@ -317,6 +430,175 @@ async def read_with_period(chat_id: int, start_date: str, end_date: str):
         if connection:
             await release_connection(connection)
 
+async def read_media_cache(cache_key: str):
+    """
+    Asynchronously reads a cached media processing result from the "media_cache" table.
+
+    Arguments:
+      cache_key (str): Key built from file_unique_id and the handler settings.
+
+    Returns:
+      A tuple (result, expires_at) if a non-expired record is found, otherwise None.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            SELECT result, expires_at FROM media_cache
+            WHERE cache_key = $1 AND expires_at > now()
+            LIMIT 1;
+        """
+        row = await connection.fetchrow(query, cache_key)
+        if row is None:
+            return None
+
+        result = row["result"]
+        if isinstance(result, str):
+            result = json.loads(result)
+        return result, row["expires_at"]
+    except Exception as e:
+        await logs(f"Module: db_utils. Error reading media cache for key {cache_key}: {e}", type_e="error")
+        return None
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def read_fsm_state(storage_key: str):
+    """
+    Asynchronously reads the FSM state and data of one chat from the "fsm_states" table.
+
+    Arguments:
+      storage_key (str): Key built by the FSM storage from bot, chat and user IDs.
+
+    Returns:
+      A tuple (state, data, expires_at) if a non-expired record is found, otherwise None.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            SELECT state, data, expires_at FROM fsm_states
+            WHERE storage_key = $1 AND expires_at > now()
+            LIMIT 1;
+        """
+        row = await connection.fetchrow(query, storage_key)
+        if row is None:
+            return None
+
+        data = row["data"]
+        if isinstance(data, str):
+            data = json.loads(data)
+        return row["state"], data or {}, row["expires_at"]
+    except Exception as e:
+        await logs(f"Module: db_utils. Error reading FSM state for key {storage_key}: {e}", type_e="error")
+        return None
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def count_jobs_by_status() -> dict:
+    """
+    Asynchronously counts the records of the "jobs" table per status.
+
+    Returns:
+      A dict {status: count}, empty on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        rows = await connection.fetch("SELECT status, count(*) AS jobs FROM jobs GROUP BY status;")
+        return {row["status"]: row["jobs"] for row in rows}
+    except Exception as e:
+        await logs(f"Module: db_utils. Error counting jobs: {e}", type_e="error")
+        return {}
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def read_top_users(start_date: date, end_date: date, limit: int = 10, model: str | None = None) -> list:
+    """
+    Asynchronously reads the users with the most tokens in a period from the "usage_daily" rollup.
+
+    Arguments:
+      start_date (date), end_date (date): Inclusive period.
+      limit (int): Number of users.
+      model (str | None): Only this model if given.
+
+    Returns:
+      A list of dicts {"user_id", "tokens", "requests"}, empty on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            SELECT user_id, sum(tokens) AS tokens, sum(requests) AS requests
+            FROM usage_daily
+            WHERE day BETWEEN $1 AND $2 AND ($4::text IS NULL OR model = $4)
+            GROUP BY user_id
+            ORDER BY tokens DESC, requests DESC
+            LIMIT $3;
+        """
+        rows = await connection.fetch(query, start_date, end_date, limit, model)
+        return [dict(row) for row in rows]
+    except Exception as e:
+        await logs(f"Module: db_utils. Error reading top users: {e}", type_e="error")
+        return []
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def read_model_usage(start_date: date, end_date: date) -> list:
+    """
+    Asynchronously reads tokens, requests and users per model in a period from the "usage_daily" rollup.
+
+    Returns:
+      A list of dicts {"model", "tokens", "requests", "users"}, most tokens first, empty on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            SELECT model, sum(tokens) AS tokens, sum(requests) AS requests, count(DISTINCT user_id) AS users
+            FROM usage_daily
+            WHERE day BETWEEN $1 AND $2
+            GROUP BY model
+            ORDER BY tokens DESC, requests DESC;
+        """
+        rows = await connection.fetch(query, start_date, end_date)
+        return [dict(row) for row in rows]
+    except Exception as e:
+        await logs(f"Module: db_utils. Error reading usage per model: {e}", type_e="error")
+        return []
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def read_usage_trend(start_date: date, end_date: date, model: str | None = None) -> list:
+    """
+    Asynchronously reads daily totals in a period from the "usage_daily" rollup.
+
+    Returns:
+      A list of dicts {"day", "tokens", "requests", "users"} ordered by day, empty on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            SELECT day, sum(tokens) AS tokens, sum(requests) AS requests, count(DISTINCT user_id) AS users
+            FROM usage_daily
+            WHERE day BETWEEN $1 AND $2 AND ($3::text IS NULL OR model = $3)
+            GROUP BY day
+            ORDER BY day;
+        """
+        rows = await connection.fetch(query, start_date, end_date, model)
+        return [dict(row) for row in rows]
+    except Exception as e:
+        await logs(f"Module: db_utils. Error reading usage trend: {e}", type_e="error")
+        return []
+    finally:
+        if connection:
+            await release_connection(connection)
+
 #_____________________________________________________________
 #______________________WRITE_FUNCTIONS________________________
 #_____________________________________________________________
@@ -338,7 +620,7 @@ async def clear_user_context(chat_id: int):
         # Set empty context (empty JSON array)
         await connection.execute(query, chat_id, '[]')
         
-        await logs(f"Chat history for chat_id {chat_id} cleared successfully", type_e="info")
+        await logs("Chat history for chat_id %s cleared successfully", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error clearing chat history for chat_id {chat_id}: {e}", type_e="error")
     finally:
@@ -423,7 +705,7 @@ async def write_user_to_json(file_path: str, user_data: dict):
         
         # Execute query with parameters
         await connection.execute(query, *values)
-        await logs(f"Data successfully written to table: {file_path}", type_e="info")
+        await logs("Data successfully written to table: %s", file_path, type_e="info")
         return True
     except Exception as e:
         await logs(f"Error writing data to table {file_path}: {e}", type_e="error")
@@ -455,7 +737,7 @@ async def update_user_data(chat_id: int, key: str, value):
         # Execute query. The execute method will return a string like "UPDATE <n>" on successful update.
         result = await connection.execute(query, chat_id, value)
         
-        await logs(f"Data updated for chat_id {chat_id}, key {key}, new value: {value}", type_e="info")
+        await logs("Data updated for chat_id %s, key %s, new value: %s", chat_id, key, value, type_e="info")
     except Exception as e:
         await logs(f"Module: db_utils. Error updating data for chat_id {chat_id}, key {key}: {e}", type_e="error")
     finally:
@@ -514,9 +796,445 @@ async def update_chat_history(chat_id: int, new_message: dict):
         # Convert list to JSON string for storage in JSON or text type column
         await connection.execute(query_update, chat_id, json.dumps(context_list))
         
-        await logs(f"Chat history for chat_id {chat_id} updated successfully", type_e="info")
+        await logs("Chat history for chat_id %s updated successfully", chat_id, type_e="info")
     except Exception as e:
         await logs(f"Error updating chat history for chat_id {chat_id}: {e}", type_e="error")
     finally:
         if connection:
-            await release_connection(connection)
\ No newline at end of file
+            await release_connection(connection)
+
+async def write_media_cache(cache_key: str, handler_type: str, result, expires_at: datetime):
+    """
+    Asynchronously stores a media processing result in the "media_cache" table.
+    An existing record with the same key is overwritten.
+
+    Arguments:
+      cache_key (str): Key built from file_unique_id and the handler settings.
+      handler_type (str): Handler that produced the result (photo, voice, document, check).
+      result: JSON-serializable result returned by the handler.
+      expires_at (datetime): Moment after which the record is considered stale.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            INSERT INTO media_cache (cache_key, handler_type, result, created_at, expires_at)
+            VALUES ($1, $2, $3, now(), $4)
+            ON CONFLICT (cache_key) DO UPDATE
+            SET handler_type = EXCLUDED.handler_type,
+                result = EXCLUDED.result,
+                created_at = EXCLUDED.created_at,
+                expires_at = EXCLUDED.expires_at;
+        """
+        await connection.execute(query, cache_key, handler_type, json.dumps(result, ensure_ascii=False), expires_at)
+        await logs("Media cache record stored for handler %s", handler_type, type_e="info")
+    except Exception as e:
+        await logs(f"Module: db_utils. Error writing media cache for key {cache_key}: {e}", type_e="error")
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def purge_media_cache(batch_size: int = 1000) -> int:
+    """
+    Asynchronously deletes expired records from the "media_cache" table in batches,
+    so a large backlog doesn't hold a long lock on the table.
+
+    Arguments:
+      batch_size (int): Maximum number of rows deleted per statement.
+
+    Returns:
+      Total number of deleted rows.
+    """
+    connection = None
+    deleted = 0
+    try:
+        connection = await get_connection()
+        query = """
+            DELETE FROM media_cache
+            WHERE ctid IN (
+                SELECT ctid FROM media_cache WHERE expires_at <= now() LIMIT $1
+            );
+        """
+        while True:
+            result = await connection.execute(query, batch_size)
+            count = int(result.split()[-1])
+            deleted += count
+            if count < batch_size:
+                break
+        await logs("Expired media cache records purged: %s", deleted, type_e="info")
+        return deleted
+    except Exception as e:
+        await logs(f"Module: db_utils. Error purging media cache: {e}", type_e="error")
+        return deleted
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def write_fsm_state(storage_key: str, state, data: dict, expires_at: datetime):
+    """
+    Asynchronously stores the FSM state and data of one chat in the "fsm_states" table.
+    An existing record with the same key is overwritten.
+
+    Arguments:
+      storage_key (str): Key built by the FSM storage from bot, chat and user IDs.
+      state (str | None): Current state name.
+      data (dict): JSON-serializable FSM data.
+      expires_at (datetime): Moment after which the record is considered abandoned.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            INSERT INTO fsm_states (storage_key, state, data, updated_at, expires_at)
+            VALUES ($1, $2, $3, now(), $4)
+            ON CONFLICT (storage_key) DO UPDATE
+            SET state = EXCLUDED.state,
+                data = EXCLUDED.data,
+                updated_at = EXCLUDED.updated_at,
+                expires_at = EXCLUDED.expires_at;
+        """
+        await connection.execute(query, storage_key, state, json.dumps(data, ensure_ascii=False, default=str), expires_at)
+    except Exception as e:
+        await logs(f"Module: db_utils. Error writing FSM state for key {storage_key}: {e}", type_e="error")
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def delete_fsm_state(storage_key: str):
+    """
+    Asynchronously deletes the FSM record of one chat (the state was cleared).
+
+    Arguments:
+      storage_key (str): Key built by the FSM storage from bot, chat and user IDs.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        await connection.execute("DELETE FROM fsm_states WHERE storage_key = $1;", storage_key)
+    except Exception as e:
+        await logs(f"Module: db_utils. Error deleting FSM state for key {storage_key}: {e}", type_e="error")
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def purge_fsm_states(batch_size: int = 1000) -> int:
+    """
+    Asynchronously deletes abandoned FSM records from the "fsm_states" table in batches.
+
+    Arguments:
+      batch_size (int): Maximum number of rows deleted per statement.
+
+    Returns:
+      Total number of deleted rows.
+    """
+    connection = None
+    deleted = 0
+    try:
+        connection = await get_connection()
+        query = """
+            DELETE FROM fsm_states
+            WHERE ctid IN (
+                SELECT ctid FROM fsm_states WHERE expires_at <= now() LIMIT $1
+            );
+        """
+        while True:
+            result = await connection.execute(query, batch_size)
+            count = int(result.split()[-1])
+            deleted += count
+            if count < batch_size:
+                break
+        await logs("Expired FSM states purged: %s", deleted, type_e="info")
+        return deleted
+    except Exception as e:
+        await logs(f"Module: db_utils. Error purging FSM states: {e}", type_e="error")
+        return deleted
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def insert_job(job_type: str, chat_id: int, payload: dict, max_attempts: int):
+    """
+    Asynchronously adds a background job to the "jobs" table.
+
+    Arguments:
+      job_type (str): Name of the job handler.
+      chat_id (int): Chat the job belongs to; workers pick jobs of their own chats.
+      payload (dict): JSON-serializable job arguments.
+      max_attempts (int): Number of attempts before the job is marked as failed.
+
+    Returns:
+      ID of the new job or None on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            INSERT INTO jobs (job_type, chat_id, payload, status, attempts, max_attempts, run_after, created_at, updated_at)
+            VALUES ($1, $2, $3, 'queued', 0, $4, now(), now(), now())
+            RETURNING id;
+        """
+        return await connection.fetchval(query, job_type, chat_id, json.dumps(payload, ensure_ascii=False), max_attempts)
+    except Exception as e:
+        await logs(f"Module: db_utils. Error inserting job {job_type} for chat {chat_id}: {e}", type_e="error")
+        return None
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def claim_job(shard_index: int, shard_count: int, lease_seconds: int):
+    """
+    Asynchronously takes the next due job of this worker's chats. Rows locked by other
+    workers are skipped, so concurrent workers never block each other or take the same job.
+    Running jobs whose lease has expired (their process died) are taken again while
+    they have attempts left; the others are left to fail_expired_jobs.
+
+    Arguments:
+      shard_index (int): Index of this process among the bot workers.
+      shard_count (int): Number of bot worker processes.
+      lease_seconds (int): How long the job stays reserved for this worker.
+
+    Returns:
+      The job record or None if nothing is due.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1,
+                locked_until = now() + make_interval(secs => $3), updated_at = now()
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE ((status = 'queued' AND run_after <= now())
+                       OR (status = 'running' AND locked_until < now() AND attempts < max_attempts))
+                  AND ((chat_id % $2) + $2) % $2 = $1
+                ORDER BY run_after, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, job_type, chat_id, payload, attempts, max_attempts;
+        """
+        row = await connection.fetchrow(query, shard_index, shard_count, float(lease_seconds))
+        if row is None:
+            return None
+
+        job = dict(row)
+        if isinstance(job["payload"], str):
+            job["payload"] = json.loads(job["payload"])
+        return job
+    except Exception as e:
+        await logs(f"Module: db_utils. Error claiming job: {e}", type_e="error")
+        return None
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def extend_job_lease(job_id: int, lease_seconds: int):
+    """
+    Asynchronously keeps a running job reserved while it reports progress.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = "UPDATE jobs SET locked_until = now() + make_interval(secs => $2), updated_at = now() WHERE id = $1;"
+        await connection.execute(query, job_id, float(lease_seconds))
+    except Exception as e:
+        await logs(f"Module: db_utils. Error extending lease of job {job_id}: {e}", type_e="error")
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def complete_job(job_id: int):
+    """
+    Asynchronously marks a job as done.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = "UPDATE jobs SET status = 'done', locked_until = NULL, updated_at = now() WHERE id = $1;"
+        await connection.execute(query, job_id)
+    except Exception as e:
+        await logs(f"Module: db_utils. Error completing job {job_id}: {e}", type_e="error")
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def fail_expired_jobs(shard_index: int, shard_count: int):
+    """
+    Asynchronously marks as failed the running jobs of this worker's chats whose lease
+    expired on their last attempt, so a job that kills its process isn't claimed forever.
+
+    Arguments:
+      shard_index (int): Index of this process among the bot workers.
+      shard_count (int): Number of bot worker processes.
+
+    Returns:
+      The failed job records, an empty list on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            UPDATE jobs
+            SET status = 'failed', locked_until = NULL, updated_at = now(),
+                last_error = 'Lease expired on the last attempt'
+            WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+              AND ((chat_id % $2) + $2) % $2 = $1
+            RETURNING id, job_type, chat_id, payload, attempts, max_attempts;
+        """
+        rows = await connection.fetch(query, shard_index, shard_count)
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            if isinstance(job["payload"], str):
+                job["payload"] = json.loads(job["payload"])
+        return jobs
+    except Exception as e:
+        await logs(f"Module: db_utils. Error failing expired jobs: {e}", type_e="error")
+        return []
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def fail_job(job_id: int, error: str, retry_delay: float):
+    """
+    Asynchronously records a failed attempt. The job is queued again after retry_delay
+    seconds, or marked as failed once it has used all its attempts.
+
+    Returns:
+      New job status ('queued' or 'failed'), None on error.
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        query = """
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                run_after = now() + make_interval(secs => $3),
+                locked_until = NULL, last_error = $2, updated_at = now()
+            WHERE id = $1
+            RETURNING status;
+        """
+        return await connection.fetchval(query, job_id, error, float(retry_delay))
+    except Exception as e:
+        await logs(f"Module: db_utils. Error failing job {job_id}: {e}", type_e="error")
+        return None
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def purge_finished_jobs(retention_seconds: int, batch_size: int = 1000) -> int:
+    """
+    Asynchronously deletes done and failed jobs older than retention_seconds in batches.
+
+    Returns:
+      Total number of deleted rows.
+    """
+    connection = None
+    deleted = 0
+    try:
+        connection = await get_connection()
+        query = """
+            DELETE FROM jobs
+            WHERE ctid IN (
+                SELECT ctid FROM jobs
+                WHERE status IN ('done', 'failed') AND updated_at <= now() - make_interval(secs => $1)
+                LIMIT $2
+            );
+        """
+        while True:
+            result = await connection.execute(query, float(retention_seconds), batch_size)
+            count = int(result.split()[-1])
+            deleted += count
+            if count < batch_size:
+                break
+        await logs("Finished jobs purged: %s", deleted, type_e="info")
+        return deleted
+    except Exception as e:
+        await logs(f"Module: db_utils. Error purging jobs: {e}", type_e="error")
+        return deleted
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def write_usage_events(events: list) -> bool:
+    """
+    Asynchronously appends a batch of usage events to the "usage_events" table and adds
+    them to the "usage_daily" rollup in the same transaction, so the rollup always
+    matches the events.
+
+    Arguments:
+      events (list): Tuples (created_at, user_id, model, operation, tokens); created_at is UTC.
+
+    Returns:
+      True if the batch was written, False on error (nothing is written then).
+    """
+    connection = None
+    try:
+        connection = await get_connection()
+        daily = {}
+        for created_at, user_id, model, operation, tokens in events:
+            totals = daily.setdefault((created_at.date(), user_id, model), [0, 0])
+            totals[0] += tokens
+            totals[1] += 1
+        query = """
+            INSERT INTO usage_daily (day, user_id, model, tokens, requests, updated_at)
+            SELECT day, user_id, model, tokens, requests, now()
+            FROM unnest($1::date[], $2::bigint[], $3::text[], $4::bigint[], $5::bigint[])
+                AS batch (day, user_id, model, tokens, requests)
+            ON CONFLICT (day, user_id, model) DO UPDATE
+            SET tokens = usage_daily.tokens + EXCLUDED.tokens,
+                requests = usage_daily.requests + EXCLUDED.requests,
+                updated_at = now();
+        """
+        keys = list(daily)
+        async with connection.transaction():
+            await connection.copy_records_to_table(
+                "usage_events", records=events, columns=["created_at", "user_id", "model", "operation", "tokens"]
+            )
+            await connection.execute(
+                query,
+                [key[0] for key in keys], [key[1] for key in keys], [key[2] for key in keys],
+                [daily[key][0] for key in keys], [daily[key][1] for key in keys]
+            )
+        return True
+    except Exception as e:
+        await logs(f"Module: db_utils. Error writing {len(events)} usage events: {e}", type_e="error")
+        return False
+    finally:
+        if connection:
+            await release_connection(connection)
+
+async def purge_usage_events(retention_days: int, batch_size: int = 1000) -> int:
+    """
+    Asynchronously deletes usage events older than retention_days in batches.
+    The "usage_daily" rollup is kept.
+
+    Returns:
+      Total number of deleted rows.
+    """
+    connection = None
+    deleted = 0
+    try:
+        connection = await get_connection()
+        query = """
+            DELETE FROM usage_events
+            WHERE ctid IN (
+                SELECT ctid FROM usage_events
+                WHERE created_at <= now() - make_interval(days => $1)
+                LIMIT $2
+            );
+        """
+        while True:
+            result = await connection.execute(query, retention_days, batch_size)
+            count = int(result.split()[-1])
+            deleted += count
+            if count < batch_size:
+                break
+        await logs("Usage events purged: %s", deleted, type_e="info")
+        return deleted
+    except Exception as e:
+        await logs(f"Module: db_utils. Error purging usage events: {e}", type_e="error")
+        return deleted
+    finally:
+        if connection:
+            await release_connection(connection)
@@ -0,0 +1,34 @@
+"""
+Diagnostic endpoints under /debug/ on the web server.
+
+They are only served when DEBUG_TOKEN is set and every request must carry
+"Authorization: Bearer <DEBUG_TOKEN>".
+"""
+from config.config import DEBUG_TOKEN
+from services.asgi_routes import WebRequest, WebResponse, RouteHandler, web_routes
+from services.metrics import token_matches
+from services.memory_profiler import memory_endpoint
+from services.cpu_profiler import profile_endpoint
+
+DEBUG_ROUTES = {
+    "/debug/memory": memory_endpoint,
+    "/debug/profile": profile_endpoint,
+}
+
+def _protected(handler: RouteHandler) -> RouteHandler:
+    async def protected(request: WebRequest) -> WebResponse:
+        if not token_matches(request, DEBUG_TOKEN):
+            return WebResponse(401, "Unauthorized", headers=[("www-authenticate", "Bearer")])
+        return await handler(request)
+    return protected
+
+def register_debug_routes() -> bool:
+    """
+    Serves the /debug/* endpoints if DEBUG_TOKEN is set
+    :return: Whether they were registered
+    """
+    if not DEBUG_TOKEN:
+        return False
+    for path, handler in DEBUG_ROUTES.items():
+        web_routes.add_route(path, _protected(handler), methods=("GET", "POST"))
+    return True
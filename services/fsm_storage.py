@@ -0,0 +1,119 @@
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from config.config import FSM_STATE_TTL, FSM_CACHE_MAX_ITEMS, FSM_PURGE_INTERVAL
+from logs.log import logs
+from services.db_utils import read_fsm_state, write_fsm_state, delete_fsm_state, purge_fsm_states
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM storage backed by the "fsm_states" table with a write-through LRU cache.
+
+    Every write goes to the cache and to Postgres, so states survive restarts.
+    Reads are served from the cache; empty states are cached as well, so ordinary
+    updates don't touch the database. The cache is only authoritative because a
+    chat is always handled by one process (see services/supervisor.py).
+
+    A state that isn't written for `ttl` seconds is treated as abandoned: it is
+    no longer returned and is removed by run_fsm_janitor.
+    """
+    def __init__(self, ttl: int = FSM_STATE_TTL, max_items: int = FSM_CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.key_builder = DefaultKeyBuilder(prefix="fsm", with_bot_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, tuple] = OrderedDict()  # key -> (state, data, expires_at_ts)
+        self._stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    async def _load(self, key: StorageKey) -> tuple:
+        storage_key = self.key_builder.build(key)
+        entry = self._cache.get(storage_key)
+        if entry is not None and entry[2] > time.time():
+            self._cache.move_to_end(storage_key)
+            self._stats["hits"] += 1
+            return entry
+
+        self._stats["misses"] += 1
+        row = await read_fsm_state(storage_key)
+        if row is None:
+            # Nothing stored: remember that until the TTL so the next update doesn't ask again
+            entry = (None, {}, time.time() + self.ttl)
+        else:
+            state, data, expires_at = row
+            entry = (state, data, expires_at.timestamp())
+        self._remember(storage_key, entry)
+        return entry
+
+    async def _save(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        storage_key = self.key_builder.build(key)
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        self._remember(storage_key, (state, data, expires_at.timestamp()))
+        self._stats["writes"] += 1
+        if state is None and not data:
+            await delete_fsm_state(storage_key)
+        else:
+            await write_fsm_state(storage_key, state, data, expires_at)
+
+    def _remember(self, storage_key: str, entry: tuple):
+        self._cache[storage_key] = entry
+        self._cache.move_to_end(storage_key)
+        while len(self._cache) > self.max_items:
+            self._cache.popitem(last=False)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data, _ = await self._load(key)
+        await self._save(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _, _ = await self._load(key)
+        await self._save(key, state, copy.deepcopy(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data, _ = await self._load(key)
+        return copy.deepcopy(data)
+
+    def evict_expired(self) -> int:
+        """
+        Drops expired entries from the in-process cache
+        :return: Number of dropped entries
+        """
+        now = time.time()
+        expired = [k for k, (_, _, expires_at_ts) in self._cache.items() if expires_at_ts <= now]
+        for storage_key in expired:
+            del self._cache[storage_key]
+        return len(expired)
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "cached": len(self._cache),
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0
+        }
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+async def run_fsm_janitor(storages: list, shutdown_event: asyncio.Event):
+    """
+    Periodically removes abandoned FSM states from the cache and the database until shutdown
+    :param storages: PostgresStorage instances of this process
+    :param shutdown_event: Event set when the application stops
+    """
+    while not shutdown_event.is_set():
+        for storage in storages:
+            storage.evict_expired()
+        await purge_fsm_states()
+        await logs("FSM storage stats: %s", [storage.stats() for storage in storages], type_e="info")
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=FSM_PURGE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -3,14 +3,18 @@ import asyncio
 import aiofiles
 import json
 import regex
-from tika import parser
 from aiogram import types
 from aiogram.enums import ChatType
-from config.config import BOT_USERNAME, DEFAULT_LANGUAGES, MESSAGES, SUPPORTED_EXTENSIONS, PRODUCT_KEYS
+from aiogram.exceptions import TelegramBadRequest
+from config.config import BOT_USERNAME, MESSAGES, SUPPORTED_EXTENSIONS, PRODUCT_KEYS, DEFAULT_MODEL_FOR_VISION
 from logs.log import logs
-from services.db_utils import read_user_all_data
+from services.session_context import SessionContext, load_session
 from keyboards.reply_kb import get_persistent_menu
 from services.utils import check_user_limits, resize_image, convert_audio
+from services.media_cache import make_cache_key, get_cached_result, store_result
+from services.db_utils import update_chat_history, update_user_data
+from services.usage_ledger import record_usage
+from services.tracing import start_span, current_span
 from services.type_message_handlers.text_message import text_message_ai_response
 from services.type_message_handlers.photo_message import photo_message_ai_response
 from services.type_message_handlers.voice_message import voice_message_ai_response
@@ -19,22 +23,63 @@ from services.type_message_handlers.generate_image import generate_image_ai_resp
 from services.type_message_handlers.analysis_check import analysis_check_from_photo, analysis_check_from_text
 from logs.errors import OpenAIServiceError, ApplicationError
 
-processing_message = None
+def parse_document(path: str) -> dict:
+    """
+    Text and metadata of a document, runs in a worker thread
+    :param path: Downloaded file
+    """
+    # Imported here, so tika (its package pulls in more than the parser) loads on the first document and off the event loop
+    from tika import parser
+    return parser.from_file(path)
 
-async def handle_message(message: types.Message, tools_type = None, ai_handler = None, user_input_list = None):
-    async def extract_with_recursive_regex(s: str) -> str:
-        pattern = r'\{(?:[^{}]|(?R))*\}'     
-        m = regex.search(pattern, s)
-        return m.group(0) if m else ""
+async def record_cached_answer(chat_id: int, user_model: str, operation: str, user_limits: list, answer: str | dict, user_text: str | None = None):
+    """
+    Records a cached answer like a fresh one: chat history, the request count and the usage ledger
+    :param operation: Kind of request (photo, voice, document, check_photo)
+    :param user_limits: [tokens, requests, date_requests] of the user
+    :param answer: Cached "<b>AI: </b>..." answer, or a receipt, which like a fresh one isn't added to the history
+    :param user_text: User message to add to the history before the answer, if any
+    """
+    if isinstance(answer, str):
+        if user_text is not None:
+            await update_chat_history(chat_id, {"role": "user", "content": user_text})
+        await update_chat_history(chat_id, {"role": "assistant", "content": answer.removeprefix("<b>AI: </b>")})
+    # Serving from the cache costs no tokens, but it is a request of the user
+    await update_user_data(chat_id, "requests", user_limits[1] + 1)
+    record_usage(chat_id, user_model, operation)
 
+async def extract_with_recursive_regex(s: str) -> str:
+    """
+    Returns the first balanced {...} block of a model answer (the receipt JSON), or "" if there is none
+    :param s: Model answer
+    """
+    pattern = r'\{(?:[^{}]|(?R))*\}'
+    m = regex.search(pattern, s)
+    return m.group(0) if m else ""
+
+def is_retryable(error: Exception) -> bool:
+    """
+    AI/API errors another attempt can fix: rate limits, server and network errors, not a rejected request
+    """
+    return isinstance(error, ApplicationError) and getattr(error, "status_code", None) not in (400, 422)
+
+async def handle_message(message: types.Message, tools_type = None, ai_handler = None, user_input_list = None, session: SessionContext = None, retry_errors: bool = False):
+    """
+    Answers a message through the AI model of the user
+    :param retry_errors: Raise errors that is_retryable() instead of answering with their text,
+                         so a background job is attempted again
+    :return: The answer, a "System: " error text or None
+    """
     async def vision_resp(chat_id, lang, user_model, set_answer, vision_role_one_req, user_limits, image_path):
         try:
             json_text = await analysis_check_from_photo(chat_id, lang, user_model, set_answer, vision_role_one_req, user_limits, image_path)
             clear_json = await extract_with_recursive_regex(json_text)
             ai_response = json.loads(clear_json)
-            await logs(f"Chat {chat_id} - model response received (vision_resp): {ai_response}{type(ai_response)}", type_e="info")
+            await logs("Chat %s - model response received (vision_resp): %s%s", chat_id, ai_response, type(ai_response), type_e="debug")
             return ai_response
         except Exception as e:
+            if retry_errors and is_retryable(e):
+                raise
             await logs(f"Error in first_resp: {e} for {json_text}{type(json_text)}", type_e="error")
 
     async def text_resp(chat_id, lang, user_model, set_answer, vision_role_one_req, user_limits, user_input_list):
@@ -43,9 +88,11 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
             json_text = await analysis_check_from_text(chat_id, lang, user_model, web_enabled, set_answer, vision_role_one_req, user_limits, user_input_list)
             clear_json = await extract_with_recursive_regex(json_text)
             ai_response = json.loads(clear_json)
-            await logs(f"Chat {chat_id} - model response received (text_resp): {ai_response}{type(ai_response)}", type_e="info")
+            await logs("Chat %s - model response received (text_resp): %s%s", chat_id, ai_response, type(ai_response), type_e="debug")
             return ai_response
         except Exception as e:
+            if retry_errors and is_retryable(e):
+                raise
             await logs(f"Error in text_resp: {e}", type_e="error")
             return f"<b>System: </b>{MESSAGES.get(lang, {}).get('error', 'An error occurred')}"
         
@@ -54,10 +101,12 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
     user_text = ""
     result_answer_from_ai = None
 
-    await logs(f"Starting handle message from chat {chat_id}", type_e="info")
+    await logs("Starting handle message from chat %s", chat_id, type_e="info")
 
-    user_data = await read_user_all_data(chat_id)
-    lang = user_data.get("language", DEFAULT_LANGUAGES)
+    if session is None:
+        session = await load_session(chat_id)
+    user_data = session.user_data
+    lang = session.lang
     context_enabled = user_data.get("context_enabled", False)
     web_enabled = user_data.get("web_enabled", False)
     user_model = user_data.get("model")
@@ -78,35 +127,45 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
 
     user_model="dall-e-3" if tools_type == "image" else user_model
     user_model="AI_bot" if tools_type == "check" else user_model
+    current_span().set_attribute("model", user_model)
+    if tools_type:
+        current_span().set_attribute("tools_type", tools_type)
 
     try:
         if await check_user_limits(user_limits, chat_id):
-            global processing_message
-            if message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
+            if session.processing_message is not None:
+                # Status message of a queued job becomes the "Processing..." message
+                try:
+                    await session.processing_message.edit_text(
+                        MESSAGES.get(lang, {}).get("processing", "Processing...").format(user_model)
+                    )
+                except TelegramBadRequest:
+                    session.processing_message = None
+            if session.processing_message is None and message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
                 remove_keyboard = types.ReplyKeyboardRemove()
-                processing_message = await message.answer(
+                session.processing_message = await message.answer(
                     MESSAGES.get(lang, {}).get("processing", "Processing...").format(user_model),
                     reply_markup=remove_keyboard
                 )
-            else:
-                processing_message = await message.answer(
+            elif session.processing_message is None:
+                session.processing_message = await message.answer(
                     MESSAGES.get(lang, {}).get("processing", "Processing...").format(user_model),
                     reply_markup=await get_persistent_menu(chat_id)
                 )
-            await logs(f"Chat {chat_id} - processing start message sent", type_e="info")
+            await logs("Chat %s - processing start message sent", chat_id, type_e="info")
 
             if message.content_type == "text" and tools_type == None:
                 text = message.text
                 cleaned_text = text.replace(f"@{BOT_USERNAME}", "").strip()
                 user_text = cleaned_text
-                await logs(f"Text message from {chat_id}: {user_text}", type_e="info")
+                await logs("Text message from %s: %s", chat_id, user_text, type_e="debug")
                 result_answer_from_ai = await text_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text)
 
             elif message.content_type == "text" and tools_type == "image":
                 text = message.text
                 cleaned_text = text.replace(f"@{BOT_USERNAME}", "").strip()
                 user_text = cleaned_text
-                await logs(f"Text message from {chat_id}: {user_text}", type_e="info")
+                await logs("Text message from %s: %s", chat_id, user_text, type_e="debug")
                 result_answer_from_ai = await generate_image_ai_response(chat_id, lang, user_model, resolution, quality, user_limits, user_text)
 
             elif message.content_type == "text" and tools_type == "check":
@@ -114,59 +173,96 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
                     user_text_input = "\n".join(f"{key}: {user_input_list[i]}" for i, key in enumerate(struckture_data))
                     result_answer_from_ai = await text_resp(chat_id, lang, user_model, set_answer, vision_role_one_req, user_limits, user_text_input)
                 except Exception as e:
+                    if retry_errors and is_retryable(e):
+                        raise
                     await logs(f"Error in text_resp: {e}", type_e="error")
                     return f"<b>System: </b>{MESSAGES.get(lang, {}).get('error', 'An error occurred')}"
             
             elif message.content_type == "photo":
-                try:
+                photo = message.photo[-1]
+                if signature:
+                    user_text = f"{signature}:\n{user_text}"
+                # Answers with chat context depend on the history, so they are never cached
+                cache_key = None if context_enabled else make_cache_key(photo.file_unique_id, "photo", user_model, lang, set_answer, role, web_enabled, user_text)
+                if cache_key:
+                    result_answer_from_ai = await get_cached_result(cache_key)
+                if result_answer_from_ai is None:
                     image_path = f"{chat_id}_image.jpg"
-                    file_info = await message.bot.get_file(message.photo[-1] .file_id)
-                    await message.bot.download_file(file_info.file_path, destination=image_path)
-                    await resize_image(image_path)
-                    if signature:
-                        user_text = f"{signature}:\n{user_text}"
-                    result_answer_from_ai = await photo_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text, image_path)
-                    await logs(f"Photo successfully uploaded for {chat_id} to {image_path}", type_e="info")
-                finally:
-                    if os.path.exists(image_path):
-                        os.remove(image_path)
+                    try:
+                        with start_span("file.download", file_size=photo.file_size):
+                            file_info = await message.bot.get_file(photo.file_id)
+                            await message.bot.download_file(file_info.file_path, destination=image_path)
+                        await resize_image(image_path)
+                        result_answer_from_ai = await photo_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text, image_path)
+                        await logs("Photo successfully uploaded for %s to %s", chat_id, image_path, type_e="info")
+                        if cache_key and result_answer_from_ai and result_answer_from_ai.startswith("<b>AI: </b>"):
+                            await store_result(cache_key, result_answer_from_ai)
+                    finally:
+                        if os.path.exists(image_path):
+                            os.remove(image_path)
+                else:
+                    await record_cached_answer(chat_id, user_model, "photo", user_limits, result_answer_from_ai)
+                    await logs("Chat %s - photo result served from cache", chat_id, type_e="info")
 
             elif message.content_type == "voice":
-                try:
+                cache_key = None if context_enabled else make_cache_key(message.voice.file_unique_id, "voice", user_model, lang, set_answer, role, web_enabled)
+                if cache_key:
+                    result_answer_from_ai = await get_cached_result(cache_key)
+                if result_answer_from_ai is None:
                     user_id = message.from_user.id
                     ogg_file = f"{user_id}.ogg"
                     wav_file = f"{user_id}.wav"
-                    file_info = await message.bot.get_file(message.voice.file_id)
-                    await message.bot.download_file(file_info.file_path, destination=ogg_file)
-                    await logs(f"Voice file downloaded for {chat_id}", type_e="info")
-
-                    await convert_audio(ogg_file, wav_file)
-                    await logs(f"Audio conversion completed for {chat_id}", type_e="info")
-                    result_answer_from_ai = await voice_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text, wav_file)
-                    await logs(f"Voice message AI response for {chat_id}: {result_answer_from_ai}", type_e="info")
-                finally:
-                    if os.path.exists(ogg_file):
-                        os.remove(ogg_file)
-                    if os.path.exists(wav_file):
-                        os.remove(wav_file)
+                    try:
+                        with start_span("file.download", file_size=message.voice.file_size):
+                            file_info = await message.bot.get_file(message.voice.file_id)
+                            await message.bot.download_file(file_info.file_path, destination=ogg_file)
+                        await logs("Voice file downloaded for %s", chat_id, type_e="info")
+
+                        await convert_audio(ogg_file, wav_file)
+                        await logs("Audio conversion completed for %s", chat_id, type_e="info")
+                        result_answer_from_ai = await voice_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text, wav_file)
+                        await logs("Voice message AI response for %s: %s", chat_id, result_answer_from_ai, type_e="debug")
+                        if cache_key and result_answer_from_ai and result_answer_from_ai.startswith("<b>AI: </b>"):
+                            await store_result(cache_key, result_answer_from_ai)
+                    finally:
+                        if os.path.exists(ogg_file):
+                            os.remove(ogg_file)
+                        if os.path.exists(wav_file):
+                            os.remove(wav_file)
+                else:
+                    # The voice handler saves the (empty) user text before the answer
+                    await record_cached_answer(chat_id, user_model, "voice", user_limits, result_answer_from_ai, user_text)
+                    await logs("Chat %s - voice result served from cache", chat_id, type_e="info")
 
             elif message.content_type == "document" and tools_type == None:
                 document = message.document
                 file_name = document.file_name
                 doc_file = f"{chat_id}_{file_name}"
+                # Answers with chat context depend on the history, so they are never cached
+                cache_key = None if context_enabled else make_cache_key(document.file_unique_id, "document", user_model, lang, set_answer, role, web_enabled)
                 try:
                     if not any(file_name.lower().endswith(ext) for ext in SUPPORTED_EXTENSIONS):
-                        await processing_message.delete()
+                        await session.delete_processing_message()
                         return f"<b>System: </b>{MESSAGES.get(lang, {}).get('unsupported_file', 'Unsupported file format').format(SUPPORTED_EXTENSIONS)}"
-                    file_info = await message.bot.get_file(document.file_id)
-                    await message.bot.download_file(file_info.file_path, destination=doc_file)
-                    parsed = await asyncio.to_thread(parser.from_file, doc_file)
-                    user_text = parsed.get("content", "").strip()
-                    if not user_text:
-                        return f"<b>System: </b>{MESSAGES.get(lang, {}).get('empty_file', 'Empty file')}"
-                    await logs(f"Document successfully parsed for {chat_id}", type_e="info")
-                    result_answer_from_ai = await document_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text)
-                    await logs(f"Document message AI response for {chat_id}: {result_answer_from_ai}", type_e="info")
+                    if cache_key:
+                        result_answer_from_ai = await get_cached_result(cache_key)
+                    if result_answer_from_ai is None:
+                        with start_span("file.download", file_size=document.file_size):
+                            file_info = await message.bot.get_file(document.file_id)
+                            await message.bot.download_file(file_info.file_path, destination=doc_file)
+                        with start_span("document.parse"):
+                            parsed = await asyncio.to_thread(parse_document, doc_file)
+                        user_text = parsed.get("content", "").strip()
+                        if not user_text:
+                            return f"<b>System: </b>{MESSAGES.get(lang, {}).get('empty_file', 'Empty file')}"
+                        await logs("Document successfully parsed for %s", chat_id, type_e="info")
+                        result_answer_from_ai = await document_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text)
+                        await logs("Document message AI response for %s: %s", chat_id, result_answer_from_ai, type_e="debug")
+                        if cache_key and result_answer_from_ai and result_answer_from_ai.startswith("<b>AI: </b>"):
+                            await store_result(cache_key, result_answer_from_ai)
+                    else:
+                        await record_cached_answer(chat_id, user_model, "document", user_limits, result_answer_from_ai)
+                        await logs("Chat %s - document result served from cache", chat_id, type_e="info")
                 finally:
                     if os.path.exists(doc_file):
                         os.remove(doc_file)
@@ -176,27 +272,35 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
                 try:
                     if ai_handler == "api_vision":
                         try:
-                            file_info = await message.bot.get_file(message.document.file_id)
-                            downloaded_file = await message.bot.download_file(file_info.file_path)
-                            async with aiofiles.open(image_path, "wb") as new_file:
-                                if hasattr(downloaded_file, "getvalue"):
-                                    await new_file.write(downloaded_file.getvalue())
-                                    await logs(f"Document successfully downloaded: {image_path}", type_e="info")
-                                else:
-                                    await new_file.write(downloaded_file)
-                            result_answer_from_ai = await vision_resp(chat_id, lang, user_model, set_answer, vision_role_one_req, user_limits, image_path)
+                            cache_key = make_cache_key(message.document.file_unique_id, "check", DEFAULT_MODEL_FOR_VISION, vision_role_one_req)
+                            result_answer_from_ai = await get_cached_result(cache_key)
+                            if result_answer_from_ai is None:
+                                with start_span("file.download", file_size=message.document.file_size):
+                                    file_info = await message.bot.get_file(message.document.file_id)
+                                    downloaded_file = await message.bot.download_file(file_info.file_path)
+                                async with aiofiles.open(image_path, "wb") as new_file:
+                                    if hasattr(downloaded_file, "getvalue"):
+                                        await new_file.write(downloaded_file.getvalue())
+                                        await logs("Document successfully downloaded: %s", image_path, type_e="info")
+                                    else:
+                                        await new_file.write(downloaded_file)
+                                result_answer_from_ai = await vision_resp(chat_id, lang, user_model, set_answer, vision_role_one_req, user_limits, image_path)
+                                if isinstance(result_answer_from_ai, dict):
+                                    await store_result(cache_key, result_answer_from_ai)
+                            else:
+                                await record_cached_answer(chat_id, user_model, "check_photo", user_limits, result_answer_from_ai)
+                                await logs("Chat %s - receipt result served from cache", chat_id, type_e="info")
                         except Exception as e:
+                            if retry_errors and is_retryable(e):
+                                raise
                             await logs(f"Error in vision_resp: {e}", type_e="error")
                             return f"<b>System: </b>{MESSAGES.get(lang, {}).get('error', 'An error occurred')}"
                 finally:
                     if os.path.exists(image_path):
                         os.remove(image_path)
             
-            if message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
-                await processing_message.delete()
-            else:
-                await processing_message.delete()
-            await logs(f"Chat {chat_id} - processing message deleted", type_e="info")
+            await session.delete_processing_message()
+            await logs("Chat %s - processing message deleted", chat_id, type_e="info")
 
             if result_answer_from_ai is not None:
                 return result_answer_from_ai
@@ -204,13 +308,15 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
                 return None
         else:
             try:
-                await processing_message.delete()
+                await session.delete_processing_message()
             except Exception as delete_error:
                 await logs(f"Module: handle_message. Error deleting 'Processing...' message: {delete_error}", type_e="error")
             return f"<b>System: </b>{MESSAGES.get(lang, {}).get('limit_reached', 'Request limit exceeded')}"
     except OpenAIServiceError as e:
         await logs(f"Error in handle_message: {e}", type_e="error") 
-        await processing_message.delete()
+        if retry_errors and is_retryable(e):
+            raise
+        await session.delete_processing_message()
         if e.status_code == 429:
             return f"<b>System: </b>{MESSAGES.get(lang, {}).get('error_429', f'{e.status_code}: {e.code}')}"
         elif e.status_code == 422:
@@ -221,5 +327,7 @@ async def handle_message(message: types.Message, tools_type = None, ai_handler =
             return f"<b>System: </b>OpenAI error {e.status_code} / {e.code}"
     except ApplicationError as e:
         await logs(f"Error in handle_message for chat {chat_id} with {message.content_type}: {e}", type_e="error")
-        await processing_message.delete()
+        if retry_errors and is_retryable(e):
+            raise
+        await session.delete_processing_message()
         return f"<b>System: </b>{MESSAGES.get(lang, {}).get('error', 'An error occurred')}"
@@ -0,0 +1,79 @@
+"""
+Health endpoints served on the web server: /healthz and /readyz.
+
+Probes are registered with add_probe() and their results are reused for
+HEALTH_PROBE_TTL seconds, so frequent checks by an orchestrator or a load
+balancer don't turn into database load. /healthz runs the liveness probes
+(a failure means the process can't recover by itself and should be
+restarted), /readyz runs all probes (a failure means it shouldn't get traffic).
+"""
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+from config.config import HEALTH_PROBE_TTL, HEALTH_PROBE_TIMEOUT
+from services.asgi_routes import WebRequest, WebResponse, web_routes
+from services.db_utils import ping_db
+
+ProbeCheck = Callable[[], Awaitable[Tuple[bool, str]]]
+
+class Probe:
+    """
+    A named check with a cached result
+    """
+    def __init__(self, name: str, check: ProbeCheck, liveness: bool):
+        self.name = name
+        self.check = check
+        self.liveness = liveness
+        self.ok = None
+        self.detail = ""
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def result(self) -> dict:
+        # Concurrent requests wait for the running check instead of starting their own
+        async with self._lock:
+            if self.ok is None or time.monotonic() - self.checked_at >= HEALTH_PROBE_TTL:
+                try:
+                    self.ok, self.detail = await asyncio.wait_for(self.check(), timeout=HEALTH_PROBE_TIMEOUT + 1)
+                except asyncio.TimeoutError:
+                    self.ok, self.detail = False, "timeout"
+                except Exception as e:
+                    self.ok, self.detail = False, repr(e)
+                self.checked_at = time.monotonic()
+        return {"ok": self.ok, "detail": self.detail, "age": round(time.monotonic() - self.checked_at, 1)}
+
+_probes: Dict[str, Probe] = {}
+
+def add_probe(name: str, check: ProbeCheck, liveness: bool = False):
+    """
+    Registers a probe
+    :param name: Name shown in the response
+    :param check: Coroutine function returning (ok, detail)
+    :param liveness: Also checked by /healthz, not only by /readyz
+    """
+    _probes[name] = Probe(name, check, liveness)
+
+async def check_database() -> Tuple[bool, str]:
+    ok = await ping_db(timeout=HEALTH_PROBE_TIMEOUT)
+    return ok, "ok" if ok else "database is not reachable"
+
+async def _respond(probes: list) -> WebResponse:
+    results = {probe.name: await probe.result() for probe in probes}
+    healthy = all(result["ok"] for result in results.values())
+    body = json.dumps({"status": "ok" if healthy else "fail", "checks": results})
+    return WebResponse(200 if healthy else 503, body, content_type="application/json")
+
+async def healthz(request: WebRequest) -> WebResponse:
+    return await _respond([probe for probe in _probes.values() if probe.liveness])
+
+async def readyz(request: WebRequest) -> WebResponse:
+    return await _respond(list(_probes.values()))
+
+def register_health_routes():
+    """
+    Adds the database probe and serves /healthz and /readyz
+    """
+    add_probe("database", check_database)
+    web_routes.add_route("/healthz", healthz)
+    web_routes.add_route("/readyz", readyz)
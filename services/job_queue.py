@@ -0,0 +1,228 @@
+"""
+Durable background jobs for long-running AI tasks.
+
+Handlers put a job into the "jobs" table and return right away. Workers claim
+due jobs with FOR UPDATE SKIP LOCKED, so any number of workers can poll the
+table without blocking each other. A job that fails is retried with
+exponential backoff, so handlers let transient AI errors raise until the last
+attempt (handle_message's retry_errors) and only then answer with the error
+text. A job whose process died is taken again once its lease expires, or
+marked as failed if that was its last attempt. Jobs of a chat are only taken
+by the process that handles that chat's updates (see services/supervisor.py),
+so FSM data stays consistent.
+"""
+import asyncio
+import importlib
+import time
+from aiogram import types
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
+from config.config import (
+    MESSAGES,
+    JOB_WORKERS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_DELAY,
+    JOB_RETRY_MAX_DELAY,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_INTERVAL,
+    JOB_RETENTION
+)
+from logs.log import logs
+from services.db_utils import insert_job, claim_job, extend_job_lease, complete_job, fail_job, fail_expired_jobs, purge_finished_jobs
+import services.telegram_bot_init as bot_tg
+from services.loop_watchdog import attributed
+from services.tracing import start_trace
+
+# Job type -> "module:function" taking a Job; resolved lazily to avoid import cycles with the handlers
+JOB_HANDLERS = {
+    "receipt_document": "handlers.callbacks_options:run_receipt_document_job",
+    "receipt_input": "handlers.callbacks_options:run_receipt_input_job",
+    "document": "handlers.messages:run_document_job"
+}
+
+_wakeup = asyncio.Event()
+_stats = {"enqueued": 0, "processed": 0, "retried": 0, "failed": 0, "running": 0}
+
+class Job:
+    """
+    A claimed job as seen by its handler
+    """
+    def __init__(self, record: dict):
+        self.id = record["id"]
+        self.job_type = record["job_type"]
+        self.chat_id = record["chat_id"]
+        self.payload = record["payload"] or {}
+        self.attempts = record["attempts"]
+        self.max_attempts = record["max_attempts"]
+        self.lang = self.payload.get("lang")
+
+    @property
+    def message(self) -> types.Message | None:
+        """The user's message the job was created from"""
+        return _restore_message(self.payload.get("message"))
+
+    @property
+    def status_message(self) -> types.Message | None:
+        """The bot's status message that shows the job progress"""
+        return _restore_message(self.payload.get("status_message"))
+
+    async def progress(self, text: str):
+        """
+        Shows progress in the status message and keeps the job reserved for this worker
+        :param text: New text of the status message
+        """
+        await extend_job_lease(self.id, JOB_LEASE_SECONDS)
+        status_message = self.status_message
+        if status_message is None:
+            return
+        try:
+            await status_message.edit_text(text, parse_mode=ParseMode.HTML)
+        except TelegramBadRequest as e:
+            # Deleted meanwhile or the text didn't change
+            await logs(f"Module: job_queue. Status message of job {self.id} not edited: {e}", type_e="warning")
+
+def _restore_message(data: dict | None) -> types.Message | None:
+    if not data:
+        return None
+    return types.Message.model_validate(data, context={"bot": bot_tg.bot})
+
+def _dump_message(message: types.Message) -> dict:
+    return message.model_dump(mode="json", exclude_none=True, by_alias=True)
+
+async def enqueue_job(job_type: str, chat_id: int, payload: dict, max_attempts: int = JOB_MAX_ATTEMPTS) -> int | None:
+    """
+    Adds a job to the queue
+    :param job_type: One of JOB_HANDLERS
+    :param chat_id: Telegram chat the job belongs to
+    :param payload: JSON-serializable job arguments
+    :param max_attempts: Attempts before the job is given up
+    :return: Job ID or None if it couldn't be stored
+    """
+    job_id = await insert_job(job_type, chat_id, payload, max_attempts)
+    if job_id is not None:
+        _stats["enqueued"] += 1
+        _wakeup.set()
+        await logs(f"Job {job_id} ({job_type}) queued for chat {chat_id}", type_e="info")
+    return job_id
+
+async def enqueue_message_job(job_type: str, message: types.Message, lang: str, **payload) -> int | None:
+    """
+    Queues a job for a user's message and answers with a status message
+    that the job edits while it runs
+    :param job_type: One of JOB_HANDLERS
+    :param message: Message to process
+    :param lang: User's language
+    :return: Job ID or None if it couldn't be stored
+    """
+    status_message = await message.answer(
+        MESSAGES.get(lang, {}).get("job_queued", "Request queued, processing will start shortly..."),
+        parse_mode=ParseMode.HTML
+    )
+    job_id = await enqueue_job(job_type, message.chat.id, {
+        "message": _dump_message(message),
+        "status_message": _dump_message(status_message),
+        "lang": lang,
+        **payload
+    })
+    if job_id is None:
+        await status_message.edit_text(
+            f"<b>System: </b>{MESSAGES.get(lang, {}).get('error', 'An error occurred')}",
+            parse_mode=ParseMode.HTML
+        )
+    return job_id
+
+async def _run_job(job: Job):
+    module_name, func_name = JOB_HANDLERS[job.job_type].split(":")
+    handler = getattr(importlib.import_module(module_name), func_name)
+    started = time.monotonic()
+    try:
+        with attributed(handler=f"job.{job.job_type}", job_id=job.id, chat_id=job.chat_id), \
+                start_trace("job", kind="consumer", job_type=job.job_type, job_id=job.id, chat_id=job.chat_id, attempt=job.attempts):
+            await handler(job)
+    except Exception as e:
+        delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+        status = await fail_job(job.id, repr(e), delay)
+        await logs(f"Module: job_queue. Job {job.id} ({job.job_type}) attempt {job.attempts}/{job.max_attempts} failed: {e}", type_e="error")
+        if status == "failed":
+            _stats["failed"] += 1
+            await _report_failure(job)
+        else:
+            _stats["retried"] += 1
+            await job.progress(
+                MESSAGES.get(job.lang, {}).get("job_retry", "Temporary error, retrying in {} s...").format(int(delay))
+            )
+        return
+    await complete_job(job.id)
+    _stats["processed"] += 1
+    await logs(f"Job {job.id} ({job.job_type}) done in {time.monotonic() - started:.1f}s", type_e="info")
+
+async def _report_failure(job: Job):
+    text = f"<b>System: </b>{MESSAGES.get(job.lang, {}).get('error', 'An error occurred')}"
+    status_message = job.status_message
+    try:
+        if status_message is not None:
+            await status_message.edit_text(text, parse_mode=ParseMode.HTML)
+        else:
+            await bot_tg.bot.send_message(chat_id=job.chat_id, text=text, parse_mode=ParseMode.HTML)
+    except TelegramBadRequest:
+        await bot_tg.bot.send_message(chat_id=job.chat_id, text=text, parse_mode=ParseMode.HTML)
+
+async def _fail_expired(shard_index: int, shard_count: int):
+    # Jobs whose process died on their last attempt are never claimed again
+    for record in await fail_expired_jobs(shard_index, shard_count):
+        job = Job(record)
+        _stats["failed"] += 1
+        await logs(f"Module: job_queue. Job {job.id} ({job.job_type}) lease expired on attempt {job.attempts}/{job.max_attempts}, giving up", type_e="error")
+        try:
+            await _report_failure(job)
+        except Exception as e:
+            await logs(f"Module: job_queue. Error reporting failed job {job.id}: {e}", type_e="error")
+
+async def _worker(shutdown_event: asyncio.Event, shard_index: int, shard_count: int):
+    while not shutdown_event.is_set():
+        record = await claim_job(shard_index, shard_count, JOB_LEASE_SECONDS)
+        if record is None:
+            await _fail_expired(shard_index, shard_count)
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        _stats["running"] += 1
+        try:
+            await _run_job(Job(record))
+        except Exception as e:
+            await logs(f"Module: job_queue. Error running job {record['id']}: {e}", type_e="error")
+        finally:
+            _stats["running"] -= 1
+
+async def run_job_workers(shutdown_event: asyncio.Event, shard_index: int = 0, shard_count: int = 1):
+    """
+    Runs JOB_WORKERS job workers of this process until shutdown. Jobs still running
+    at shutdown are left to their lease and picked up again after the restart.
+    :param shutdown_event: Event set when the application stops
+    :param shard_index: Index of this process among the bot workers
+    :param shard_count: Number of bot worker processes
+    """
+    workers = [
+        asyncio.create_task(_worker(shutdown_event, shard_index, shard_count), name=f"job-worker-{i}")
+        for i in range(JOB_WORKERS)
+    ]
+    await logs(f"{JOB_WORKERS} job workers started", type_e="info")
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=3600)
+        except asyncio.TimeoutError:
+            if shard_index == 0:
+                await purge_finished_jobs(JOB_RETENTION)
+    _wakeup.set()
+    await asyncio.wait(workers, timeout=30)
+    for worker in workers:
+        worker.cancel()
+
+def get_job_stats() -> dict:
+    """
+    Returns job counters of this process
+    """
+    return dict(_stats)
@@ -0,0 +1,25 @@
+import importlib.util
+import sys
+
+def lazy_module(name: str):
+    """
+    Module that is executed on its first attribute access instead of on import
+
+    Heavy dependencies used by few handlers or late in startup (pandas, openai, img2pdf,
+    Django) are bound with this at module level, so starting the bot, a worker or a CLI doesn't
+    import them; the first update that needs one pays for it once. A missing module still fails
+    here. The first access isn't guarded by the import lock: modules first used in worker
+    threads (tika, Pillow) are imported inside the thread's function instead.
+    :param name: Module name, e.g. "pandas"
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
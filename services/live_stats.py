@@ -0,0 +1,232 @@
+"""
+Rolling per-minute statistics for the /stats command of the info bot.
+
+The handler and LLM instrumentation (services/metrics.py) add to the bucket
+of the current minute; buckets older than STATS_WINDOW_MINUTES are dropped.
+A report only merges the buckets in memory, nothing is read from the logs
+or the database. Latencies go into fixed log-scale buckets, so percentiles
+are approximate (within one bucket, 25%) and the summaries of the worker
+processes can be added up in supervisor mode.
+"""
+import bisect
+import time
+from collections import deque
+from typing import Dict, Iterable, List
+from config.config import STATS_WINDOW_MINUTES
+
+# 1 ms ... ~9 min, each bound 25% above the previous one
+LATENCY_BOUNDS = tuple(0.001 * 1.25 ** i for i in range(60))
+
+def _cache_counters() -> tuple:
+    from services.media_cache import get_cache_stats
+    stats = get_cache_stats()
+    hits = stats["memory_hits"] + stats["db_hits"]
+    return hits, hits + stats["misses"]
+
+def _pool_in_use() -> tuple:
+    from services.db_utils import get_pool_stats
+    stats = get_pool_stats()
+    return stats.get("in_use", 0), stats.get("max_size", 0)
+
+class _Minute:
+    __slots__ = ("minute", "updates", "errors", "latency", "llm", "users", "pool_samples", "pool_in_use", "pool_peak", "cache_start")
+
+    def __init__(self, minute: int):
+        self.minute = minute
+        self.updates = 0
+        self.errors = 0
+        self.latency: Dict[str, List[int]] = {}
+        self.llm: Dict[str, Dict[str, int]] = {}
+        self.users: set = set()
+        self.pool_samples = 0
+        self.pool_in_use = 0
+        self.pool_peak = 0
+        # Cache counters when the minute started; the window rate is the difference to now
+        self.cache_start = _cache_counters()
+
+class LiveStats:
+    """
+    Per-minute buckets of the last STATS_WINDOW_MINUTES
+    """
+    def __init__(self, minutes: int = STATS_WINDOW_MINUTES):
+        self.minutes = minutes
+        self._buckets: deque = deque()
+
+    def _current(self) -> _Minute:
+        minute = int(time.time() // 60)
+        if not self._buckets or self._buckets[-1].minute != minute:
+            self._buckets.append(_Minute(minute))
+        self._expire(minute)
+        return self._buckets[-1]
+
+    def _expire(self, minute: int):
+        while self._buckets and self._buckets[0].minute <= minute - self.minutes:
+            self._buckets.popleft()
+
+    def record_update(self, content_type: str, duration: float, user_id: int | None, failed: bool = False):
+        bucket = self._current()
+        bucket.updates += 1
+        bucket.errors += failed
+        counts = bucket.latency.get(content_type)
+        if counts is None:
+            counts = bucket.latency[content_type] = [0] * (len(LATENCY_BOUNDS) + 1)
+        counts[bisect.bisect_left(LATENCY_BOUNDS, duration)] += 1
+        if user_id is not None:
+            bucket.users.add(user_id)
+        # Sampled whenever an update finishes, i.e. as often as the pool is under load
+        in_use = _pool_in_use()[0]
+        bucket.pool_samples += 1
+        bucket.pool_in_use += in_use
+        bucket.pool_peak = max(bucket.pool_peak, in_use)
+
+    def _llm(self, model: str) -> Dict[str, int]:
+        bucket = self._current()
+        entry = bucket.llm.get(model)
+        if entry is None:
+            entry = bucket.llm[model] = {"calls": 0, "errors": 0, "prompt": 0, "completion": 0}
+        return entry
+
+    def record_llm(self, model: str, failed: bool = False):
+        entry = self._llm(model)
+        entry["calls"] += 1
+        entry["errors"] += failed
+
+    def record_tokens(self, model: str, prompt: int, completion: int):
+        entry = self._llm(model)
+        entry["prompt"] += prompt
+        entry["completion"] += completion
+
+    def summary(self) -> dict:
+        """
+        The window of this process as a plain dict that can be sent between processes and merged
+        """
+        self._expire(int(time.time() // 60))
+        latency: Dict[str, List[int]] = {}
+        llm: Dict[str, Dict[str, int]] = {}
+        users: set = set()
+        samples = in_use = peak = 0
+        for bucket in self._buckets:
+            for content_type, counts in bucket.latency.items():
+                total = latency.setdefault(content_type, [0] * len(counts))
+                for index, count in enumerate(counts):
+                    total[index] += count
+            for model, entry in bucket.llm.items():
+                total = llm.setdefault(model, dict.fromkeys(entry, 0))
+                for key, value in entry.items():
+                    total[key] += value
+            users |= bucket.users
+            samples += bucket.pool_samples
+            in_use += bucket.pool_in_use
+            peak = max(peak, bucket.pool_peak)
+        max_size = _pool_in_use()[1]
+        hits, lookups = _cache_counters()
+        if self._buckets:
+            start_hits, start_lookups = self._buckets[0].cache_start
+            hits, lookups = hits - start_hits, lookups - start_lookups
+        return {
+            "updates": {bucket.minute: bucket.updates for bucket in self._buckets},
+            "errors": sum(bucket.errors for bucket in self._buckets),
+            "latency": latency,
+            "llm": llm,
+            "users": len(users),
+            "pool": {
+                "avg_in_use": in_use / samples if samples else 0.0,
+                "max_size": max_size,
+                "peak_saturation": peak / max_size if max_size else 0.0
+            },
+            "cache": {"hits": hits, "lookups": lookups}
+        }
+
+def merge(summaries: Iterable[dict]) -> dict:
+    """
+    Adds up the summaries of several processes. Chats are sharded by chat id,
+    so a user is counted by one worker and user counts can be added too.
+    Every process has its own pool; the peak saturation is the one of the busiest.
+    """
+    merged = {"updates": {}, "errors": 0, "latency": {}, "llm": {}, "users": 0,
+              "pool": {"avg_in_use": 0.0, "max_size": 0, "peak_saturation": 0.0}, "cache": {"hits": 0, "lookups": 0}}
+    for summary in summaries:
+        for minute, count in summary["updates"].items():
+            merged["updates"][minute] = merged["updates"].get(minute, 0) + count
+        merged["errors"] += summary["errors"]
+        for content_type, counts in summary["latency"].items():
+            total = merged["latency"].setdefault(content_type, [0] * len(counts))
+            for index, count in enumerate(counts):
+                total[index] += count
+        for model, entry in summary["llm"].items():
+            total = merged["llm"].setdefault(model, dict.fromkeys(entry, 0))
+            for key, value in entry.items():
+                total[key] += value
+        merged["users"] += summary["users"]
+        merged["pool"]["avg_in_use"] += summary["pool"]["avg_in_use"]
+        merged["pool"]["max_size"] += summary["pool"]["max_size"]
+        merged["pool"]["peak_saturation"] = max(merged["pool"]["peak_saturation"], summary["pool"]["peak_saturation"])
+        for key in ("hits", "lookups"):
+            merged["cache"][key] += summary["cache"][key]
+    return merged
+
+def percentile(counts: List[int], q: float) -> float:
+    """
+    Upper bound of the latency bucket holding the q-th quantile
+    """
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BOUNDS[index] if index < len(LATENCY_BOUNDS) else float("inf")
+    return float("inf")
+
+def _format_seconds(value: float) -> str:
+    if value == float("inf"):
+        return f">{LATENCY_BOUNDS[-1]:.0f}s"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.1f}s"
+
+def render(summary: dict, minutes: int = STATS_WINDOW_MINUTES, processes: int = 1) -> str:
+    """
+    Text report of a (merged) summary
+    """
+    now_minute = int(time.time() // 60)
+    per_minute = [summary["updates"].get(minute, 0) for minute in range(now_minute - minutes + 1, now_minute + 1)]
+    total = sum(per_minute)
+    lines = [f"Last {minutes} min" + (f", {processes} processes" if processes > 1 else "")]
+    lines.append(
+        f"Updates: {total} ({summary['errors']} failed), {total / minutes:.1f}/min avg, "
+        f"{max(per_minute)}/min peak, {per_minute[-2] if minutes > 1 else per_minute[-1]} in the last full minute"
+    )
+    lines.append(f"Active users: {summary['users']}")
+
+    lines.append("\nLatency by content type (count, p50, p95):")
+    by_count = sorted(summary["latency"].items(), key=lambda item: -sum(item[1]))
+    for content_type, counts in by_count:
+        lines.append(
+            f"  {content_type}: {sum(counts)}, "
+            f"{_format_seconds(percentile(counts, 0.5))}, {_format_seconds(percentile(counts, 0.95))}"
+        )
+    if not by_count:
+        lines.append("  no updates")
+
+    lines.append("\nLLM by model (calls, errors, prompt/completion tokens):")
+    for model, entry in sorted(summary["llm"].items(), key=lambda item: -item[1]["calls"]):
+        lines.append(f"  {model}: {entry['calls']}, {entry['errors']}, {entry['prompt']}/{entry['completion']}")
+    if not summary["llm"]:
+        lines.append("  no calls")
+
+    cache = summary["cache"]
+    hit_rate = f"{100 * cache['hits'] / cache['lookups']:.0f}%" if cache["lookups"] else "n/a"
+    lines.append(f"\nMedia cache: {hit_rate} hits of {cache['lookups']} lookups")
+
+    pool = summary["pool"]
+    if pool["max_size"]:
+        lines.append(
+            f"DB pool: {pool['avg_in_use']:.1f} of {pool['max_size']} connections in use on average, "
+            f"peak saturation {100 * pool['peak_saturation']:.0f}%"
+        )
+    else:
+        lines.append("DB pool: not connected")
+    return "\n".join(lines)
+
+live_stats = LiveStats()
@@ -0,0 +1,38 @@
+"""
+Offline end-to-end load test.
+
+Local stand-ins for the Telegram Bot API (fake_telegram.py) and for the
+OpenAI and DeepSeek APIs (fake_llm.py) replace the real services; the bot
+runs unchanged against them, with its real database. Virtual users
+(scenarios.py) send text, photo, voice, document, receipt and callback
+updates and time each step until the bot's answer arrives at the fake
+Bot API.
+
+The bot finds the stand-ins through its config: set TELEGRAM_API_URL,
+OPENAI_BASE_URL and DEEPSEEK_BASE_URL to local addresses, e.g.
+    "TELEGRAM_API_URL": "http://127.0.0.1:8081",
+    "OPENAI_BASE_URL": "http://127.0.0.1:8082/v1",
+    "DEEPSEEK_BASE_URL": "http://127.0.0.1:8083/v1",
+with UPDATES_MODE "polling". The harness refuses to run if any of them
+points elsewhere. Virtual users have IDs from --user-base on; put them in
+white_list (or raise LIMITS) unless the daily limits are what you measure.
+
+    python -m services.load_test --users 50 --duration 120 --llm-latency 1.5 --llm-429-rate 0.02
+"""
+from urllib.parse import urlsplit
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+def local_address(name: str, url: str | None) -> tuple:
+    """Host and port of a stub; refuses anything that isn't local, so the test never reaches the real APIs"""
+    parts = urlsplit(url or "")
+    if parts.hostname not in LOCAL_HOSTS or parts.port is None:
+        raise SystemExit(f"{name} must point at a local port (e.g. http://127.0.0.1:8081), not {url!r}")
+    return parts.hostname, parts.port
+
+def local_database(dsn: str | None):
+    """Refuses a DB_DSN that isn't local, since the tools write their synthetic users into it"""
+    host = urlsplit(dsn or "").hostname
+    # No host means a Unix socket, which is local too
+    if host and host not in LOCAL_HOSTS:
+        raise SystemExit(f"DB_DSN must point at a local Postgres, not {host!r}: synthetic users are written to it")
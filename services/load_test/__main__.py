@@ -0,0 +1,150 @@
+"""
+python -m services.load_test [options]; see services/load_test/__init__.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+from config.config import (
+    TELEGRAM_API_URL,
+    OPENAI_BASE_URL,
+    DEEPSEEK_BASE_URL,
+    TELEGRAM_BOT_TOKEN,
+    BOT_USERNAME,
+    DEFAULT_LANGUAGES,
+    MESSAGES,
+    UPDATES_MODE
+)
+from services.load_test import local_address
+from services.load_test.fake_llm import FakeLLMServer
+from services.load_test.fake_telegram import FakeTelegramServer
+from services.load_test.scenarios import FLOWS, Results, VirtualUser, register_files, llm_reply, render
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m services.load_test", description="Offline end-to-end load test of the bot")
+    parser.add_argument("--users", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load after the ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds over which the users start")
+    parser.add_argument("--think-time", type=float, default=2, help="average pause between flows of a user")
+    parser.add_argument("--mix", default="text=50,photo=15,voice=10,document=10,receipt=5,callback=10",
+                        help=f"flow weights, flows: {', '.join(FLOWS)}")
+    parser.add_argument("--step-timeout", type=float, default=120, help="seconds to wait for the bot's answer")
+    parser.add_argument("--user-base", type=int, default=7_000_000_000, help="user ID of the first virtual user")
+    parser.add_argument("--reuse-media", action="store_true", help="send the same files again, so the media cache answers")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per model request")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="random extra seconds per model request")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of model requests answered with 500")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0, help="share of model requests answered with 429")
+    parser.add_argument("--external-bot", action="store_true", help="don't start the bot, one is already running against the stubs")
+    parser.add_argument("--bot-output", help="file for the bot's stdout and stderr (discarded by default)")
+    parser.add_argument("--json", dest="json_path", help="also write the raw results to this file")
+    return parser.parse_args(argv)
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        flow, _, weight = part.partition("=")
+        flow = flow.strip()
+        if flow not in FLOWS:
+            raise SystemExit(f"Unknown flow {flow!r}, use {', '.join(FLOWS)}")
+        weights[flow] = float(weight or 1)
+    return {flow: weight for flow, weight in weights.items() if weight > 0}
+
+async def start_bot(output: str | None):
+    stdout = open(output, "ab") if output else asyncio.subprocess.DEVNULL
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "main.py", cwd=PROJECT_ROOT, stdout=stdout, stderr=asyncio.subprocess.STDOUT if output else stdout
+    )
+
+async def stop_bot(process, timeout: float = 60):
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+def llm_report(servers: list) -> str:
+    lines = ["", "Model API stubs (requests by endpoint, injected errors):"]
+    for server in servers:
+        requests = ", ".join(f"{endpoint} {count}" for endpoint, count in server.requests.most_common()) or "none"
+        injected = ", ".join(f"{status} x{count}" for status, count in sorted(server.injected.items())) or "none"
+        lines.append(f"  {server.name}: {requests}; injected {injected}")
+    return "\n".join(lines)
+
+async def run(args: argparse.Namespace) -> Results:
+    if UPDATES_MODE != "polling":
+        raise SystemExit("The load test feeds updates through getUpdates; set UPDATES_MODE to polling")
+    weights = parse_mix(args.mix)
+    lang = DEFAULT_LANGUAGES
+    users: dict = {}
+
+    def on_call(token: str, method: str, params: dict):
+        user = users.get(_chat_id(params)) if token == TELEGRAM_BOT_TOKEN else None
+        if user is not None:
+            user.on_call(method, params)
+
+    telegram = FakeTelegramServer(*local_address("TELEGRAM_API_URL", TELEGRAM_API_URL), BOT_USERNAME, on_call)
+    llms = [
+        FakeLLMServer(name, *local_address(setting, url), latency=args.llm_latency, jitter=args.llm_jitter,
+                      error_rate=args.llm_error_rate, rate_limit_rate=args.llm_429_rate, reply=llm_reply(MESSAGES, lang))
+        for name, setting, url in (("openai", "OPENAI_BASE_URL", OPENAI_BASE_URL), ("deepseek", "DEEPSEEK_BASE_URL", DEEPSEEK_BASE_URL))
+    ]
+    register_files(telegram)
+    for server in (telegram, *llms):
+        await server.start()
+
+    bot = None if args.external_bot else await start_bot(args.bot_output)
+    results = Results()
+    try:
+        print("Waiting for the bot to poll...")
+        await telegram.wait_polling(TELEGRAM_BOT_TOKEN, timeout=120)
+        print(f"Running {args.users} users for {args.duration:.0f}s (+{args.ramp_up:.0f}s ramp-up), mix {weights}")
+        results.started = time.monotonic()
+        until = results.started + args.ramp_up + args.duration
+        tasks = []
+        for index in range(args.users):
+            user = VirtualUser(args.user_base + index, TELEGRAM_BOT_TOKEN, telegram, results, lang, args.step_timeout, args.reuse_media)
+            users[user.user_id] = user
+            tasks.append(asyncio.create_task(user.run(weights, until, args.think_time)))
+            await asyncio.sleep(args.ramp_up / max(1, args.users))
+        await asyncio.gather(*tasks)
+        results.finished = time.monotonic()
+    finally:
+        if bot is not None:
+            await stop_bot(bot)
+        for server in (telegram, *llms):
+            await server.stop()
+
+    print(render(results))
+    print(llm_report(llms))
+    print("\nBot API calls: " + ", ".join(f"{method} {count}" for method, count in telegram.calls.most_common()))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "args": vars(args),
+                "elapsed": results.finished - results.started,
+                "flows": results.flows,
+                "steps": results.steps,
+                "llm": {server.name: {"requests": server.requests, "injected": server.injected} for server in llms},
+                "telegram": telegram.calls
+            }, f, indent=2)
+    return results
+
+def _chat_id(params: dict) -> int | None:
+    try:
+        return int(params.get("chat_id"))
+    except (TypeError, ValueError):
+        return None
+
+if __name__ == "__main__":
+    os.chdir(PROJECT_ROOT)
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,177 @@
+"""
+Local stand-in for the OpenAI-compatible APIs the bot uses (OpenAI and DeepSeek).
+
+Answers chat completions, responses (web search), moderations, audio
+transcriptions, image generation and file uploads after a configurable
+latency, and injects 500 errors and 429 rate limits at configurable rates.
+The openai client retries those (twice by default), as it would in production.
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+from collections import Counter
+from typing import Callable
+from aiohttp import web
+
+MODERATION_CATEGORIES = (
+    "harassment", "harassment/threatening", "hate", "hate/threatening", "illicit", "illicit/violent",
+    "self-harm", "self-harm/instructions", "self-harm/intent", "sexual", "sexual/minors",
+    "violence", "violence/graphic"
+)
+# Endpoints that stand for model work and get the full latency; the rest answer at once
+SLOW_ENDPOINTS = {"chat/completions", "responses", "audio/transcriptions", "images/generations"}
+# 1x1 PNG served as the generated image
+GENERATED_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+)
+
+def default_reply(endpoint: str, body: dict) -> str:
+    return "Load test answer. " * 20
+
+class FakeLLMServer:
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int,
+        latency: float = 1.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        reply: Callable[[str, dict], str] = default_reply,
+    ):
+        """
+        :param name: Name in the report (openai, deepseek)
+        :param latency: Seconds a model request takes
+        :param jitter: Up to this many seconds are added at random
+        :param error_rate: Share of requests answered with 500
+        :param rate_limit_rate: Share of requests answered with 429
+        :param reply: Returns the answer text of a chat request from its endpoint and JSON body
+        """
+        self.name = name
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.reply = reply
+        self.requests: Counter = Counter()
+        self.injected: Counter = Counter()
+        self._runner = None
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/{path:.+}", self._handle)
+        app.router.add_get("/images/{name}", lambda request: web.Response(body=GENERATED_IMAGE, content_type="image/png"))
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        # base_url may or may not end with /v1
+        endpoint = request.match_info["path"].strip("/").removeprefix("v1/")
+        self.requests[endpoint] += 1
+        body = await request.json() if request.content_type == "application/json" else {}
+        if endpoint in SLOW_ENDPOINTS:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.injected["429"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (injected by the load test)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after": "1"}
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.injected["500"] += 1
+            return web.json_response(
+                {"error": {"message": "Server error (injected by the load test)", "type": "server_error", "code": None}},
+                status=500
+            )
+        handler = {
+            "chat/completions": self._chat,
+            "responses": self._responses,
+            "moderations": self._moderations,
+            "audio/transcriptions": self._transcription,
+            "images/generations": self._image,
+            "files": self._file,
+        }.get(endpoint)
+        if handler is None:
+            return web.json_response({"error": {"message": f"Unknown endpoint {endpoint}", "type": "invalid_request_error"}}, status=404)
+        return web.json_response(handler(endpoint, body))
+
+    @staticmethod
+    def _usage(body: dict, text: str) -> tuple:
+        prompt = max(1, len(json.dumps(body, ensure_ascii=False)) // 4)
+        return prompt, max(1, len(text) // 4)
+
+    def _chat(self, endpoint: str, body: dict) -> dict:
+        text = self.reply(endpoint, body)
+        prompt, completion = self._usage(body, text)
+        return {
+            "id": f"chatcmpl-{os.urandom(6).hex()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+        }
+
+    def _responses(self, endpoint: str, body: dict) -> dict:
+        text = self.reply(endpoint, body)
+        prompt, completion = self._usage(body, text)
+        return {
+            "id": f"resp_{os.urandom(6).hex()}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "fake"),
+            "status": "completed",
+            "output": [
+                {"type": "web_search_call", "id": f"ws_{os.urandom(6).hex()}", "status": "completed"},
+                {
+                    "type": "message", "id": f"msg_{os.urandom(6).hex()}", "status": "completed", "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]
+                }
+            ],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion,
+                "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}
+            }
+        }
+
+    @staticmethod
+    def _moderations(endpoint: str, body: dict) -> dict:
+        return {
+            "id": f"modr-{os.urandom(6).hex()}",
+            "model": body.get("model", "omni-moderation-latest"),
+            "results": [{
+                "flagged": False,
+                "categories": dict.fromkeys(MODERATION_CATEGORIES, False),
+                "category_scores": dict.fromkeys(MODERATION_CATEGORIES, 0.0),
+                "category_applied_input_types": {category: ["text"] for category in MODERATION_CATEGORIES}
+            }]
+        }
+
+    @staticmethod
+    def _transcription(endpoint: str, body: dict) -> dict:
+        return {"text": "Load test voice message transcription."}
+
+    def _image(self, endpoint: str, body: dict) -> dict:
+        return {"created": int(time.time()), "data": [{"url": f"http://{self.host}:{self.port}/images/fake.png"}]}
+
+    @staticmethod
+    def _file(endpoint: str, body: dict) -> dict:
+        return {
+            "id": f"file-{os.urandom(6).hex()}", "object": "file", "bytes": 0, "created_at": int(time.time()),
+            "filename": "upload", "purpose": "user_data", "status": "processed"
+        }
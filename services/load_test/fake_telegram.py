@@ -0,0 +1,170 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Serves getUpdates (long polling) from queues filled by push_update(), answers
+sendMessage, editMessageText, getFile and the other calls the bot makes with
+plausible objects, serves registered files for download and reports every
+call to on_call(token, method, params).
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Callable, Dict, Tuple
+from aiohttp import web
+
+# Methods answered with a Message; everything not listed in _handlers returns True
+MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "sendDocument", "sendVoice", "sendAudio", "sendVideo",
+    "sendAnimation", "sendSticker", "sendMediaGroup", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageCaption", "editMessageReplyMarkup", "editMessageMedia"
+}
+
+class FakeTelegramServer:
+    def __init__(self, host: str, port: int, bot_username: str, on_call: Callable[[str, str, dict], None] | None = None):
+        self.host = host
+        self.port = port
+        self.bot_username = bot_username
+        self.on_call = on_call
+        self.calls: Counter = Counter()
+        self.files: Dict[str, Tuple[str, bytes]] = {}  # file_id -> (file_path, content)
+        self._pending: Dict[str, list] = {}
+        self._arrived: Dict[str, asyncio.Event] = {}
+        self._polling: Dict[str, asyncio.Event] = {}
+        self._update_id = 0
+        self._message_id = 1000
+        self._runner = None
+        self._handlers = {
+            "getMe": lambda token, params: self._bot_user(token),
+            "getFile": self._get_file,
+            "getWebhookInfo": lambda token, params: {"url": "", "has_custom_certificate": False, "pending_update_count": 0},
+            "getMyCommands": lambda token, params: [],
+            "getChat": lambda token, params: {"id": int(params.get("chat_id", 0)), "type": "private"},
+        }
+
+    def add_file(self, file_id: str, file_path: str, content: bytes):
+        """Makes a file available to getFile and to the file download URL"""
+        self.files[file_id] = (file_path, content)
+
+    def push_update(self, token: str, update: dict) -> int:
+        """Queues an update for the bot with this token; returns its update_id"""
+        self._update_id += 1
+        self._pending.setdefault(token, []).append({"update_id": self._update_id, **update})
+        self._event(self._arrived, token).set()
+        return self._update_id
+
+    def next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    async def wait_polling(self, token: str, timeout: float):
+        """Waits until the bot with this token calls getUpdates for the first time"""
+        await asyncio.wait_for(self._event(self._polling, token).wait(), timeout)
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @staticmethod
+    def _event(events: Dict[str, asyncio.Event], token: str) -> asyncio.Event:
+        event = events.get(token)
+        if event is None:
+            event = events[token] = asyncio.Event()
+        return event
+
+    def _bot_user(self, token: str) -> dict:
+        bot_id = int(token.split(":", 1)[0]) if token.split(":", 1)[0].isdigit() else 1
+        return {"id": bot_id, "is_bot": True, "first_name": "Load test bot", "username": self.bot_username}
+
+    @staticmethod
+    def _params(raw) -> dict:
+        params = {}
+        for key, value in raw.items():
+            if isinstance(value, web.FileField):
+                params[key] = value.filename
+                continue
+            # aiogram sends objects (reply_markup, media) as JSON, everything else as plain strings
+            if isinstance(value, str) and value[:1] in ("{", "["):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        params = self._params(await request.post()) if request.can_read_body else dict(request.query)
+        self.calls[method] += 1
+        if method == "getUpdates":
+            result = await self._get_updates(token, params)
+        else:
+            handler = self._handlers.get(method)
+            if handler is not None:
+                result = handler(token, params)
+            elif method in MESSAGE_METHODS:
+                result = self._message(token, params)
+            else:
+                result = True
+            if self.on_call is not None:
+                self.on_call(token, method, params)
+        if isinstance(result, web.Response):
+            return result
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, token: str, params: dict) -> list:
+        self._event(self._polling, token).set()
+        pending = self._pending.setdefault(token, [])
+        offset = int(params.get("offset") or 0)
+        if offset:
+            pending[:] = [update for update in pending if update["update_id"] >= offset]
+        timeout = float(params.get("timeout") or 0)
+        if not pending and timeout:
+            arrived = self._event(self._arrived, token)
+            arrived.clear()
+            try:
+                await asyncio.wait_for(arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return pending[:int(params.get("limit") or 100)]
+
+    def _message(self, token: str, params: dict) -> dict | bool:
+        if "inline_message_id" in params:
+            return True
+        chat_id = int(params.get("chat_id") or 0)
+        message = {
+            "message_id": int(params.get("message_id") or self.next_message_id()),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": self._bot_user(token),
+        }
+        if params.get("text"):
+            message["text"] = params["text"]
+        if params.get("caption"):
+            message["caption"] = params["caption"]
+        if isinstance(params.get("reply_markup"), dict) and "inline_keyboard" in params["reply_markup"]:
+            message["reply_markup"] = params["reply_markup"]
+        return message
+
+    def _get_file(self, token: str, params: dict):
+        file_id = params.get("file_id")
+        if file_id not in self.files:
+            return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}, status=400)
+        file_path, content = self.files[file_id]
+        return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(content), "file_path": file_path}
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        for file_path, content in self.files.values():
+            if file_path == path:
+                return web.Response(body=content)
+        return web.Response(status=404)
@@ -0,0 +1,272 @@
+"""
+Virtual users of the load test.
+
+A virtual user is a private chat that sends /start once and then runs flows
+picked at random by weight until the test ends. A flow is a list of steps;
+a step pushes one update to the fake Bot API and waits for the bot call that
+completes it (the AI answer, an edited menu, the receipt confirmation).
+Step latency is measured from pushing the update to that call.
+"""
+import asyncio
+import io
+import json
+import math
+import random
+import struct
+import time
+import wave
+from collections import defaultdict
+from datetime import date
+from typing import Callable, Dict, List, Tuple
+from PIL import Image
+from services.load_test.fake_llm import default_reply
+from services.load_test.fake_telegram import FakeTelegramServer
+
+# (method, params) -> "ok", "bot_error" or None if the call doesn't complete the step
+Done = Callable[[str, dict], str | None]
+
+FLOWS = ("text", "photo", "voice", "document", "receipt", "callback")
+
+TEXT_PROMPTS = (
+    "Summarize the benefits of regular exercise in three sentences.",
+    "Write a short poem about autumn.",
+    "Explain what a hash table is.",
+    "Give me a recipe for pancakes.",
+    "Translate 'good morning' into Spanish, French and German.",
+)
+
+#_____________________________________________________________
+#___________________________FILES_____________________________
+#_____________________________________________________________
+def _jpeg(size: Tuple[int, int]) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (random.randint(0, 255), 200, 200)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+def _wav(seconds: float = 1.0, rate: int = 16000) -> bytes:
+    # ffmpeg detects the format from the content, so a WAV works in place of the OGG voice file
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(b"".join(
+            struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / rate))) for i in range(int(seconds * rate))
+        ))
+    return buffer.getvalue()
+
+def register_files(telegram: FakeTelegramServer):
+    """Serves the photo, voice, document and receipt the virtual users send"""
+    telegram.add_file("lt-photo", "photos/load_test.jpg", _jpeg((640, 480)))
+    telegram.add_file("lt-voice", "voice/load_test.oga", _wav())
+    telegram.add_file("lt-document", "documents/load_test.txt", ("Load test document. " * 200).encode())
+    telegram.add_file("lt-receipt", "documents/receipt.jpg", _jpeg((600, 1200)))
+
+def receipt_reply(messages: dict, lang: str) -> str:
+    """
+    Receipt JSON in the shape the bot asks the model for, keyed with the names of its language
+    """
+    keys = messages[lang]["check_struckture_data"]
+    db_keys = messages[lang]["check_struckture_data_for_db"]
+    values = dict(zip(db_keys, [
+        date.today().isoformat(), "12:00:00", "Load test store", "LT-0001", "",
+        {"Food": ["Bread x 2 - 1.50 - 3.00", "Milk x 1 - 0.99 - 0.99"]}, "", "", "3.99", "EUR"
+    ]))
+    return json.dumps({key: values.get(key, "") for key in keys}, ensure_ascii=False)
+
+def llm_reply(messages: dict, lang: str) -> Callable[[str, dict], str]:
+    """Reply hook of the model stubs: the receipt JSON for receipts, the default text otherwise"""
+    def reply(endpoint: str, body: dict) -> str:
+        # Receipts are sent to the model as an uploaded file
+        for message in body.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list) and any(part.get("type") == "file" for part in content):
+                return receipt_reply(messages, lang)
+        return default_reply(endpoint, body)
+    return reply
+
+#_____________________________________________________________
+#_________________________COMPLETION__________________________
+#_____________________________________________________________
+def _text(params: dict) -> str:
+    return str(params.get("text") or params.get("caption") or "")
+
+def ai_answer(method: str, params: dict) -> str | None:
+    if method not in ("sendMessage", "editMessageText"):
+        return None
+    text = _text(params)
+    if text.startswith("<b>AI: </b>"):
+        return "ok"
+    if text.startswith("<b>System: </b>"):
+        return "bot_error"
+    return None
+
+def any_message(method: str, params: dict) -> str | None:
+    if method != "sendMessage":
+        return None
+    return "bot_error" if _text(params).startswith("<b>System: </b>") else "ok"
+
+def menu_edit(method: str, params: dict) -> str | None:
+    return "ok" if method == "editMessageText" else None
+
+def markup_edit(method: str, params: dict) -> str | None:
+    return "ok" if method == "editMessageReplyMarkup" else None
+
+def receipt_confirmation(method: str, params: dict) -> str | None:
+    if method != "sendMessage":
+        return None
+    if "options:accept" in json.dumps(params.get("reply_markup") or {}):
+        return "ok"
+    return "bot_error" if _text(params).startswith("<b>System: </b>") else None
+
+#_____________________________________________________________
+#__________________________RESULTS____________________________
+#_____________________________________________________________
+class Results:
+    def __init__(self):
+        self.steps: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+        self.flows = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add(self, step: str, latency: float, outcome: str):
+        self.steps[step].append((latency, outcome))
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def render(results: Results) -> str:
+    elapsed = (results.finished or time.monotonic()) - results.started
+    total = sum(len(samples) for samples in results.steps.values())
+    ok = sum(1 for samples in results.steps.values() for _, outcome in samples if outcome == "ok")
+    lines = [
+        f"{total} steps in {results.flows} flows over {elapsed:.0f}s: {total / elapsed:.2f} steps/s, "
+        f"{ok / elapsed:.2f} ok/s, {100 * (total - ok) / total if total else 0:.1f}% not ok",
+        "",
+        f"{'step':<22} {'count':>6} {'ok':>6} {'error':>6} {'timeout':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7}"
+    ]
+    for step, samples in sorted(results.steps.items()):
+        latencies = [latency for latency, outcome in samples if outcome != "timeout"]
+        outcomes = [outcome for _, outcome in samples]
+        lines.append(
+            f"{step:<22} {len(samples):>6} {outcomes.count('ok'):>6} {outcomes.count('bot_error'):>6} {outcomes.count('timeout'):>7} "
+            f"{_percentile(latencies, 0.5):>7.2f} {_percentile(latencies, 0.95):>7.2f} "
+            f"{_percentile(latencies, 0.99):>7.2f} {max(latencies, default=0):>7.2f}"
+        )
+    return "\n".join(lines)
+
+#_____________________________________________________________
+#_______________________VIRTUAL USERS_________________________
+#_____________________________________________________________
+class VirtualUser:
+    def __init__(self, user_id: int, token: str, telegram: FakeTelegramServer, results: Results, lang: str,
+                 step_timeout: float, reuse_media: bool):
+        self.user_id = user_id
+        self.token = token
+        self.telegram = telegram
+        self.results = results
+        self.step_timeout = step_timeout
+        self.reuse_media = reuse_media
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}", "username": f"load_{user_id}", "language_code": lang}
+        self.chat = {"id": user_id, "type": "private", "first_name": self.user["first_name"]}
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self._sent = 0
+
+    def on_call(self, method: str, params: dict):
+        self.inbox.put_nowait((method, params))
+
+    def _unique(self, file_id: str) -> str:
+        # A new file_unique_id per send keeps the media cache from answering
+        self._sent += 1
+        return file_id if self.reuse_media else f"{file_id}-{self.user_id}-{self._sent}"
+
+    def message(self, **content) -> dict:
+        return {"message": {
+            "message_id": self.telegram.next_message_id(), "date": int(time.time()),
+            "chat": self.chat, "from": self.user, **content
+        }}
+
+    def callback(self, data: str) -> dict:
+        return {"callback_query": {
+            "id": str(self.telegram.next_message_id()), "from": self.user, "chat_instance": "load-test", "data": data,
+            "message": {"message_id": self.telegram.next_message_id(), "date": int(time.time()), "chat": self.chat, "text": "Menu"}
+        }}
+
+    def document(self, file_id: str, file_name: str, mime_type: str) -> dict:
+        path, content = self.telegram.files[file_id]
+        return self.message(document={
+            "file_id": file_id, "file_unique_id": self._unique(file_id),
+            "file_name": file_name, "mime_type": mime_type, "file_size": len(content)
+        })
+
+    async def step(self, name: str, update: dict, done: Done) -> bool:
+        """Sends an update and waits for the call that completes it; False unless it went ok"""
+        # Calls left over from the previous step (deleted status messages, menus) don't count
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+        started = time.monotonic()
+        self.telegram.push_update(self.token, update)
+        deadline = started + self.step_timeout
+        while True:
+            try:
+                method, params = await asyncio.wait_for(self.inbox.get(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self.results.add(name, self.step_timeout, "timeout")
+                return False
+            outcome = done(method, params)
+            if outcome is not None:
+                self.results.add(name, time.monotonic() - started, outcome)
+                return outcome == "ok"
+
+    def start_update(self) -> dict:
+        return self.message(text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+
+    def text_update(self) -> dict:
+        return self.message(text=random.choice(TEXT_PROMPTS))
+
+    def photo_update(self) -> dict:
+        path, content = self.telegram.files["lt-photo"]
+        photo = {"file_id": "lt-photo", "file_unique_id": self._unique("lt-photo"), "width": 640, "height": 480, "file_size": len(content)}
+        return self.message(photo=[photo], caption="What is in this picture?")
+
+    def voice_update(self) -> dict:
+        path, content = self.telegram.files["lt-voice"]
+        voice = {"file_id": "lt-voice", "file_unique_id": self._unique("lt-voice"), "duration": 1, "mime_type": "audio/ogg", "file_size": len(content)}
+        return self.message(voice=voice)
+
+    def document_update(self) -> dict:
+        return self.document("lt-document", "load_test.txt", "text/plain")
+
+    def receipt_update(self) -> dict:
+        return self.document("lt-receipt", "receipt.jpg", "image/jpeg")
+
+    async def start(self) -> bool:
+        return await self.step("start", self.start_update(), any_message)
+
+    async def run_flow(self, flow: str):
+        if flow == "text":
+            await self.step("text", self.text_update(), ai_answer)
+        elif flow == "photo":
+            await self.step("photo", self.photo_update(), ai_answer)
+        elif flow == "voice":
+            await self.step("voice", self.voice_update(), ai_answer)
+        elif flow == "document":
+            await self.step("document", self.document_update(), ai_answer)
+        elif flow == "receipt":
+            if not await self.step("receipt.open", self.callback("options:add_check"), menu_edit):
+                return
+            if not await self.step("receipt.recognize", self.receipt_update(), receipt_confirmation):
+                return
+            await self.step("receipt.accept", self.callback("options:accept:"), any_message)
+        elif flow == "callback":
+            await self.step("callback.limits", self.callback("profile:usage_limit"), menu_edit)
+        self.results.flows += 1
+
+    async def run(self, weights: Dict[str, float], until: float, think_time: float):
+        if not await self.start():
+            return
+        flows, flow_weights = zip(*weights.items())
+        while time.monotonic() < until:
+            await self.run_flow(random.choices(flows, flow_weights)[0])
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
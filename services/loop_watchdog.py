@@ -0,0 +1,194 @@
+"""
+Event-loop watchdog.
+
+A heartbeat coroutine ticks every LOOP_WATCHDOG_INTERVAL seconds and records
+how late it woke up (bot_loop_lag_seconds). A watcher thread checks the
+heartbeat; when the loop hasn't ticked for LOOP_STALL_THRESHOLD seconds it
+captures the stack of the loop thread and the task that is running, and the
+stall is logged once the loop is free again, attributed to the aiogram
+handler and update (or the job) that task was working on.
+
+get_task_stats() groups the live asyncio tasks by name (or by coroutine for
+unnamed tasks), so tasks that are created and never finish are visible in
+the metrics.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from config.config import LOOP_WATCHDOG_INTERVAL, LOOP_STALL_THRESHOLD, LOOP_STALL_STACK_DEPTH
+from logs.log import logs
+from services.metrics import REGISTRY, Counter, Histogram
+from services.tracing import handler_name
+
+LOOP_LAG = REGISTRY.register(Histogram(
+    "bot_loop_lag_seconds", "Delay of the event loop heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+))
+LOOP_STALLS = REGISTRY.register(Counter(
+    "bot_loop_stalls_total", "Times the event loop was blocked longer than LOOP_STALL_THRESHOLD",
+    ("handler",)
+))
+
+# Task -> what it is working on (handler, update, chat or job), see attributed()
+_contexts: Dict[asyncio.Task, dict] = {}
+# Task -> first time it was seen by get_task_stats()
+_first_seen: "weakref.WeakKeyDictionary[asyncio.Task, float]" = weakref.WeakKeyDictionary()
+
+@contextmanager
+def attributed(**info):
+    """
+    Marks what the current task is doing, so a stall inside is attributed to it:
+        with attributed(handler="job.receipt_document", chat_id=chat_id):
+            ...
+    """
+    task = asyncio.current_task()
+    previous = _contexts.get(task)
+    _contexts[task] = info
+    try:
+        yield
+    finally:
+        if previous is None:
+            _contexts.pop(task, None)
+        else:
+            _contexts[task] = previous
+
+def task_context(task: asyncio.Task | None) -> dict | None:
+    """
+    Returns what a task is working on (set by attributed()); safe to call from other threads
+    """
+    return _contexts.get(task) if task is not None else None
+
+class AttributionMiddleware(BaseMiddleware):
+    """
+    Inner middleware that records the handler and update of the running task
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update = data.get("event_update")
+        chat = data.get("event_chat")
+        with attributed(
+            handler=handler_name(data),
+            update_id=getattr(update, "update_id", None),
+            chat_id=getattr(chat, "id", None)
+        ):
+            return await handler(event, data)
+
+update_attribution = AttributionMiddleware()
+
+class LoopWatchdog:
+    """
+    Heartbeat in the event loop plus a watcher thread that catches it blocked
+    """
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL, threshold: float = LOOP_STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque = deque(maxlen=50)
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_tick = time.monotonic()
+        self._stall = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_task = None
+        self._thread = None
+
+    def start(self):
+        """Starts the heartbeat in the running loop and the watcher thread"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat(), name="loop-heartbeat")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - due)
+            self._last_tick = time.monotonic()
+            LOOP_LAG.observe(lag)
+            with self._lock:
+                stall, self._stall = self._stall, None
+            if stall is not None:
+                await self._report(stall, lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            tick = self._last_tick
+            if time.monotonic() - tick < self.threshold:
+                continue
+            with self._lock:
+                # One capture per stall: the heartbeat resets it when the loop runs again
+                if self._stall is None or self._stall["tick"] != tick:
+                    self._stall = self._capture(tick)
+
+    def _capture(self, tick: float) -> dict:
+        """Runs in the watcher thread while the loop thread is blocked"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=LOOP_STALL_STACK_DEPTH)) if frame is not None else ""
+        task = asyncio.current_task(self._loop)
+        context = dict(task_context(task) or {})
+        if task is not None:
+            context.setdefault("task", task.get_name())
+        return {"tick": tick, "stack": stack, "context": context}
+
+    async def _report(self, stall: dict, duration: float):
+        context = stall["context"]
+        handler = context.get("handler") or context.get("task") or "unknown"
+        LOOP_STALLS.labels(handler).inc()
+        details = ", ".join(f"{key} {value}" for key, value in context.items() if value is not None and key != "handler")
+        self.stalls.append({"time": time.time(), "duration": duration, "handler": handler, **context})
+        await logs(
+            f"Module: loop_watchdog. Event loop blocked for {duration:.2f}s in {handler}"
+            + (f" ({details})" if details else "")
+            + f"\n{stall['stack']}",
+            type_e="warning"
+        )
+
+def _task_key(task: asyncio.Task) -> str:
+    name = task.get_name()
+    if not name.startswith("Task-"):
+        return name
+    # Unnamed task: group by its coroutine
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", type(coro).__name__)
+
+def get_task_stats() -> dict:
+    """
+    Returns the live asyncio tasks of this loop grouped by name, with the age of the oldest one
+    """
+    now = time.monotonic()
+    stats: Dict[str, dict] = {}
+    for task in asyncio.all_tasks():
+        first_seen = _first_seen.setdefault(task, now)
+        entry = stats.setdefault(_task_key(task), {"live": 0, "oldest_seconds": 0.0})
+        entry["live"] += 1
+        entry["oldest_seconds"] = max(entry["oldest_seconds"], now - first_seen)
+    return stats
+
+loop_watchdog = LoopWatchdog()
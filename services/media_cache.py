@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from config.config import MEDIA_CACHE_ENABLED, MEDIA_CACHE_TTL, MEDIA_CACHE_MAX_ITEMS, MEDIA_CACHE_PURGE_INTERVAL
+from services.db_utils import read_media_cache, write_media_cache, purge_media_cache
+from logs.log import logs
+from services.tracing import traced
+
+# In-memory tier: cache_key -> (expires_at_ts, result), kept in LRU order
+_memory_cache: OrderedDict = OrderedDict()
+
+_stats = {
+    "memory_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "expired": 0
+}
+
+def make_cache_key(file_unique_id: str, handler_type: str, *settings) -> str:
+    """
+    Builds a cache key from Telegram file_unique_id and the settings that affect the result
+    :param file_unique_id: Telegram file_unique_id (stable across forwards and re-uploads)
+    :param handler_type: Handler that processes the file (photo, voice, document, check)
+    :param settings: Model, prompt and other values the result depends on
+    :return: Cache key
+    """
+    raw = "\x1f".join([handler_type, file_unique_id, *(str(s) for s in settings)])
+    return f"{handler_type}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+def _remember(cache_key: str, result, expires_at_ts: float):
+    _memory_cache[cache_key] = (expires_at_ts, result)
+    _memory_cache.move_to_end(cache_key)
+    while len(_memory_cache) > MEDIA_CACHE_MAX_ITEMS:
+        _memory_cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+@traced("cache.lookup")
+async def get_cached_result(cache_key: str):
+    """
+    Looks up a cached result, first in memory, then in PostgreSQL
+    :param cache_key: Key built by make_cache_key
+    :return: Stored result or None
+    """
+    if not MEDIA_CACHE_ENABLED:
+        return None
+
+    entry = _memory_cache.get(cache_key)
+    if entry is not None:
+        expires_at_ts, result = entry
+        if expires_at_ts > time.time():
+            _memory_cache.move_to_end(cache_key)
+            _stats["memory_hits"] += 1
+            return result
+        del _memory_cache[cache_key]
+        _stats["expired"] += 1
+
+    row = await read_media_cache(cache_key)
+    if row is not None:
+        result, expires_at = row
+        _remember(cache_key, result, expires_at.timestamp())
+        _stats["db_hits"] += 1
+        await logs("Media cache hit (db) for %s", cache_key.partition(":")[0], type_e="info")
+        return result
+
+    _stats["misses"] += 1
+    return None
+
+@traced("cache.store")
+async def store_result(cache_key: str, result):
+    """
+    Stores a result in both cache tiers
+    :param cache_key: Key built by make_cache_key
+    :param result: JSON-serializable handler result
+    """
+    if not MEDIA_CACHE_ENABLED or result is None:
+        return
+
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=MEDIA_CACHE_TTL)
+    _remember(cache_key, result, expires_at.timestamp())
+    _stats["stores"] += 1
+    await write_media_cache(cache_key, cache_key.split(":", 1)[0], result, expires_at)
+
+def get_cache_stats() -> dict:
+    """
+    Returns cache counters and hit rate
+    """
+    hits = _stats["memory_hits"] + _stats["db_hits"]
+    lookups = hits + _stats["misses"]
+    return {
+        **_stats,
+        "memory_size": len(_memory_cache),
+        "hit_rate": hits / lookups if lookups else 0.0
+    }
+
+async def run_cache_janitor(shutdown_event: asyncio.Event):
+    """
+    Periodically drops expired records from both cache tiers until shutdown
+    """
+    while not shutdown_event.is_set():
+        now = time.time()
+        for cache_key in [k for k, (expires_at_ts, _) in _memory_cache.items() if expires_at_ts <= now]:
+            del _memory_cache[cache_key]
+            _stats["expired"] += 1
+        await purge_media_cache()
+        await logs("Media cache stats: %s", get_cache_stats(), type_e="info")
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=MEDIA_CACHE_PURGE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,155 @@
+"""
+On-demand memory profiling with tracemalloc.
+
+tracemalloc slows down every allocation, so it is off until an admin starts
+it (/memory on the info bot, see handlers/admin.py, or the /debug/memory
+endpoint). Snapshots are kept until profiling stops; reports list the top
+allocation sites and the growth since the previous snapshot, e.g. to find
+what keeps growing in the FSM storage or the caches. Profiling is per
+process: in supervisor mode it covers the supervisor only.
+"""
+import asyncio
+import gc
+import io
+import time
+import tracemalloc
+from urllib.parse import parse_qs
+from config.config import MEMORY_PROFILE_FRAMES, MEMORY_PROFILE_TOP
+from services.asgi_routes import WebRequest, WebResponse
+
+# Allocations of the profiler itself and of the import machinery are noise
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+MAX_SNAPSHOTS = 10
+
+_snapshots: list = []  # (taken_at, snapshot)
+
+ACTIONS = ("start", "stop", "snapshot", "top", "diff", "status")
+
+def _format_size(size: int) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{sign}{size:.1f} {unit}" if unit != "B" else f"{sign}{size} B"
+        size /= 1024
+    return f"{sign}{size:.1f} GiB"
+
+def _location(trace) -> str:
+    frame = trace.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+def status() -> str:
+    if not tracemalloc.is_tracing():
+        return "Memory profiling is off."
+    current, peak = tracemalloc.get_traced_memory()
+    return (
+        f"Memory profiling is on ({tracemalloc.get_traceback_limit()} frames), "
+        f"traced {_format_size(current)}, peak {_format_size(peak)}, "
+        f"{len(_snapshots)} snapshots, overhead {_format_size(tracemalloc.get_tracemalloc_memory())}."
+    )
+
+def start(frames: int = MEMORY_PROFILE_FRAMES) -> str:
+    if tracemalloc.is_tracing():
+        return status()
+    _snapshots.clear()
+    tracemalloc.start(frames)
+    return f"Memory profiling started ({frames} frames). Take snapshots to compare."
+
+def stop() -> str:
+    if not tracemalloc.is_tracing():
+        return status()
+    tracemalloc.stop()
+    _snapshots.clear()
+    return "Memory profiling stopped, snapshots dropped."
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    """
+    Takes a snapshot (after a full collection, so only live objects are counted)
+    and keeps the last MAX_SNAPSHOTS
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("memory profiling is off, start it first")
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    _snapshots.append((time.time(), snapshot))
+    del _snapshots[:-MAX_SNAPSHOTS]
+    return snapshot
+
+def top_report(limit: int = MEMORY_PROFILE_TOP) -> str:
+    """
+    Top allocation sites of a new snapshot, with the traceback of the largest ones
+    """
+    snapshot = take_snapshot()
+    stats = snapshot.statistics("traceback")
+    total = sum(stat.size for stat in stats)
+    out = io.StringIO()
+    out.write(f"{status()}\n\nTop {limit} allocation sites, {_format_size(total)} in {len(stats)} sites\n\n")
+    for index, stat in enumerate(stats[:limit], 1):
+        out.write(f"#{index} {_location(stat)}: {_format_size(stat.size)} in {stat.count} blocks\n")
+        for line in stat.traceback.format(most_recent_first=True)[:2 * min(MEMORY_PROFILE_FRAMES, 6)]:
+            out.write(f"    {line}\n")
+    return out.getvalue()
+
+def diff_report(limit: int = MEMORY_PROFILE_TOP) -> str:
+    """
+    Growth by allocation site between the previous snapshot and a new one
+    """
+    previous = _snapshots[-1] if _snapshots else None
+    snapshot = take_snapshot()
+    if previous is None:
+        return f"{status()}\n\nFirst snapshot taken; run diff again later to see the growth."
+    taken_at, old = previous
+    stats = snapshot.compare_to(old, "lineno")
+    growth = sum(stat.size_diff for stat in stats)
+    out = io.StringIO()
+    out.write(
+        f"{status()}\n\nGrowth over {time.time() - taken_at:.0f}s: {_format_size(growth)}\n"
+        f"Top {limit} changes by size\n\n"
+    )
+    for index, stat in enumerate(stats[:limit], 1):
+        out.write(
+            f"#{index} {_location(stat)}: {_format_size(stat.size_diff)} "
+            f"({stat.count_diff:+d} blocks), now {_format_size(stat.size)} in {stat.count} blocks\n"
+        )
+    return out.getvalue()
+
+def run_action(action: str) -> tuple[str, bool]:
+    """
+    Runs a profiler action
+    :param action: One of ACTIONS
+    :return: Text and whether it is a report (sent as a file) or a short status
+    """
+    if action == "start":
+        return start(), False
+    if action == "stop":
+        return stop(), False
+    if action == "status":
+        return status(), False
+    if not tracemalloc.is_tracing():
+        return "Memory profiling is off, start it first.", False
+    if action == "snapshot":
+        take_snapshot()
+        return f"Snapshot {len(_snapshots)} taken. {status()}", False
+    if action == "top":
+        return top_report(), True
+    if action == "diff":
+        return diff_report(), True
+    return f"Unknown action, use one of: {', '.join(ACTIONS)}", False
+
+def report_filename(action: str) -> str:
+    return f"memory-{action}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+
+async def memory_endpoint(request: WebRequest) -> WebResponse:
+    """
+    /debug/memory?action=start|stop|status|snapshot|top|diff; reports are returned as attachments
+    """
+    action = parse_qs(request.query_string).get("action", ["status"])[0]
+    # Snapshots of a large heap take a while; keep the event loop free meanwhile
+    text, is_report = await asyncio.to_thread(run_action, action)
+    headers = [("content-disposition", f'attachment; filename="{report_filename(action)}"')] if is_report else []
+    return WebResponse(200, text, headers=headers)
@@ -0,0 +1,390 @@
+"""
+Metrics registry served as /metrics in the Prometheus text format, only when
+METRICS_TOKEN is set.
+
+Counters and histograms are updated where things happen (update handlers,
+LLM calls). Values that other modules already keep (lane queues, jobs,
+outbound limiter, DB pool, log events, resource samples) are read by collectors when /metrics
+is scraped. In supervisor mode every worker sends its samples along with its
+stats (see services/supervisor.py) and they are exposed with a "worker" label.
+"""
+import bisect
+import hmac
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from config.config import METRICS_TOKEN
+from services.asgi_routes import WebRequest, WebResponse, web_routes
+from services.tracing import start_span, handler_name, content_type_of
+from services.live_stats import live_stats
+
+# (family name, type, help, [(sample name, labels, value)])
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # Bucket bounds are inclusive ("le"), the last slot is +Inf
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, Any] = {}
+
+    def labels(self, *values):
+        """
+        Returns the series with the given label values (in the order of labelnames)
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        return _Value()
+
+    def _labels_of(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> list:
+        return [(self.name, self._labels_of(key), child.value) for key, child in self._children.items()]
+
+class Counter(_Metric):
+    """Monotonic counter; the name should end with _total"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> list:
+        samples = []
+        for key, child in self._children.items():
+            labels = self._labels_of(key)
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, child.sum))
+            samples.append((f"{self.name}_count", labels, child.count))
+        return samples
+
+class Registry:
+    """
+    Metrics of this process plus collectors that produce families at scrape time
+    """
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        self._collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        families = [(m.name, m.kind, m.help, m.samples()) for m in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                logging.getLogger(__name__).warning(f"Module: metrics. Collector {collector!r} failed: {e!r}")
+        return families
+
+REGISTRY = Registry()
+
+UPDATE_DURATION = REGISTRY.register(Histogram(
+    "bot_update_handler_seconds", "Time spent in update handlers",
+    ("handler", "content_type")
+))
+UPDATES_HANDLED = REGISTRY.register(Counter(
+    "bot_updates_handled_total", "Updates handled, by result",
+    ("handler", "content_type", "status")
+))
+LLM_DURATION = REGISTRY.register(Histogram(
+    "bot_llm_request_seconds", "Latency of requests to the language model APIs",
+    ("provider", "model", "operation"), buckets=LLM_BUCKETS
+))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "bot_llm_requests_total", "Requests to the language model APIs, by result",
+    ("provider", "model", "operation", "status")
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "bot_llm_tokens_total", "Tokens used by the language model APIs",
+    ("provider", "model", "kind")
+))
+
+#_____________________________________________________________
+#__________________________EXPOSITION_________________________
+#_____________________________________________________________
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def render(families: Iterable[Family]) -> str:
+    """
+    Formats families in the Prometheus text format; families with the same
+    name (e.g. from several workers) are merged into one block
+    """
+    merged: Dict[str, list] = {}
+    for name, kind, help_text, samples in families:
+        entry = merged.get(name)
+        if entry is None:
+            merged[name] = [kind, help_text, list(samples)]
+        else:
+            entry[2].extend(samples)
+    lines = []
+    for name, (kind, help_text, samples) in merged.items():
+        lines.append(f"# HELP {name} {_escape_help(help_text)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def with_labels(families: Iterable[Family], **extra: str) -> List[Family]:
+    """
+    Adds labels to every sample, e.g. the worker index of families sent by a worker
+    """
+    return [
+        (name, kind, help_text, [(sample, {**labels, **extra}, value) for sample, labels, value in samples])
+        for name, kind, help_text, samples in families
+    ]
+
+def register_stats(prefix: str, get_stats: Callable[[], dict], label: str | None = None, counters: Iterable[str] = ()):
+    """
+    Exposes the numeric fields of a stats() dict as metrics named <prefix>_<field>
+    :param prefix: Metric name prefix, e.g. bot_lane
+    :param get_stats: Returns the stats; with label, a dict of such stats per label value
+    :param label: Label name for the keys of a nested stats dict (e.g. lane)
+    :param counters: Fields that only grow; they become counters named <prefix>_<field>_total
+    """
+    counters = frozenset(counters)
+
+    def collect() -> List[Family]:
+        stats = get_stats() or {}
+        rows = stats.items() if label else [(None, stats)]
+        families: Dict[str, Family] = {}
+        for key, values in rows:
+            if not isinstance(values, dict):
+                continue
+            labels = {label: str(key)} if label else {}
+            for field, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                elif not isinstance(value, (int, float)):
+                    continue
+                counter = field in counters
+                name = f"{prefix}_{field}_total" if counter else f"{prefix}_{field}"
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = (name, "counter" if counter else "gauge", f"{prefix} {field}".replace("_", " "), [])
+                family[3].append((name, labels, value))
+        return list(families.values())
+
+    REGISTRY.add_collector(collect)
+
+def register_process_collectors():
+    """
+    Registers the collectors of the modules every bot process runs
+    """
+    from logs.log import alert_queue, get_log_stats
+    from services.db_utils import get_pool_stats
+    from services.job_queue import get_job_stats
+    from services.loop_watchdog import get_task_stats
+    from services.media_cache import get_cache_stats
+    from services.rate_limiter import get_rate_limiter_stats
+    from services.resource_sampler import resource_sampler
+    from services.update_scheduler import get_lane_stats
+    from services.usage_ledger import get_usage_stats
+
+    register_stats("bot_lane", get_lane_stats, label="lane", counters=("processed",))
+    register_stats("bot_jobs", get_job_stats, counters=("enqueued", "processed", "retried", "failed"))
+    register_stats("bot_outbound", get_rate_limiter_stats, label="bot", counters=("sent", "delayed", "retry_after", "coalesced"))
+    register_stats("bot_media_cache", get_cache_stats, counters=("memory_hits", "db_hits", "misses", "stores", "evictions", "expired"))
+    register_stats("bot_db_pool", get_pool_stats)
+    register_stats("bot_process", resource_sampler.latest)
+    register_stats("bot_tasks", get_task_stats, label="task")
+    register_stats("bot_alerts", alert_queue.stats, counters=("received", "sent", "collapsed", "dropped"))
+    register_stats("bot_usage_ledger", get_usage_stats, counters=("recorded", "written", "batches", "failed_batches", "dropped"))
+
+    def log_events() -> List[Family]:
+        samples = [
+            ("bot_log_events_total", {"level": level, "module": module}, count)
+            for level, modules in get_log_stats().items()
+            for module, count in modules.items()
+        ]
+        return [("bot_log_events_total", "counter", "Warnings and errors logged, by module", samples)]
+
+    REGISTRY.add_collector(log_events)
+
+#_____________________________________________________________
+#______________________INSTRUMENTATION________________________
+#_____________________________________________________________
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware that times every handler call by handler and content type
+    (also into the rolling window of /stats)
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            name = handler_name(data)
+            content_type = content_type_of(event)
+            duration = time.perf_counter() - started
+            UPDATE_DURATION.labels(name, content_type).observe(duration)
+            UPDATES_HANDLED.labels(name, content_type, status).inc()
+            user = getattr(event, "from_user", None)
+            live_stats.record_update(content_type, duration, getattr(user, "id", None), failed=status == "error")
+
+handler_metrics = HandlerMetricsMiddleware()
+
+@asynccontextmanager
+async def track_llm(provider: str, model: str, operation: str):
+    """
+    Times a request to a language model API and traces it as a client span:
+        async with track_llm("openai", user_model, "chat"):
+            response = await client.chat.completions.create(...)
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with start_span(f"llm.{operation}", kind="client", provider=provider, model=model):
+            yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        LLM_DURATION.labels(provider, model, operation).observe(time.perf_counter() - started)
+        LLM_REQUESTS.labels(provider, model, operation, status).inc()
+        live_stats.record_llm(model, failed=status == "error")
+
+def record_llm_usage(provider: str, model: str, usage: Any):
+    """
+    Counts the tokens of an API response (chat completions or responses API usage object)
+    """
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or 0
+    if prompt:
+        LLM_TOKENS.labels(provider, model, "prompt").inc(prompt)
+    if completion:
+        LLM_TOKENS.labels(provider, model, "completion").inc(completion)
+    if prompt or completion:
+        live_stats.record_tokens(model, prompt, completion)
+
+#_____________________________________________________________
+#__________________________ENDPOINT___________________________
+#_____________________________________________________________
+def token_matches(request: WebRequest, token: str | None) -> bool:
+    """
+    Checks the "Authorization: Bearer <token>" header; an unset token allows nobody
+    """
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}")
+
+async def metrics_endpoint(request: WebRequest) -> WebResponse:
+    if not token_matches(request, METRICS_TOKEN):
+        return WebResponse(401, "Unauthorized", headers=[("www-authenticate", "Bearer")])
+    return WebResponse(200, render(REGISTRY.collect()), content_type=CONTENT_TYPE)
+
+def register_metrics_route(path: str = "/metrics") -> bool:
+    """
+    Serves /metrics if METRICS_TOKEN is set; the web server is public (webhooks, the web app)
+    and the metrics show per-handler and per-user activity, so without a token it stays a 404
+    :return: Whether it was registered
+    """
+    if not METRICS_TOKEN:
+        return False
+    web_routes.add_route(path, metrics_endpoint)
+    return True
@@ -0,0 +1,207 @@
+"""
+Outbound pacing of Telegram API calls.
+
+Every request of a bot goes through its OutboundRateLimiter, registered as a
+middleware of the bot session:
+  * a global token bucket keeps the bot under Telegram's ~30 messages/s;
+  * per-chat buckets keep a chat under ~1 message/s (20/min in groups);
+  * TelegramRetryAfter pauses the affected bucket and the call is retried;
+  * edits of the same message waiting for a token are coalesced, only the
+    newest one is sent and the older calls return its result.
+"""
+import asyncio
+import time
+from typing import Dict
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from config.config import (
+    RATE_LIMIT_GLOBAL,
+    RATE_LIMIT_PER_CHAT,
+    RATE_LIMIT_PER_GROUP,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_RETRIES
+)
+from logs.log import logs
+
+# Methods paced by the limiter (by prefix of the Bot API method name)
+PACED_PREFIXES = ("send", "edit", "copy", "forward", "delete")
+# Paced globally but not counted against the chat
+CHAT_EXEMPT_METHODS = frozenset({"sendChatAction"})
+COALESCED_METHODS = frozenset({"editMessageText", "editMessageCaption", "editMessageReplyMarkup"})
+
+_IDLE_BUCKET_SECONDS = 60
+_CLEANUP_EVERY = 1000
+
+class TokenBucket:
+    """
+    Token bucket with reservations: a caller takes a token right away and gets
+    the time to wait for it, so concurrent callers are served in arrival order.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Takes a token and returns the number of seconds to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return now - self.updated > _IDLE_BUCKET_SECONDS and now > self.paused_until
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Session middleware that paces the outgoing requests of one bot
+    """
+    def __init__(self, name: str, global_rate: float = RATE_LIMIT_GLOBAL):
+        self.name = name
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chat_buckets: Dict[object, TokenBucket] = {}
+        self._edits: Dict[tuple, asyncio.Future] = {}
+        self._requests = 0
+        self._stats = {
+            "sent": 0,
+            "waiting": 0,
+            "delayed": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "retry_after": 0,
+            "coalesced": 0
+        }
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            private = isinstance(chat_id, int) and chat_id > 0
+            rate = RATE_LIMIT_PER_CHAT if private else RATE_LIMIT_PER_GROUP
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, RATE_LIMIT_BURST)
+        self._requests += 1
+        if self._requests % _CLEANUP_EVERY == 0:
+            now = time.monotonic()
+            for key in [k for k, b in self._chat_buckets.items() if b.is_idle(now) and b is not bucket]:
+                del self._chat_buckets[key]
+        return bucket
+
+    async def _wait(self, bucket: TokenBucket) -> float:
+        wait = bucket.reserve()
+        if wait > 0:
+            self._stats["waiting"] += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._stats["waiting"] -= 1
+        return wait
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        if not api_method.startswith(PACED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = None
+        if chat_id is not None and api_method not in CHAT_EXEMPT_METHODS and not api_method.startswith("delete"):
+            chat_bucket = self._chat_bucket(chat_id)
+
+        edit_key = None
+        edit_future = None
+        if api_method in COALESCED_METHODS:
+            edit_key = (api_method, chat_id, getattr(method, "message_id", None), getattr(method, "inline_message_id", None))
+            edit_future = asyncio.get_running_loop().create_future()
+            # Nobody may wait for the result of the newest edit; don't warn about it
+            edit_future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._edits[edit_key] = edit_future
+
+        try:
+            waited = 0.0
+            if chat_bucket is not None:
+                waited += await self._wait(chat_bucket)
+            if edit_future is not None and self._edits.get(edit_key) is not edit_future:
+                # A newer edit of the same message arrived while this one was waiting:
+                # skip this one and answer with the result of the newest
+                if chat_bucket is not None:
+                    chat_bucket.refund()
+                self._stats["coalesced"] += 1
+                response = await asyncio.shield(self._edits[edit_key])
+            else:
+                waited += await self._wait(self.global_bucket)
+                if waited > 0:
+                    self._stats["delayed"] += 1
+                    self._stats["total_wait"] += waited
+                    self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+                response = await self._send(make_request, bot, method, chat_bucket)
+            if edit_future is not None:
+                # Edits that were coalesced into this one may be waiting for it
+                edit_future.set_result(response)
+            return response
+        except BaseException as e:
+            if edit_future is not None and not edit_future.done():
+                edit_future.set_exception(e)
+            raise
+        finally:
+            if edit_key is not None and self._edits.get(edit_key) is edit_future:
+                del self._edits[edit_key]
+
+    async def _send(self, make_request, bot: Bot, method: TelegramMethod, chat_bucket: TokenBucket | None):
+        attempt = 0
+        while True:
+            try:
+                response = await make_request(bot, method)
+                self._stats["sent"] += 1
+                return response
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self._stats["retry_after"] += 1
+                if attempt > RATE_LIMIT_MAX_RETRIES:
+                    raise
+                # Other requests to the same chat (or the whole bot) wait out the flood control too
+                (chat_bucket or self.global_bucket).pause(e.retry_after)
+                # Logged as info: warnings are sent through the info bot, which is paced here as well
+                await logs("Module: rate_limiter. %s bot hit flood control on %s, retry in %ss", self.name, method.__api_method__, e.retry_after, type_e="info")
+                await asyncio.sleep(e.retry_after)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "avg_wait": self._stats["total_wait"] / self._stats["delayed"] if self._stats["delayed"] else 0.0,
+            "chats": len(self._chat_buckets),
+            "pending_edits": len(self._edits)
+        }
+
+rate_limiters: Dict[str, OutboundRateLimiter] = {}
+
+def create_rate_limiter(name: str, share: int = 1) -> OutboundRateLimiter:
+    """
+    Creates the limiter of a bot session
+    :param name: Bot name used in the metrics
+    :param share: Number of processes sending as this bot; the global rate is split between them
+    """
+    limiter = OutboundRateLimiter(name, global_rate=RATE_LIMIT_GLOBAL / max(1, share))
+    rate_limiters[name] = limiter
+    return limiter
+
+def get_rate_limiter_stats() -> dict:
+    """
+    Returns queue metrics of the outbound limiters of this process
+    """
+    return {name: limiter.stats() for name, limiter in rate_limiters.items()}
@@ -1,7 +1,31 @@
-import pandas as pd
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
 from config.config import MESSAGES
+from services.lazy_modules import lazy_module
 
-async def generate_report(df: pd.DataFrame, start_date: str, end_date: str, lang: str) -> str:
+pd = lazy_module("pandas")
+
+def preset_period(preset: str, today: date) -> tuple[date, date]:
+    """
+    First and last day of a report period preset
+    :param preset: today / week / current_month / last_month / year
+    :param today: Day the period ends on (or before, for last_month)
+    """
+    match preset:
+        case "today":
+            return today, today
+        case "week":
+            return today - timedelta(days=6), today
+        case "current_month":
+            return today.replace(day=1), today
+        case "last_month":
+            end = today.replace(day=1) - timedelta(days=1)
+            return end.replace(day=1), end
+        case "year":
+            return today - relativedelta(years=1), today
+    raise ValueError(f"Unknown period preset: {preset}")
+
+async def generate_report(df: "pd.DataFrame", start_date: str, end_date: str, lang: str) -> str:
     # Преобразуем дату и отфильтруем по диапазону
     df = df.copy()
     df['date'] = pd.to_datetime(df['date'])
@@ -0,0 +1,110 @@
+"""
+In-process resource sampler.
+
+Every RESOURCE_SAMPLE_INTERVAL seconds it records the process (RSS, open file
+descriptors, threads, asyncio tasks, event-loop lag) and the host (CPU,
+memory, disk usage, disk and network rates from the /proc readers in
+services/sysmonitoring.py). The last RESOURCE_SAMPLE_HISTORY samples are kept
+in a ring buffer; the latest one is exported as bot_process_* metrics.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from config.config import RESOURCE_SAMPLE_INTERVAL, RESOURCE_SAMPLE_HISTORY
+from logs.log import logs
+from services.sysmonitoring import (
+    read_cpu_times,
+    read_mem_percent,
+    read_disk_usage_percent,
+    read_disk_io,
+    read_net_dev,
+    read_process_status,
+    read_open_fds
+)
+
+# Host numbers come from /proc; elsewhere only the Python-level values are sampled
+HAS_PROC = os.path.isdir("/proc/self")
+
+class ResourceSampler:
+    """
+    Periodic sampler with a bounded history
+    """
+    def __init__(self, interval: float = RESOURCE_SAMPLE_INTERVAL, history: int = RESOURCE_SAMPLE_HISTORY):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=history)
+        self._prev = None  # (monotonic, cpu_idle, cpu_total, disk_read, disk_write, net_rx, net_tx)
+
+    def sample(self, loop_lag: float = 0.0) -> dict:
+        """
+        Takes a sample and adds it to the history
+        :param loop_lag: How late the sampler woke up, in seconds
+        :return: The sample
+        """
+        sample = {
+            "time": time.time(),
+            "threads": threading.active_count(),
+            "tasks": len(asyncio.all_tasks()),
+            "loop_lag": loop_lag
+        }
+        if HAS_PROC:
+            sample.update(read_process_status())
+            sample["open_fds"] = read_open_fds()
+            sample.update(self._host())
+        self.samples.append(sample)
+        return sample
+
+    def _host(self) -> dict:
+        now = time.monotonic()
+        idle, total = read_cpu_times()
+        disk_read, disk_write = read_disk_io()
+        net_rx, net_tx = read_net_dev()
+        host = {"mem_percent": read_mem_percent(), "disk_percent": read_disk_usage_percent("/")}
+        if self._prev is not None:
+            then, idle0, total0, disk_read0, disk_write0, net_rx0, net_tx0 = self._prev
+            dt = max(now - then, 1e-3)
+            host["cpu_percent"] = (1 - (idle - idle0) / (total - total0)) * 100 if total > total0 else 0.0
+            host["disk_read_mb_s"] = (disk_read - disk_read0) / dt
+            host["disk_write_mb_s"] = (disk_write - disk_write0) / dt
+            host["net_rx_kb_s"] = (net_rx - net_rx0) / dt
+            host["net_tx_kb_s"] = (net_tx - net_tx0) / dt
+        self._prev = (now, idle, total, disk_read, disk_write, net_rx, net_tx)
+        return host
+
+    async def run(self, shutdown_event: asyncio.Event):
+        """
+        Samples until shutdown
+        :param shutdown_event: Event set when the application stops
+        """
+        loop = asyncio.get_running_loop()
+        while not shutdown_event.is_set():
+            due = loop.time() + self.interval
+            try:
+                await asyncio.wait_for(shutdown_event.wait(), timeout=self.interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                self.sample(max(0.0, loop.time() - due))
+            except Exception as e:
+                await logs(f"Module: resource_sampler. Sampling failed: {e!r}", type_e="warning")
+
+    def latest(self) -> dict:
+        """
+        Returns the newest sample without its timestamp (empty before the first one)
+        """
+        if not self.samples:
+            return {}
+        return {key: value for key, value in self.samples[-1].items() if key != "time"}
+
+    def history(self, seconds: float | None = None) -> list:
+        """
+        Returns the samples of the last given seconds (all kept samples if omitted)
+        """
+        if seconds is None:
+            return list(self.samples)
+        since = time.time() - seconds
+        return [sample for sample in self.samples if sample["time"] >= since]
+
+resource_sampler = ResourceSampler()
@@ -0,0 +1,113 @@
+"""
+Routing index for reply-keyboard buttons and callback prefixes.
+
+Handlers register themselves with @reply_route(action) or @callback_route(prefix)
+instead of a filter of their own. The index is a frozen snapshot mapping every
+button text (in all languages) to its handler and every callback prefix to its
+handler, so an update is routed with a single dict lookup in handlers/routing.py.
+It is rebuilt with rebuild_routing_index() when the language texts change,
+including after a config reload (services.config_reload); the button texts of
+the version before a reload keep routing until the next one.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
+from aiogram.dispatcher.event.handler import CallableObject
+import config.config as app_config
+from services.config_reload import on_config_reload
+
+# Reply-keyboard action -> path of its button text in MESSAGES[lang]
+REPLY_BUTTONS = {
+    "settings": ("settings_title",),
+    "options": ("reply_kb", "options"),
+    "profile": ("reply_kb", "profile"),
+}
+
+@dataclass(frozen=True)
+class RoutingIndex:
+    reply_actions: Mapping[str, str]                     # button text -> action
+    current_actions: Mapping[str, str]                   # the same for the texts of the current config only
+    reply_handlers: Mapping[str, CallableObject]         # action -> handler
+    callback_handlers: Mapping[str, CallableObject]      # callback prefix -> handler
+
+    def reply_handler(self, text: str | None) -> CallableObject | None:
+        action = self.reply_actions.get(text)
+        return self.reply_handlers.get(action) if action else None
+
+    def callback_handler(self, data: str | None) -> CallableObject | None:
+        if not data:
+            return None
+        return self.callback_handlers.get(data.partition(":")[0])
+
+_reply_handlers: dict[str, CallableObject] = {}
+_callback_handlers: dict[str, CallableObject] = {}
+_index: RoutingIndex | None = None
+
+def _button_text(messages: dict, lang: str, path: tuple) -> str | None:
+    value = messages.get(lang, {})
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value if isinstance(value, str) else None
+
+def rebuild_routing_index(messages: dict | None = None, languages: list | None = None, retired: Mapping[str, str] | None = None) -> RoutingIndex:
+    """
+    Builds a new index from the language texts and swaps it in
+    :param messages: MESSAGES dict; the current config is used if omitted
+    :param languages: Supported languages; the current config is used if omitted
+    :param retired: Button texts of an earlier version that keep routing unless a current text replaces them
+    :return: The new index
+    """
+    global _index
+    messages = app_config.MESSAGES if messages is None else messages
+    languages = app_config.SUPPORTED_LANGUAGES if languages is None else languages
+    current_actions = {}
+    for lang in languages:
+        for action, path in REPLY_BUTTONS.items():
+            text = _button_text(messages, lang, path)
+            if text:
+                current_actions[text] = action
+    _index = RoutingIndex(
+        reply_actions=MappingProxyType({**(retired or {}), **current_actions}),
+        current_actions=MappingProxyType(current_actions),
+        reply_handlers=MappingProxyType(dict(_reply_handlers)),
+        callback_handlers=MappingProxyType(dict(_callback_handlers)),
+    )
+    return _index
+
+@on_config_reload
+def _rebuild_on_reload(snapshot):
+    # Reply keyboards already sent still show the old texts, so those of the previous version
+    # keep their actions; older ones are dropped, so repeated reloads don't pile them up
+    rebuild_routing_index(retired=get_routing_index().current_actions)
+
+def get_routing_index() -> RoutingIndex:
+    """
+    Returns the current index (a new one is swapped in on rebuild, never changed in place)
+    """
+    return _index if _index is not None else rebuild_routing_index()
+
+def reply_route(action: str) -> Callable:
+    """
+    Registers the handler of a reply-keyboard button (one of REPLY_BUTTONS)
+    """
+    def decorator(callback: Callable[..., Any]) -> Callable[..., Any]:
+        _reply_handlers[action] = CallableObject(callback)
+        rebuild_routing_index()
+        return callback
+    return decorator
+
+def callback_route(prefix: str) -> Callable:
+    """
+    Registers the handler of callback queries whose data starts with "<prefix>:"
+    """
+    def decorator(callback: Callable[..., Any]) -> Callable[..., Any]:
+        _callback_handlers[prefix] = CallableObject(callback)
+        rebuild_routing_index()
+        return callback
+    return decorator
+
+def is_reply_button(text: str | None) -> bool:
+    """
+    Tells whether a message text is one of the reply-keyboard buttons
+    """
+    return text in get_routing_index().reply_actions
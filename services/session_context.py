@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Optional
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from config.config import DEFAULT_LANGUAGES
+from services.db_utils import read_user_all_data
+import services.telegram_bot_init as bot_tg
+from services.tracing import traced
+from services.update_scheduler import current_lane, LANE_INTERACTIVE
+
+PENDING_RECEIPT_KEY = "pending_receipt"
+
+@dataclass
+class SessionContext:
+    """
+    Per-update state of one chat. Replaces module-level globals so that
+    concurrent updates from different users never see each other's data.
+    """
+    chat_id: int
+    user_data: Any
+    lang: str
+    state: Optional[FSMContext] = None
+    processing_message: Optional[types.Message] = None
+
+    async def get_pending_receipt(self) -> Optional[dict]:
+        """Returns the parsed receipt waiting for confirmation in this chat"""
+        if self.state is None:
+            return None
+        data = await self.state.get_data()
+        return data.get(PENDING_RECEIPT_KEY)
+
+    async def set_pending_receipt(self, receipt: Optional[dict]):
+        """Stores the parsed receipt in the chat's FSM data until it is accepted or cancelled"""
+        if self.state is not None:
+            await self.state.update_data({PENDING_RECEIPT_KEY: receipt})
+
+    async def delete_processing_message(self):
+        """Deletes the "Processing..." message of this update, if one was sent"""
+        if self.processing_message is not None:
+            await self.processing_message.delete()
+            self.processing_message = None
+
+@traced("session.load")
+async def load_session(chat_id: int, state: Optional[FSMContext] = None) -> SessionContext:
+    """
+    Reads user data once and builds the session context for an update
+    :param chat_id: Chat ID
+    :param state: FSM context of the update, if available
+    :return: Session context
+    """
+    user_data = await read_user_all_data(chat_id) or {}
+    lang = user_data.get("language") or DEFAULT_LANGUAGES
+    return SessionContext(chat_id=chat_id, user_data=user_data, lang=lang, state=state)
+
+def get_chat_state(chat_id: int, user_id: Optional[int] = None) -> FSMContext:
+    """
+    Builds the FSM context of a chat outside of the dispatcher (used by the web app,
+    which receives data without a Telegram update, and by background jobs)
+    :param chat_id: Chat ID
+    :param user_id: User in that chat, the chat itself for a private chat
+    """
+    key = StorageKey(bot_id=bot_tg.bot.id, chat_id=chat_id, user_id=chat_id if user_id is None else user_id)
+    return FSMContext(storage=bot_tg.dp.storage, key=key)
+
+class ChatEventIsolation(BaseEventIsolation):
+    """
+    Serializes updates of the same chat while different chats run in parallel.
+    Unlike aiogram's SimpleEventIsolation, locks are dropped once nobody holds them,
+    so the lock table doesn't grow with the number of users.
+
+    Interactive updates (callbacks, commands, menu buttons; see services.update_scheduler)
+    take a lock of their own: they stay in order among themselves but never wait behind
+    the chat's 10-30 s AI answer. Locks taken outside the dispatcher (jobs, the web app)
+    have no lane and serialize with the AI updates.
+    """
+    def __init__(self) -> None:
+        self._locks: dict[tuple, list] = {}  # key -> [lock, users]
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey):
+        chat_key = (key.bot_id, key.chat_id, key.thread_id, current_lane.get() == LANE_INTERACTIVE)
+        entry = self._locks.get(chat_key)
+        if entry is None:
+            entry = self._locks[chat_key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[chat_key]
+
+    def locked_chats(self) -> int:
+        """Number of chats that currently have an update in progress or waiting"""
+        return len({chat_key[:3] for chat_key in self._locks})
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+chat_isolation = ChatEventIsolation()
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from config.config import WORKER_QUEUE_SIZE, WORKER_MAX_IN_FLIGHT, WORKER_STATS_INTERVAL, METRICS_ENABLED, LOOP_WATCHDOG_ENABLED
+from logs.log import logs, set_log_file_suffix
+from services.asgi_routes import WebRequest, WebResponse, web_routes
+from services.metrics import with_labels
+from services.webhook import WebhookIngress
+
+# Set in the supervisor process when updates are sharded across workers
+worker_pool = None
+
+def update_chat_id(raw: dict) -> int:
+    """
+    Extracts the chat the update belongs to, falling back to the sender
+    :param raw: Update as received from Telegram
+    :return: Chat ID or 0 if the update has no chat
+    """
+    for key, event in raw.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        sender = event.get("from")
+        if sender:
+            return sender["id"]
+    return 0
+
+class WorkerPool:
+    """
+    Starts bot worker processes and routes every update to a worker by chat_id,
+    so all updates of one chat are handled by the same process and in order.
+    """
+    def __init__(self, count: int):
+        self.count = count
+        self._ctx = multiprocessing.get_context("spawn")
+        self.inboxes = [self._ctx.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(count)]
+        self.outbox = self._ctx.Queue()
+        self.processes = []
+        self.routed = [0] * count
+        self.worker_stats = [{} for _ in range(count)]
+        self.worker_metrics = [[] for _ in range(count)]
+        self.worker_live_stats = [None] * count
+        self._stats_task = None
+
+    def start(self):
+        for index in range(self.count):
+            process = self._ctx.Process(
+                target=worker_main,
+                args=(index, self.count, self.inboxes[index], self.outbox),
+                name=f"bot-worker-{index}"
+            )
+            process.start()
+            self.processes.append(process)
+        self._stats_task = asyncio.create_task(self._collect_stats(), name="worker-stats")
+
+    def shard(self, chat_id: int) -> int:
+        return chat_id % self.count
+
+    def route_update(self, raw: dict) -> bool:
+        """Sends an update to its worker; returns False if the worker queue is full"""
+        index = self.shard(update_chat_id(raw))
+        try:
+            self.inboxes[index].put_nowait(raw)
+        except queue.Full:
+            return False
+        self.routed[index] += 1
+        return True
+
+    async def poll_updates(self, bot: Bot, dispatcher: Dispatcher):
+        """Long-polls Telegram in the supervisor and fans updates out to the workers"""
+        await bot.delete_webhook(drop_pending_updates=True)
+        allowed_updates = dispatcher.resolve_used_update_types()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=25, allowed_updates=allowed_updates)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                await logs(f"Module: supervisor. Polling error: {e}", type_e="warning")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                raw = update.model_dump(mode="json", exclude_unset=True, by_alias=True)
+                while not self.route_update(raw):
+                    await asyncio.sleep(0.1)
+                offset = update.update_id + 1
+
+    async def _collect_stats(self):
+        loop = asyncio.get_running_loop()
+        last_report = time.monotonic()
+        while True:
+            try:
+                index, stats = await loop.run_in_executor(None, self.outbox.get, True, 1.0)
+                self.worker_metrics[index] = stats.pop("metrics", [])
+                self.worker_live_stats[index] = stats.pop("live_stats", None)
+                self.worker_stats[index] = stats
+            except queue.Empty:
+                pass
+            if time.monotonic() - last_report >= WORKER_STATS_INTERVAL:
+                last_report = time.monotonic()
+                await logs(f"Worker load: {self.stats()}", type_e="info")
+
+    def stats(self) -> list:
+        return [
+            {
+                "worker": index,
+                "alive": process.is_alive(),
+                "routed": self.routed[index],
+                "queued": _qsize(self.inboxes[index]),
+                **self.worker_stats[index]
+            }
+            for index, process in enumerate(self.processes)
+        ]
+
+    def collect_metrics(self) -> list:
+        """Metric families last reported by the workers, labelled with the worker index"""
+        families = []
+        for index, worker_families in enumerate(self.worker_metrics):
+            families.extend(with_labels(worker_families, worker=str(index)))
+        return families
+
+    def live_stats(self) -> list:
+        """/stats windows last reported by the workers"""
+        return [summary for summary in self.worker_live_stats if summary is not None]
+
+    async def stop(self, timeout: float = 60):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                await logs(f"Module: supervisor. {process.name} did not stop in time, terminating", type_e="warning")
+                process.terminate()
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+        await logs("All bot workers stopped", type_e="info")
+
+class ShardedWebhookIngress(WebhookIngress):
+    """
+    Webhook endpoint of the supervisor: forwards updates to the owning worker
+    instead of the local dispatcher
+    """
+    def __init__(self, name: str, dispatcher: Dispatcher, bot: Bot, workers: WorkerPool):
+        super().__init__(name, dispatcher, bot)
+        self.workers = workers
+        self._started = False
+
+    async def handle_request(self, request: WebRequest) -> WebResponse:
+        denied = self.check_secret(request)
+        if denied:
+            return denied
+        try:
+            raw = json.loads(request.body)
+        except ValueError:
+            return WebResponse(400, "Bad Request")
+        if not self.workers.route_update(raw):
+            self.rejected += 1
+            return WebResponse(503, "Busy", headers=[("retry-after", "1")])
+        self.received += 1
+        return WebResponse(200, "ok")
+
+    @property
+    def running(self) -> bool:
+        return self._started and any(process.is_alive() for process in self.workers.processes)
+
+    def start(self):
+        self.stopping = False
+        web_routes.add_route(self.path, self.handle_request, methods=("POST",))
+        self._started = True
+
+    async def stop(self, timeout: float = 30):
+        # Routed updates are drained by the workers when the pool stops; new ones get a 503
+        self.stopping = True
+        self._started = False
+
+def _qsize(q) -> int:
+    try:
+        return q.qsize()
+    except NotImplementedError:  # macOS
+        return -1
+
+#_____________________________________________________________
+#________________________WORKER_SIDE__________________________
+#_____________________________________________________________
+def worker_main(index: int, count: int, inbox, outbox):
+    """
+    Entry point of a worker process
+    """
+    # Signals reach the whole process group; workers stop when the supervisor says so
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    set_log_file_suffix(f"worker-{index}")
+    asyncio.run(_run_worker(index, count, inbox, outbox))
+
+async def _run_worker(index: int, count: int, inbox, outbox):
+    from main import database_connection, setup_dispatchers
+    from logs.log import set_info_bot
+    from services import telegram_bot_init
+    from services.update_scheduler import get_lane_stats
+    from services.job_queue import run_job_workers, get_job_stats
+    from services.rate_limiter import get_rate_limiter_stats
+    from services.metrics import REGISTRY, register_process_collectors
+    from services.resource_sampler import resource_sampler
+    from services.live_stats import live_stats
+    from services import usage_ledger
+    from services.config_reload import run_config_watcher
+    from services.loop_watchdog import loop_watchdog
+
+    bot, dp, info_bot, info_dp = await telegram_bot_init.initialize_bots()
+    setup_dispatchers(dp, info_dp)
+    register_process_collectors()
+    loop = asyncio.get_running_loop()
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+    tasks: set[asyncio.Task] = set()
+    in_flight = asyncio.Semaphore(WORKER_MAX_IN_FLIGHT)
+    counters = {"processed": 0, "failed": 0}
+
+    async def process(raw):
+        try:
+            await dp.feed_raw_update(bot, raw)
+            counters["processed"] += 1
+        except Exception as e:
+            counters["failed"] += 1
+            await logs(f"Module: supervisor. Worker {index} failed to process update {raw.get('update_id')}: {e}", type_e="error")
+        finally:
+            in_flight.release()
+
+    async def report_stats():
+        while True:
+            await asyncio.sleep(WORKER_STATS_INTERVAL / 2)
+            outbox.put((index, {"pid": os.getpid(), "in_flight": len(tasks), **counters, "lanes": get_lane_stats(), "jobs": get_job_stats(), "outbound": get_rate_limiter_stats(), "metrics": REGISTRY.collect() if METRICS_ENABLED else [], "live_stats": live_stats.summary()}))
+
+    # Each worker gets an equal part of the pool; the supervisor keeps one part too
+    async with database_connection(bot, info_bot, pool_share=count + 1):
+        await set_info_bot(info_bot)
+        await logs(f"Bot worker {index} started (pid {os.getpid()})", type_e="info")
+        reporter = asyncio.create_task(report_stats())
+        # Background jobs of this worker's chats are run here as well
+        shutdown_event = asyncio.Event()
+        job_task = asyncio.create_task(run_job_workers(shutdown_event, index, count))
+        sampler_task = asyncio.create_task(resource_sampler.run(shutdown_event), name="resource-sampler")
+        usage_task = asyncio.create_task(usage_ledger.run_usage_writer(shutdown_event), name="usage-writer")
+        # Each worker has its own copy of the config and reloads it itself
+        config_task = asyncio.create_task(run_config_watcher(shutdown_event), name="config-watcher")
+        while True:
+            # Not taking more from the queue than we can run keeps the backpressure on the supervisor
+            await in_flight.acquire()
+            try:
+                raw = await loop.run_in_executor(None, inbox.get, True, 1.0)
+            except queue.Empty:
+                in_flight.release()
+                if not multiprocessing.parent_process().is_alive():
+                    await logs(f"Module: supervisor. Supervisor is gone, worker {index} exits", type_e="warning")
+                    break
+                continue
+            if raw is None:
+                break
+            task = asyncio.create_task(process(raw))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        shutdown_event.set()
+        if tasks:
+            await asyncio.wait(tasks, timeout=30)
+        await job_task
+        await sampler_task
+        await usage_task
+        await config_task
+        await usage_ledger.flush()
+        await loop_watchdog.stop()
+        reporter.cancel()
+        await logs(f"Bot worker {index} stopped", type_e="info")
@@ -1,13 +1,14 @@
+"""
+/proc readers for host and process resources.
+
+They are sampled in-process by services/resource_sampler.py. The console
+status line is an optional CLI (needs rich):
+    python -m services.sysmonitoring
+"""
 from __future__ import annotations
 import os, re, sys, time, signal
 from collections import namedtuple
 from typing import Tuple
-from rich.console import Console
-from rich.live import Live
-from rich.text import Text
-
-console = Console(highlight=False)
-status_line = Text("", style="bold", no_wrap=True)
 
 Prev = namedtuple("Prev",
     "cpu_idle cpu_total disk_read disk_write net_rx net_tx time")
@@ -59,6 +60,22 @@ def read_net_dev() -> Tuple[float, float]:
             rx += vals[0]; tx += vals[8]
     return rx / 1024, tx / 1024
 
+def read_process_status(pid: int | str = "self") -> dict:
+    """
+    Resident memory (MB) and thread count of a process from /proc/<pid>/status
+    """
+    result = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                result["rss_mb"] = int(line.split()[1]) / 1024
+            elif line.startswith("Threads:"):
+                result["threads"] = int(line.split()[1])
+    return result
+
+def read_open_fds(pid: int | str = "self") -> int:
+    return len(os.listdir(f"/proc/{pid}/fd"))
+
 def make_status() -> str:
     global prev
     idle1, total1 = read_cpu_times()
@@ -83,9 +100,14 @@ def make_status() -> str:
     prev = Prev(idle1, total1, rd1, wr1, rx1, tx1, time.time())
     return line
 
-signal.signal(signal.SIGINT, lambda *_: (console.print(), sys.exit(0)))
-
 def main() -> None:
+    from rich.console import Console
+    from rich.live import Live
+    from rich.text import Text
+
+    console = Console(highlight=False)
+    status_line = Text("", style="bold", no_wrap=True)
+    signal.signal(signal.SIGINT, lambda *_: (console.print(), sys.exit(0)))
     with Live(status_line, console=console,
               screen=False, refresh_per_second=1,
               vertical_overflow="crop",
@@ -1,15 +1,24 @@
-import telebot
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from telebot.apihelper import ApiTelegramException
 from config.config import (
     TELEGRAM_BOT_TOKEN,
-    TELEGRAM_INFO_BOT_TOKEN
+    TELEGRAM_INFO_BOT_TOKEN,
+    FSM_STORAGE,
+    WORKER_PROCESSES,
+    TELEGRAM_API_URL
 )
 from logs.log import logs, set_info_bot
+from services.fsm_storage import PostgresStorage
+from services.metrics import handler_metrics
+from services.loop_watchdog import update_attribution
+from services.tracing import update_tracing, handler_tracing, request_tracing
+from services.rate_limiter import create_rate_limiter
+from services.session_context import chat_isolation, ChatEventIsolation
+from services.update_scheduler import update_scheduler, lane_classifier
 
 # Initialize global variables
 bot = None
@@ -17,28 +26,54 @@ dp = None
 info_bot = None
 dp_info_bot = None
 
-async def create_bot(token, parse_mode=ParseMode.HTML):
+async def create_bot(token, parse_mode=ParseMode.HTML, name="main", rate_share=1):
     """Create a bot instance with a new session"""
-    session = AiohttpSession()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else PRODUCTION)
+    # Registered first, so the span of an API call includes the time it waited for the limiter
+    session.middleware(request_tracing)
+    # Every send, edit and delete of the bot is paced by its outbound limiter
+    session.middleware(create_rate_limiter(name, rate_share))
     return Bot(token=token, session=session, default=DefaultBotProperties(parse_mode=parse_mode))
 
+def create_storage():
+    """Create the FSM storage selected by FSM_STORAGE"""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return PostgresStorage()
+
 async def initialize_bots():
     """Initialize bots with direct polling test"""
     global bot, dp, info_bot, dp_info_bot
     
-    storage = MemoryStorage()
-    storage_info = MemoryStorage()
+    storage = create_storage()
+    storage_info = create_storage()
     
     # Test main bot tokens
     main_token = TELEGRAM_BOT_TOKEN
     info_token = TELEGRAM_INFO_BOT_TOKEN
     
     # Create bots with selected tokens
-    bot = await create_bot(main_token)
-    dp = Dispatcher(storage=storage)
+    # In supervisor mode every worker sends as the main bot, so they share its global limit
+    bot = await create_bot(main_token, name="main", rate_share=WORKER_PROCESSES)
+    # Updates of one chat are handled in order, different chats run in parallel. The FSM middleware,
+    # which takes the chat lock, is registered below instead of by the Dispatcher to come after the lane decision
+    dp = Dispatcher(storage=storage, events_isolation=chat_isolation, disable_fsm=True)
+    # The root span of an update also covers the wait for its chat lock and lane
+    dp.update.outer_middleware(update_tracing)
+    dp.update.outer_middleware(lane_classifier)
+    dp.update.outer_middleware(dp.fsm)
+    # A lane slot is taken only once the chat lock is held
+    dp.update.outer_middleware(update_scheduler)
+    # Inner middlewares of the dispatcher also wrap the handlers of the included routers
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    dp.message.middleware(update_attribution)
+    dp.callback_query.middleware(update_attribution)
+    dp.message.middleware(handler_tracing)
+    dp.callback_query.middleware(handler_tracing)
     
-    info_bot = await create_bot(info_token)
-    dp_info_bot = Dispatcher(storage=storage_info)
+    info_bot = await create_bot(info_token, name="info")
+    dp_info_bot = Dispatcher(storage=storage_info, events_isolation=ChatEventIsolation())
 
     return bot, dp, info_bot, dp_info_bot
 
@@ -0,0 +1,349 @@
+"""
+Per-update tracing with an OpenTelemetry-compatible span model.
+
+Every Telegram update (and every background job) gets a root span; handler
+stages, Telegram API calls, LLM calls and DB queries below it are child
+spans. Spans are kept in memory until the root ends, then the trace is
+exported if it was sampled (TRACE_SAMPLE_RATE), slower than
+TRACE_SLOW_THRESHOLD or failed. Exporters (TRACE_EXPORTERS):
+  * jsonl   - one span per line in TRACE_FILE_PATH (OTLP field names);
+  * console - one summary line per trace in the log.
+
+Latency per stage and content type from an exported file:
+    python -m services.tracing logs/traces.jsonl
+"""
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+from config.config import (
+    TRACING_ENABLED,
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_THRESHOLD,
+    TRACE_EXPORTERS,
+    TRACE_FILE_PATH,
+    TRACE_MAX_SPANS
+)
+
+SERVICE_NAME = "ai-assistant-bot"
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "dropped")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = sampled
+        self.spans = []
+        self.dropped = 0
+
+class Span:
+    __slots__ = ("trace", "name", "kind", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, trace: Trace, name: str, parent_span_id: str | None, kind: str, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = "UNSET"
+        self.status_message = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+
+    def end(self, end_ns: int | None = None):
+        self.end_ns = end_ns or time.time_ns()
+        if len(self.trace.spans) < TRACE_MAX_SPANS:
+            self.trace.spans.append(self)
+        else:
+            self.trace.dropped += 1
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind.upper()}",
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}", "message": self.status_message},
+            "resource": {"service.name": SERVICE_NAME, "process.pid": os.getpid()}
+        }
+
+class _NoopSpan:
+    """Returned outside of a trace, so callers never check for None"""
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+def current_span() -> Span | _NoopSpan:
+    return _current_span.get() or NOOP_SPAN
+
+@contextmanager
+def start_trace(name: str, kind: str = "server", **attributes):
+    """
+    Opens the root span of a trace (one per update or job)
+    """
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    trace = Trace(sampled=random.random() < TRACE_SAMPLE_RATE)
+    span = Span(trace, name, None, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        _finish(trace, span)
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", **attributes):
+    """
+    Opens a child span of the current span; outside of a trace it does nothing
+        with start_span("file.download", file_size=size):
+            ...
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    span = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def traced(name: str | None = None, kind: str = "internal"):
+    """
+    Decorator that runs a coroutine function inside a child span
+    named after the function unless a name is given
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with start_span(span_name, kind):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+#_____________________________________________________________
+#__________________________EXPORT_____________________________
+#_____________________________________________________________
+_span_file = None
+
+def _keep(trace: Trace, root: Span) -> bool:
+    if trace.sampled or root.status == "ERROR":
+        return True
+    return TRACE_SLOW_THRESHOLD > 0 and root.duration >= TRACE_SLOW_THRESHOLD
+
+def _finish(trace: Trace, root: Span):
+    if not _keep(trace, root):
+        return
+    if trace.dropped:
+        root.set_attribute("trace.dropped_spans", trace.dropped)
+    try:
+        if "jsonl" in TRACE_EXPORTERS:
+            _export_jsonl(trace)
+        if "console" in TRACE_EXPORTERS:
+            _export_console(trace, root)
+    except Exception as e:
+        # Never through logs(): tracing must not raise alerts about itself in a loop
+        logging.getLogger(__name__).error(f"Module: tracing. Export failed: {e!r}")
+
+def _export_jsonl(trace: Trace):
+    global _span_file
+    if _span_file is None:
+        from logs.log import open_record_file
+        _span_file = open_record_file("tracing.spans", TRACE_FILE_PATH)
+    for span in trace.spans:
+        _span_file.info(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+
+def _export_console(trace: Trace, root: Span):
+    stages = ", ".join(
+        f"{span.name} {span.duration * 1000:.0f}ms"
+        for span in sorted(trace.spans, key=lambda s: s.start_ns)
+        if span is not root and span.parent_span_id == root.span_id
+    )
+    logging.getLogger(__name__).info(
+        f"Trace {trace.trace_id} {root.name} {root.duration * 1000:.0f}ms "
+        f"{root.status} {root.attributes.get('content_type', '')} [{stages}]"
+    )
+
+#_____________________________________________________________
+#______________________INSTRUMENTATION________________________
+#_____________________________________________________________
+def handler_name(data: Dict[str, Any]) -> str:
+    """
+    Name of the handler an update was dispatched to, e.g. "commands.send_welcome".
+    Reply buttons and prefixed callbacks are named after their routed handler.
+    """
+    handler = data.get("routed_handler") or data.get("handler")
+    callback = getattr(handler, "callback", None)
+    if callback is None:
+        return "unknown"
+    module = getattr(callback, "__module__", "") or ""
+    return f"{module.rsplit('.', 1)[-1]}.{getattr(callback, '__qualname__', type(callback).__name__)}"
+
+def content_type_of(event: TelegramObject) -> str:
+    if isinstance(event, Update):
+        event = event.event
+    if isinstance(event, Message):
+        content_type = event.content_type
+        return getattr(content_type, "value", content_type)
+    if isinstance(event, CallbackQuery):
+        return "callback_query"
+    return type(event).__name__.lower()
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """
+    Outer update middleware that opens the root span of every update
+    """
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        with start_trace(
+            "telegram.update",
+            update_id=event.update_id,
+            update_type=event.event_type,
+            content_type=content_type_of(event),
+            chat_id=getattr(chat, "id", None)
+        ) as span:
+            result = await handler(event, data)
+            span.set_attribute("lane", data.get("lane"))
+            return result
+
+class HandlerSpanMiddleware(BaseMiddleware):
+    """
+    Inner middleware that wraps the handler call in a span named after the handler
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = handler_name(data)
+        with start_span(f"handler {name}", handler=name):
+            return await handler(event, data)
+
+class TelegramRequestTracing(BaseRequestMiddleware):
+    """
+    Session middleware that records every Bot API call as a client span
+    """
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if _current_span.get() is None:
+            return await make_request(bot, method)
+        with start_span(f"telegram.{method.__api_method__}", kind="client", rpc_system="telegram"):
+            return await make_request(bot, method)
+
+update_tracing = UpdateTracingMiddleware()
+handler_tracing = HandlerSpanMiddleware()
+request_tracing = TelegramRequestTracing()
+
+_WHITESPACE = re.compile(r"\s+")
+
+def record_query(record):
+    """
+    asyncpg query logger: adds a finished query as a client span of the current span.
+    asyncpg calls it with call_soon from the querying task, so the task's span is current.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    statement = _WHITESPACE.sub(" ", record.query).strip()
+    end_ns = time.time_ns()
+    span = Span(parent.trace, f"db.{statement.split(' ', 1)[0].lower()}", parent.span_id, "client", {
+        "db.system": "postgresql",
+        "db.statement": statement[:300]
+    })
+    span.start_ns = end_ns - int(record.elapsed * 1e9)
+    if record.exception is not None:
+        span.record_error(record.exception)
+    span.end(end_ns)
+
+#_____________________________________________________________
+#__________________________REPORT_____________________________
+#_____________________________________________________________
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def summarize(path: str) -> str:
+    """
+    p50/p95/max of every span name per content type of its update, from a JSON-lines export
+    """
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    content_types = {
+        s["trace_id"]: s["attributes"].get("content_type") or s["attributes"].get("job_type") or s["name"]
+        for s in spans if s["parent_span_id"] is None
+    }
+    durations: Dict[tuple, list] = {}
+    for s in spans:
+        key = (content_types.get(s["trace_id"], "?"), s["name"])
+        durations.setdefault(key, []).append((s["end_time_unix_nano"] - s["start_time_unix_nano"]) / 1e6)
+    lines = [f"{'content type':<16} {'span':<48} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+    for (content_type, name), values in sorted(durations.items(), key=lambda item: (item[0][0], -_percentile(item[1], 0.95))):
+        lines.append(
+            f"{content_type:<16} {name[:48]:<48} {len(values):>6} "
+            f"{_percentile(values, 0.5):>9.1f} {_percentile(values, 0.95):>9.1f} {max(values):>9.1f}"
+        )
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    print(summarize(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE_PATH))
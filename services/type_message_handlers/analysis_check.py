@@ -1,11 +1,14 @@
 import base64
 from logs.log import logs
 from services.db_utils import update_user_data
+from services.usage_ledger import record_usage
 from ai_handlers.open_ai import openai_api_photo_check_analysis_request
 from ai_handlers.deepseek import deepseek_api_text_request
 from config.config import MODELS_OPEN_AI, MODELS_DEEPSEEK, MESSAGES, PRODUCT_KEYS
 from logs.errors import OpenAIServiceError, ApplicationError
+from services.tracing import traced
 
+@traced("ai.receipt_photo")
 async def analysis_check_from_photo(chat_id, lang, user_model, set_answer, role, user_limits, image_path) -> str:
     """
     Function to process photo messages and get AI response.
@@ -16,13 +19,14 @@ async def analysis_check_from_photo(chat_id, lang, user_model, set_answer, role,
         conversation_api = role
         ai_response, usage_tokens = await openai_api_photo_check_analysis_request(lang, user_model, set_answer, conversation_api, image_path)
 
-        await logs(f"Chat {chat_id} - usage tokens count: {usage_tokens}", type_e="info")
+        await logs("Chat %s - usage tokens count: %s", chat_id, usage_tokens, type_e="info")
 
         tokens, req_count, date_requests = user_limits
         tokens += usage_tokens
         req_count += 1
         await update_user_data(chat_id, "tokens", tokens)
         await update_user_data(chat_id, "requests", req_count)
+        record_usage(chat_id, user_model, "check_photo", usage_tokens)
     except OpenAIServiceError:
         raise
     except Exception as e:
@@ -30,22 +34,24 @@ async def analysis_check_from_photo(chat_id, lang, user_model, set_answer, role,
     finally:
         return ai_response
     
+@traced("ai.receipt_text")
 async def analysis_check_from_text(chat_id, lang, user_model, web_enabled, set_answer, vision_role_one_req, user_limits, user_text_input) -> str:
     try:
         user_text = [{"role": "user", "content": user_text_input}]
         conversation_api = [{"role": "system", "content": vision_role_one_req}]
         conversation_api.extend(user_text)
-        await logs(f"Chat {chat_id} - user request saved", type_e="info")
+        await logs("Chat %s - user request saved", chat_id, type_e="info")
         ai_response, usage_tokens = await deepseek_api_text_request(lang, user_model, set_answer, web_enabled, conversation_api)
 
-        await logs(f"Chat {chat_id} - model response received: {ai_response}", type_e="info")
-        await logs(f"Chat {chat_id} - usage tokens count: {usage_tokens}", type_e="info")
+        await logs("Chat %s - model response received: %s", chat_id, ai_response, type_e="debug")
+        await logs("Chat %s - usage tokens count: %s", chat_id, usage_tokens, type_e="info")
 
         tokens, req_count, date_requests = user_limits
         tokens += usage_tokens
         req_count += 1
         await update_user_data(chat_id, "tokens", tokens)
         await update_user_data(chat_id, "requests", req_count)
+        record_usage(chat_id, user_model, "check_text", usage_tokens)
     except OpenAIServiceError:
         raise
     except Exception as e:
@@ -1,9 +1,12 @@
 from logs.log import logs
 from ai_handlers.open_ai import openai_api_generate_image, openai_api_text_moderations
 from services.db_utils import update_user_data
+from services.usage_ledger import record_usage
 from config.config import MODELS_OPEN_AI, MODELS_DEEPSEEK, MESSAGES
 from logs.errors import OpenAIServiceError, ApplicationError
+from services.tracing import traced
 
+@traced("ai.image")
 async def generate_image_ai_response(chat_id, lang, user_model, resolution, quality, user_limits, user_text: str) -> str:
     """
     Function to process text messages and get AI response.
@@ -11,7 +14,7 @@ async def generate_image_ai_response(chat_id, lang, user_model, resolution, qual
     :return: AI response
     """
     try:
-        await logs(f"Chat {chat_id} - user request to image generate", type_e="info")
+        await logs("Chat %s - user request to image generate", chat_id, type_e="info")
         flagged, categories = await openai_api_text_moderations(user_text)
         if flagged == False:
             if user_model in MODELS_OPEN_AI:
@@ -28,6 +31,7 @@ async def generate_image_ai_response(chat_id, lang, user_model, resolution, qual
         req_count += 1
         await update_user_data(chat_id, "tokens", tokens)
         await update_user_data(chat_id, "requests", req_count)
+        record_usage(chat_id, user_model, "image")
 
         return ai_response
     except OpenAIServiceError:
@@ -2,9 +2,12 @@ from logs.log import logs
 from ai_handlers.open_ai import openai_api_text_request, openai_api_text_moderations
 from ai_handlers.deepseek import deepseek_api_text_request
 from services.db_utils import update_chat_history, read_chat_history, update_user_data
+from services.usage_ledger import record_usage
 from config.config import MODELS_OPEN_AI, MODELS_DEEPSEEK, MESSAGES
 from logs.errors import OpenAIServiceError, ApplicationError
+from services.tracing import traced
 
+@traced("ai.text")
 async def text_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text: str) -> str:
     """
     Function to process text messages and get AI response.
@@ -14,7 +17,7 @@ async def text_message_ai_response(chat_id, lang, user_model, context_enabled, w
     try:
         await update_chat_history(chat_id, {"role": "user", "content": user_text})
         user_text_saved = [{"role": "user", "content": user_text}]
-        await logs(f"Chat {chat_id} - user request saved", type_e="info")
+        await logs("Chat %s - user request saved", chat_id, type_e="info")
 
         conversation_api = [{"role": "system", "content": role}]
         if context_enabled:
@@ -34,16 +37,17 @@ async def text_message_ai_response(chat_id, lang, user_model, context_enabled, w
                 "Unfortunately, your message was rejected by the moderation system. Please try rephrasing it and try again.  \nCategory: {}").format("".join(true_categories))
             usage_tokens = 0
 
-        await logs(f"Chat {chat_id} - model response received: {ai_response}", type_e="info")
+        await logs("Chat %s - model response received: %s", chat_id, ai_response, type_e="debug")
         await update_chat_history(chat_id, {"role": "assistant", "content": ai_response})
 
-        await logs(f"Chat {chat_id} - usage tokens count: {usage_tokens}", type_e="info")
+        await logs("Chat %s - usage tokens count: %s", chat_id, usage_tokens, type_e="info")
 
         tokens, req_count, date_requests = user_limits
         tokens += usage_tokens
         req_count += 1
         await update_user_data(chat_id, "tokens", tokens)
         await update_user_data(chat_id, "requests", req_count)
+        record_usage(chat_id, user_model, "text", usage_tokens)
 
         return f"<b>AI: </b>{ai_response}"
     except OpenAIServiceError:
@@ -2,8 +2,11 @@ from logs.log import logs
 from config.config import MESSAGES, MODELS_OPEN_AI, MODELS_DEEPSEEK
 from ai_handlers.open_ai import openai_api_voice_request
 from services.db_utils import update_chat_history, read_chat_history, update_user_data
+from services.usage_ledger import record_usage
 from logs.errors import OpenAIServiceError, ApplicationError
+from services.tracing import traced
 
+@traced("ai.voice")
 async def voice_message_ai_response(chat_id, lang, user_model, context_enabled, web_enabled, set_answer, role, user_limits, user_text, audio_path: str) -> str:
     """
     Function to process voice messages and get AI response.
@@ -13,7 +16,7 @@ async def voice_message_ai_response(chat_id, lang, user_model, context_enabled,
     try:
         await update_chat_history(chat_id, {"role": "user", "content": user_text})
         user_text_saved = [{"role": "user", "content": user_text}]
-        await logs(f"Chat {chat_id} - user request saved", type_e="info")
+        await logs("Chat %s - user request saved", chat_id, type_e="info")
 
         conversation_api = [{"role": "system", "content": role}]
         if context_enabled:
@@ -25,7 +28,7 @@ async def voice_message_ai_response(chat_id, lang, user_model, context_enabled,
         elif user_model in MODELS_DEEPSEEK:
             return f"<b>System: </b>{MESSAGES.get(lang, {}).get('error_422', 'An error occurred')}"
 
-        await logs(f"Chat {chat_id} - model response received: {ai_response}", type_e="info")
+        await logs("Chat %s - model response received: %s", chat_id, ai_response, type_e="debug")
         await update_chat_history(chat_id, {"role": "assistant", "content": ai_response})
 
         tokens, req_count, date_requests = user_limits
@@ -33,6 +36,7 @@ async def voice_message_ai_response(chat_id, lang, user_model, context_enabled,
         req_count += 1
         await update_user_data(chat_id, "tokens", tokens)
         await update_user_data(chat_id, "requests", req_count)
+        record_usage(chat_id, user_model, "voice")
         return f"<b>AI: </b>{ai_response}"
     except OpenAIServiceError:
         raise
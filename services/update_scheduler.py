@@ -0,0 +1,132 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from config.config import UPDATE_LANES
+from services.routing_index import is_reply_button
+
+LANE_INTERACTIVE = "interactive"   # callback queries, commands and menu buttons
+LANE_TEXT_AI = "text_ai"           # text requests to the language models
+LANE_HEAVY = "heavy"               # photos, voice, documents and receipts
+
+HEAVY_CONTENT_TYPES = frozenset({"photo", "voice", "audio", "document", "video", "video_note"})
+
+# Lane of the update being handled, set before the FSM middleware takes the chat lock
+current_lane: ContextVar[str | None] = ContextVar("current_lane", default=None)
+
+class Lane:
+    """
+    Concurrency-limited lane. Each lane has its own semaphore, so a saturated
+    lane only queues its own updates and never delays the others.
+    """
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.monotonic() - queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.processed += 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "running": self.running,
+            "processed": self.processed,
+            "avg_wait": self.total_wait / self.processed if self.processed else 0.0,
+            "max_wait": self.max_wait
+        }
+
+def classify_update(update: Update) -> str:
+    """
+    Chooses the lane for an incoming update
+    :param update: Telegram update
+    :return: Lane name
+    """
+    if update.callback_query is not None:
+        return LANE_INTERACTIVE
+
+    message = update.message or update.edited_message
+    if message is None:
+        return LANE_INTERACTIVE
+
+    if message.content_type in HEAVY_CONTENT_TYPES:
+        return LANE_HEAVY
+
+    text = message.text
+    # Reply keyboard buttons are cheap menu actions, not AI requests
+    if not text or text.startswith("/") or is_reply_button(text):
+        return LANE_INTERACTIVE
+    return LANE_TEXT_AI
+
+async def lane_classifier(
+    handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+    event: Update,
+    data: Dict[str, Any],
+) -> Any:
+    """
+    Outer update middleware registered before the FSM middleware: the lane is decided before
+    the chat lock is taken, so the lock can let interactive updates past a long AI answer
+    """
+    lane = classify_update(event)
+    data["lane"] = lane
+    token = current_lane.set(lane)
+    try:
+        return await handler(event, data)
+    finally:
+        current_lane.reset(token)
+
+class UpdateSchedulerMiddleware(BaseMiddleware):
+    """
+    Outer update middleware that runs each update inside the slot of its lane.
+    Registered after the FSM middleware: an update waiting for its chat's lock
+    doesn't hold a slot other chats could use.
+    """
+    def __init__(self, limits: dict):
+        self.lanes = {name: Lane(name, limit) for name, limit in limits.items()}
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        lane = self.lanes[data.get("lane") or classify_update(event)]
+        data["lane"] = lane.name
+        async with lane.slot():
+            return await handler(event, data)
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+update_scheduler = UpdateSchedulerMiddleware(UPDATE_LANES)
+
+def get_lane_stats() -> dict:
+    """
+    Returns queue metrics of every lane
+    """
+    return update_scheduler.stats()
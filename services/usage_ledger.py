@@ -0,0 +1,91 @@
+"""
+Append-only ledger of AI usage per user and model.
+
+Handlers call record_usage() after every AI request; it only appends to an
+in-memory buffer. A background writer inserts the buffer into usage_events
+every USAGE_FLUSH_INTERVAL seconds (or once USAGE_BATCH_SIZE events are
+waiting) and adds it to the usage_daily rollup (day, user, model) in the
+same transaction. The /usage report reads the rollup; events are kept for
+USAGE_EVENT_RETENTION_DAYS for audits and re-aggregation. Days are UTC. Limits
+are still enforced, and shown to users, from the chat_ids counters: the
+ledger may lag behind or drop a batch, the counters are what
+check_user_limits checks.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from config.config import USAGE_FLUSH_INTERVAL, USAGE_BATCH_SIZE, USAGE_MAX_PENDING, USAGE_EVENT_RETENTION_DAYS
+from logs.log import logs
+from services.db_utils import write_usage_events, purge_usage_events
+
+PURGE_INTERVAL = 3600
+
+# (created_at, user_id, model, operation, tokens)
+_buffer: list = []
+_wakeup = asyncio.Event()
+_flush_lock = asyncio.Lock()
+_stats = {"recorded": 0, "written": 0, "batches": 0, "failed_batches": 0, "dropped": 0}
+
+def record_usage(user_id: int, model: str, operation: str, tokens: int = 0):
+    """
+    Adds a usage event; never waits for the database
+    :param user_id: Chat ID of the user
+    :param model: Model that served the request
+    :param operation: Kind of request (text, photo, voice, document, image, check_photo, check_text)
+    :param tokens: Tokens billed for the request
+    """
+    _buffer.append((datetime.now(timezone.utc), user_id, model or "unknown", operation, int(tokens or 0)))
+    _stats["recorded"] += 1
+    _trim()
+    if len(_buffer) >= USAGE_BATCH_SIZE:
+        _wakeup.set()
+
+def _trim():
+    overflow = len(_buffer) - USAGE_MAX_PENDING
+    if overflow > 0:
+        del _buffer[:overflow]
+        _stats["dropped"] += overflow
+
+async def flush() -> int:
+    """
+    Writes the buffered events
+    :return: Number of events written; on failure they stay buffered for the next flush
+    """
+    global _buffer
+    async with _flush_lock:
+        if not _buffer:
+            return 0
+        batch, _buffer = _buffer, []
+        if not await write_usage_events(batch):
+            _stats["failed_batches"] += 1
+            _buffer = batch + _buffer
+            _trim()
+            return 0
+        _stats["written"] += len(batch)
+        _stats["batches"] += 1
+        return len(batch)
+
+async def run_usage_writer(shutdown_event: asyncio.Event):
+    """
+    Flushes the ledger periodically and purges old events until shutdown; call flush()
+    once more after the last handlers have finished
+    """
+    last_purge = 0.0
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=USAGE_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        await flush()
+        if time.monotonic() - last_purge >= PURGE_INTERVAL:
+            last_purge = time.monotonic()
+            await purge_usage_events(USAGE_EVENT_RETENTION_DAYS)
+    written = await flush()
+    if _buffer:
+        await logs(f"Module: usage_ledger. {len(_buffer)} usage events were not written at shutdown", type_e="warning")
+    elif written:
+        await logs("Usage ledger flushed at shutdown: %s events", written, type_e="info")
+
+def get_usage_stats() -> dict:
+    return {**_stats, "pending": len(_buffer)}
@@ -4,11 +4,12 @@ import re
 from typing import Any, Dict, List, Union
 from datetime import datetime, timedelta, timezone, time
 from aiogram import types
-from PIL import Image
 from config.config import WHITE_LIST, MESSAGES
 from services.db_utils import update_user_data
 from logs.log import logs
+from services.tracing import traced
 
+@traced("limits.check")
 async def check_user_limits(user_data: list, chat_id: int) -> bool:
     """
     Function for checking user limits
@@ -43,6 +44,7 @@ async def check_user_limits(user_data: list, chat_id: int) -> bool:
         await logs(f"Module: utils. Error checking user limits: {e}", type_e="error")
         return False
 
+@traced("image.resize")
 async def resize_image(image_path: str, max_size: tuple = (512, 512)):
     """
     Function for resizing an image
@@ -51,14 +53,17 @@ async def resize_image(image_path: str, max_size: tuple = (512, 512)):
     """
     try:
         def _resize():
+            # Pillow loads on the first photo, in the worker thread under the import lock
+            from PIL import Image
             with Image.open(image_path) as img:
                 img.thumbnail(max_size)
                 img.save(image_path)
         await asyncio.to_thread(_resize)
-        await logs(f"Image successfully resized: {image_path}", type_e="info")
+        await logs("Image successfully resized: %s", image_path, type_e="info")
     except Exception as e:
         await logs(f"Module: utils. Error resizing image {image_path}: {e}", type_e="error")
 
+@traced("audio.convert")
 async def convert_audio(ogg_file: str, wav_file: str):
     """
     Function for converting audio from OGG to WAV format
@@ -79,7 +84,7 @@ async def convert_audio(ogg_file: str, wav_file: str):
             await logs(f"ffmpeg error: {error_message}", type_e="error")
             raise Exception(f"ffmpeg error: {error_message}")
         
-        await logs(f"Audio successfully converted: {ogg_file} -> {wav_file}", type_e="info")
+        await logs("Audio successfully converted: %s -> %s", ogg_file, wav_file, type_e="info")
     except Exception as e:
         await logs(f"Module: utils. Error converting audio: {e}", type_e="error")
 
@@ -93,7 +98,7 @@ async def time_until_midnight_utc() -> timedelta:
         tomorrow = now.date() + timedelta(days=1)
         midnight = datetime.combine(tomorrow, time.min).replace(tzinfo=timezone.utc)
         remaining = midnight - now
-        await logs(f"Time until midnight (UTC): {remaining}", type_e="info")
+        await logs("Time until midnight (UTC): %s", remaining, type_e="info")
         return remaining
     except Exception as e:
         await logs(f"Error calculating time until midnight (UTC): {e}", type_e="error")
@@ -132,7 +137,7 @@ async def dict_to_str(message_dict: dict) -> str:
         result_lines = _serialize(message_dict)
         result = "\n".join(result_lines)
 
-        await logs(f"Converted dict to string:\n{result}", type_e="info")
+        await logs("Converted dict to string:\n%s", result, type_e="debug")
         return result
 
     except Exception as e:
@@ -231,7 +236,7 @@ async def map_keys(
         for chk in checks:
             all_records.extend(await _process_one(chk))
 
-        await logs(f"Mapped {len(all_records)} records for user {user_id}", type_e="info")
+        await logs("Mapped %s records for user %s", len(all_records), user_id, type_e="info")
         return all_records
 
     except Exception as e:
@@ -0,0 +1,170 @@
+"""
+Webhook ingestion on the Hypercorn server started by run_web_app.
+
+Updates are accepted at WEBHOOK_PATH/<bot name>, checked against the
+X-Telegram-Bot-Api-Secret-Token header and put into a bounded queue. When the
+queue is full the endpoint answers 503 and Telegram re-delivers the update later;
+the same happens once shutdown has started, while the queued updates are still fed.
+
+Recorded updates can be replayed locally:
+    python -m services.webhook http://127.0.0.1:5000/telegram/webhook/main <secret> updates.jsonl
+"""
+import asyncio
+import hmac
+import json
+import secrets
+import sys
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config.config import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, WEBHOOK_MAX_IN_FLIGHT
+from logs.log import logs
+from services.asgi_routes import WebRequest, WebResponse, web_routes
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+class WebhookIngress:
+    """
+    Receives updates of one bot over HTTP and feeds them into its dispatcher
+    """
+    def __init__(self, name: str, dispatcher: Dispatcher, bot: Bot, secret: str = None,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT):
+        self.name = name
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret = secret or WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        self.path = f"{WEBHOOK_PATH.rstrip('/')}/{name}"
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.max_in_flight = max_in_flight
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self._consumer: asyncio.Task | None = None
+        self.stopping = False
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def check_secret(self, request: WebRequest) -> WebResponse | None:
+        """
+        Returns an error response if the request doesn't carry the webhook secret,
+        or if the ingress is shutting down (Telegram re-delivers the update after a 503)
+        """
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return WebResponse(401, "Unauthorized")
+        if self.stopping:
+            self.rejected += 1
+            return WebResponse(503, "Shutting down", headers=[("retry-after", "5")])
+        return None
+
+    async def handle_request(self, request: WebRequest) -> WebResponse:
+        denied = self.check_secret(request)
+        if denied:
+            return denied
+        try:
+            update = Update.model_validate(json.loads(request.body), context={"bot": self.bot})
+        except ValueError as e:
+            await logs(f"Module: webhook. Invalid update received on {self.path}: {e}", type_e="warning")
+            return WebResponse(400, "Bad Request")
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return WebResponse(503, "Busy", headers=[("retry-after", "1")])
+        self.received += 1
+        return WebResponse(200, "ok")
+
+    def start(self):
+        """Registers the endpoint and starts feeding queued updates into the dispatcher"""
+        self.stopping = False
+        web_routes.add_route(self.path, self.handle_request, methods=("POST",))
+        self._consumer = asyncio.create_task(self._consume(), name=f"webhook-{self.name}")
+
+    @property
+    def running(self) -> bool:
+        """Whether updates received on the endpoint are being processed"""
+        return self._consumer is not None and not self._consumer.done()
+
+    async def set_webhook(self):
+        """Points Telegram at this endpoint"""
+        url = f"{WEBHOOK_BASE_URL.rstrip('/')}{self.path}"
+        await self.bot.set_webhook(
+            url=url,
+            secret_token=self.secret,
+            allowed_updates=self.dispatcher.resolve_used_update_types(),
+            max_connections=min(100, self.max_in_flight)
+        )
+        if not WEBHOOK_SECRET:
+            await logs(f"Module: webhook. WEBHOOK_SECRET is not set, a random secret is used for {self.name}", type_e="warning")
+        await logs(f"Webhook for {self.name} bot set to {url}", type_e="info")
+
+    async def _consume(self):
+        while True:
+            await self._in_flight.acquire()
+            update = await self.queue.get()
+            task = asyncio.create_task(self._process(update))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: Update):
+        try:
+            await self.dispatcher.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            await logs(f"Module: webhook. Error processing update {update.update_id}: {e}", type_e="error")
+        finally:
+            self._in_flight.release()
+            self.queue.task_done()
+
+    async def stop(self, timeout: float = 30):
+        """
+        Stops accepting updates and processes the ones already acknowledged to Telegram
+        :param timeout: Seconds to wait for the queued and in-flight updates
+        """
+        # The route stays, so new deliveries get a 503 and are re-delivered after the restart
+        self.stopping = True
+        if self._consumer is not None and not self._consumer.done():
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                await logs(f"Module: webhook. {self.name}: {self.queue.qsize()} queued updates not processed within {timeout:g}s, "
+                           "they are lost", type_e="error")
+            self._consumer.cancel()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        await logs(f"Webhook ingress {self.name} stopped, {self.processed} updates processed", type_e="info")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "in_flight": len(self._tasks),
+            "received": self.received,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed
+        }
+
+async def replay_updates(url: str, secret: str, file_path: str):
+    """
+    Posts recorded updates (a JSON object, a JSON array or JSON lines) to a webhook endpoint
+    """
+    import aiohttp
+
+    with open(file_path, encoding="utf-8") as f:
+        content = f.read().strip()
+    try:
+        updates = json.loads(content)
+        updates = updates if isinstance(updates, list) else [updates]
+    except json.JSONDecodeError:
+        updates = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            async with session.post(url, json=update, headers={SECRET_HEADER: secret}) as response:
+                print(f"update {update.get('update_id')}: {response.status} {await response.text()}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("Usage: python -m services.webhook <url> <secret> <updates.json>")
+        sys.exit(2)
+    asyncio.run(replay_updates(*sys.argv[1:]))
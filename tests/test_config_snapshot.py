@@ -0,0 +1,45 @@
+import json
+import unittest
+from config import snapshot
+from config.snapshot import SnapshotMapping, SnapshotSequence, publish, current_snapshot
+
+# Bound once at import, like `from config.config import MESSAGES` in the handlers
+MESSAGES = SnapshotMapping("MESSAGES")
+MODELS = SnapshotSequence("MODELS")
+
+class ConfigSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self._running = snapshot._snapshot
+        publish({"MESSAGES": {"en": {"hello": "Hi"}}, "MODELS": ["gpt-4o", "deepseek-chat"]}, {"MODELS": ["gpt-4o", "deepseek-chat"]})
+
+    def tearDown(self):
+        snapshot._snapshot = self._running
+
+    def test_reload_swaps_values_behind_bound_names(self):
+        version = current_snapshot().version
+        publish({"MESSAGES": {"en": {"hello": "Hello"}}, "MODELS": ["gpt-4o-mini"]}, {"MODELS": ["gpt-4o-mini"]})
+
+        self.assertEqual(current_snapshot().version, version + 1)
+        self.assertEqual(MESSAGES["en"]["hello"], "Hello")
+        self.assertEqual(list(MODELS), ["gpt-4o-mini"])
+        self.assertNotIn("deepseek-chat", MODELS)
+
+    def test_snapshot_top_level_is_read_only(self):
+        with self.assertRaises(TypeError):
+            current_snapshot().values["MODELS"] = []
+
+    def test_proxies_compare_equal_to_their_value(self):
+        self.assertEqual(MODELS, ["gpt-4o", "deepseek-chat"])
+        self.assertEqual(["gpt-4o", "deepseek-chat"], MODELS)
+        self.assertNotEqual(MODELS, ["gpt-4o"])
+        self.assertEqual(MESSAGES, {"en": {"hello": "Hi"}})
+        self.assertEqual(MODELS, SnapshotSequence("MODELS"))
+
+    def test_current_value_serializes_to_json(self):
+        with self.assertRaises(TypeError):
+            json.dumps(MESSAGES)
+        self.assertEqual(json.loads(json.dumps(MESSAGES.current())), {"en": {"hello": "Hi"}})
+        self.assertEqual(json.dumps(MODELS.current()), '["gpt-4o", "deepseek-chat"]')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,7 +6,7 @@ import json
 from django.http import JsonResponse, HttpResponseNotAllowed, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
 from services.db_utils import get_connection, release_connection
-from handlers.callbacks_options import process_user_input_list
+from services.job_queue import enqueue_job
 
 async def check_form(request):
     chat_id = int(request.GET.get('chat_id'))
@@ -86,13 +86,16 @@ async def api_submit(request):
         f"Date: {date}, Time: {time}, Store: {store}, "
         f"Check_id: {check_id}, Product: {product}, "
         f"Total: {total} Currency: {currency}, Chat ID: {chat_id}",
-        type_e="info"
+        type_e="debug"
     )
 
     conn = await get_connection()
     try:
-        await process_user_input_list(user_text_input=values)
-        await logs(f"[Django] Data processed successfully for chat_id {chat_id}", type_e="info")
+        # Re-analysis runs as a background job in the process that handles this chat
+        job_id = await enqueue_job("receipt_input", int(chat_id), {"user_input_list": values})
+        if job_id is None:
+            return JsonResponse({'success': False, 'message': 'Could not queue the data, try again'}, status=503)
+        await logs(f"[Django] Data queued as job {job_id} for chat_id {chat_id}", type_e="info")
     finally:
         await release_connection(conn)
 